@@ -0,0 +1,281 @@
+"""
+API HTTP de matching e verificação de CNH, desacoplada da interface Streamlit.
+
+Cada processo worker carrega e aquece o próprio modelo uma única vez. Os jobs de verificação
+rodam no pool de OCR do worker que recebeu o envio; o estado fica num SQLite compartilhado
+(`--ocr-jobs`), então a consulta pode ser atendida por qualquer worker.
+
+Uso (a partir da raiz do projeto):
+    python -m api.server --port 8000 --workers 2
+
+Endpoints:
+    GET    /health                   estado do worker
+    POST   /prepare-text             {"profile": {...}} -> {"text": "..."}
+    POST   /vector                   {"texts": [...]} -> {"vectors": [[...], ...]}
+    POST   /match                    {"profiles": [{...}, ...], "k": 5, "include_vectors": false}
+    POST   /verify-cnh               {"pdf_base64": "...", "first_name": "...", "last_name": "..."} -> 202 {"job_id"}
+    GET    /verify-cnh/<job_id>      {"state": "...", "status": "..."} (404 para id desconhecido)
+    DELETE /verify-cnh/<job_id>      descarta o job
+    GET    /metrics                  histogramas por etapa no formato do Prometheus
+
+Com PROFILING_ENABLED=1, o cabeçalho `X-Profile: cprofile|sampling` perfila a requisição
+(arquivos em data/profiles/).
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id
+
+from utils.compute_scheduler import WORKLOAD_ENCODE, ComputeScheduler, apply_thread_budget, configured_budget
+from utils.embedding_cache import EmbeddingCache
+from utils.metrics import PROFILING_MODES, REGISTRY, RequestProfiler, profiling_enabled
+from utils.model_host import RemoteModel, connect_model_host
+from utils.ocr_service import (JOB_DONE, JOB_NOT_FOUND, OCRVerificationService, VerificationJobStore,
+                               configured_verification_cache)
+from utils.roster import RosterRegistry, configured_poll_seconds
+from utils.vectorizer import (EMBEDDING_BACKENDS, MODEL_NAME, MicroBatchEncoder, create_model, embedding_model_id,
+                              prepare_user_text)
+
+MAX_PROFILES_PER_REQUEST = 256
+MAX_PDF_BYTES = 10 * 1024 * 1024
+
+
+class MatchingState:
+    """Recursos de um worker: modelo aquecido, elenco versionado, cache e serviço de OCR."""
+
+    def __init__(self, players_path: str, cache_path: str | None, model_name: str = MODEL_NAME,
+                 backend: str = "torch", ocr_workers: int | None = None, ocr_jobs_path: str | None = None):
+        host = connect_model_host()
+        self.scheduler = None if host else ComputeScheduler(configured_budget())
+        if host:
+            self.model = RemoteModel(host)
+            backend = self.model.backend
+        else:
+            self.model = create_model(model_name, backend)
+        self.model.encode(["aquecimento"], convert_to_numpy=True, show_progress_bar=False)
+        # Vetores dos jogadores de outro backend/modelo impedem a subida (BackendMismatchError).
+        self.roster = RosterRegistry(players_path, configured_poll_seconds(), backend=backend,
+                                     model_name=getattr(self.model, "model_name", model_name)).start()
+        self.cache = EmbeddingCache(cache_path, embedding_model_id(model_name, backend)) if cache_path else None
+        self.ocr_service = OCRVerificationService(
+            max_workers=ocr_workers,
+            max_pending=int(os.getenv("OCR_MAX_PENDING", "0")) or None,
+            timeout_seconds=float(os.getenv("OCR_JOB_TIMEOUT_SECONDS", "60")),
+            cache=configured_verification_cache(),
+            job_store=VerificationJobStore(ocr_jobs_path) if ocr_jobs_path else None,
+        )
+        self.ocr_service.warm_up()
+        # Requisições concorrentes do worker são agrupadas em lotes por uma única thread de inferência.
+        self.encoder = MicroBatchEncoder(self.model, self.cache,
+                                         max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+                                         max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5")),
+                                         scheduler=self.scheduler)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    """Mede o tempo de cada etapa e o devolve nos cabeçalhos Server-Timing e X-Process-Time-Ms."""
+
+    def initialize(self, state: MatchingState):
+        self.state = state
+
+    def prepare(self):
+        self._start_time = time.perf_counter()
+        self._timings: dict[str, float] = {}
+        self._profiler = None
+        profile_mode = self.request.headers.get("X-Profile")
+        if profile_mode in PROFILING_MODES and profiling_enabled():
+            self._profiler = RequestProfiler(f"api-{type(self).__name__}", profile_mode).start()
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._timings[stage] = self._timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+    def finish(self, chunk=None):
+        elapsed_ms = (time.perf_counter() - getattr(self, "_start_time", time.perf_counter())) * 1000
+        timings = getattr(self, "_timings", {})
+        timings["total"] = elapsed_ms
+        self.set_header("X-Process-Time-Ms", f"{elapsed_ms:.2f}")
+        self.set_header("Server-Timing", ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items()))
+        if getattr(self, "_profiler", None) is not None:
+            self.set_header("X-Profile-Path", self._profiler.stop())
+            self._profiler = None
+        return super().finish(chunk)
+
+    def json_body(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError as e:
+            raise tornado.web.HTTPError(400, reason=f"JSON inválido: {e}")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="O corpo deve ser um objeto JSON.")
+        return body
+
+    def write_error(self, status_code: int, **kwargs):
+        self.finish({"error": self._reason})
+
+    async def encode(self, texts: list[str]) -> np.ndarray:
+        with self.timed("encode"):
+            vectors = await asyncio.gather(*(asyncio.wrap_future(self.state.encoder.submit(text)) for text in texts))
+        return np.vstack(vectors)
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        cache = self.state.ocr_service.cache
+        self.write({"status": "ok", "worker": task_id(), "players": len(self.state.roster.current()),
+                    "roster": self.state.roster.stats(), "encoder": self.state.encoder.stats(),
+                    "verification_cache": cache.stats() if cache is not None else None})
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(REGISTRY.render())
+
+
+class PrepareTextHandler(BaseHandler):
+    def post(self):
+        profile = self.json_body().get("profile") or {}
+        self.write({"text": prepare_user_text(profile)})
+
+
+class VectorHandler(BaseHandler):
+    async def post(self):
+        texts = self.json_body().get("texts") or []
+        if not isinstance(texts, list) or not all(isinstance(t, str) and t for t in texts):
+            raise tornado.web.HTTPError(400, reason="'texts' deve ser uma lista de strings não vazias.")
+        if len(texts) > MAX_PROFILES_PER_REQUEST:
+            raise tornado.web.HTTPError(413, reason=f"Máximo de {MAX_PROFILES_PER_REQUEST} textos por requisição.")
+        vectors = await self.encode(texts) if texts else np.empty((0, 0))
+        self.write({"vectors": vectors.tolist()})
+
+
+class MatchHandler(BaseHandler):
+    """Matching em lote: um `encode` e uma multiplicação de matrizes para todos os perfis da requisição."""
+
+    async def post(self):
+        body = self.json_body()
+        profiles = body.get("profiles") or []
+        k = body.get("k", 5)
+        if isinstance(k, bool) or not isinstance(k, int):
+            raise tornado.web.HTTPError(400, reason="'k' deve ser um inteiro.")
+        include_vectors = bool(body.get("include_vectors", False))
+        if not isinstance(profiles, list) or not all(isinstance(p, dict) for p in profiles):
+            raise tornado.web.HTTPError(400, reason="'profiles' deve ser uma lista de objetos.")
+        if len(profiles) > MAX_PROFILES_PER_REQUEST:
+            raise tornado.web.HTTPError(413, reason=f"Máximo de {MAX_PROFILES_PER_REQUEST} perfis por requisição.")
+
+        with self.timed("prepare"):
+            texts = [prepare_user_text(profile) for profile in profiles]
+        valid_rows = [row for row, text in enumerate(texts) if text]
+
+        roster = self.state.roster.current()
+        k = min(max(k, 1), max(len(roster), 1))
+        results = [{"text": text, "vector": None, "matches": [], "roster_version": roster.version} for text in texts]
+        if valid_rows:
+            vectors = await self.encode([texts[row] for row in valid_rows])
+            with self.timed("search"):
+                matches = roster.index.search_batch(vectors, k=k)
+            for position, row in enumerate(valid_rows):
+                results[row]["matches"] = matches[position]
+                if include_vectors:
+                    results[row]["vector"] = vectors[position].tolist()
+
+        self.write({"results": results})
+
+
+class VerifyHandler(BaseHandler):
+    def post(self):
+        body = self.json_body()
+        try:
+            pdf_bytes = base64.b64decode(body.get("pdf_base64") or "", validate=True)
+        except (binascii.Error, ValueError):
+            raise tornado.web.HTTPError(400, reason="'pdf_base64' inválido.")
+        if len(pdf_bytes) > MAX_PDF_BYTES:
+            raise tornado.web.HTTPError(413, reason="PDF maior que o limite permitido.")
+        first_name, last_name = body.get("first_name"), body.get("last_name")
+        if not all(isinstance(name, str) and name.strip() for name in (first_name, last_name)):
+            raise tornado.web.HTTPError(400, reason="'first_name' e 'last_name' são obrigatórios.")
+
+        with self.timed("submit"):
+            job_id = self.state.ocr_service.submit(pdf_bytes, first_name.strip(), last_name.strip())
+        if job_id is None:
+            self.set_header("Retry-After", "2")
+            raise tornado.web.HTTPError(503, reason="Fila de verificação cheia, tente novamente.")
+        self.set_status(202)
+        self.write({"job_id": job_id})
+
+
+class VerifyStatusHandler(BaseHandler):
+    def get(self, job_id: str):
+        state, result = self.state.ocr_service.status(job_id)
+        if state == JOB_NOT_FOUND:
+            raise tornado.web.HTTPError(404, reason="Job de verificação desconhecido ou já descartado.")
+        self.write({"state": state, "status": result[0] if state == JOB_DONE else None})
+
+    def delete(self, job_id: str):
+        self.state.ocr_service.discard(job_id)
+        self.set_status(204)
+
+
+def make_app(state: MatchingState) -> tornado.web.Application:
+    args = {"state": state}
+    return tornado.web.Application([
+        (r"/health", HealthHandler, args),
+        (r"/metrics", MetricsHandler, args),
+        (r"/prepare-text", PrepareTextHandler, args),
+        (r"/vector", VectorHandler, args),
+        (r"/match", MatchHandler, args),
+        (r"/verify-cnh", VerifyHandler, args),
+        (r"/verify-cnh/([0-9a-f]+)", VerifyStatusHandler, args),
+    ], max_body_size=MAX_PDF_BYTES * 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de matching Know Your Fan.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Processos worker (0 = um por CPU).")
+    parser.add_argument("--players", default="data/players_vectors.npy", help="Store de vetores dos jogadores.")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS,
+                        help="Backend de inferência do modelo.")
+    parser.add_argument("--embedding-cache", default="data/embedding_cache.sqlite3",
+                        help="Cache de embeddings compartilhado (vazio para desativar).")
+    parser.add_argument("--ocr-jobs", default="data/verification_jobs.sqlite3",
+                        help="Estado dos jobs de verificação, compartilhado pelos workers.")
+    args = parser.parse_args()
+
+    # OCR_WORKERS vale por worker da API; sem ela, os processos de OCR do perfil são divididos entre os workers.
+    workers = args.workers or os.cpu_count() or 1
+    ocr_workers = int(os.getenv("OCR_WORKERS", "0")) or max(1, configured_budget().ocr_processes // workers)
+
+    sockets = bind_sockets(args.port, address=args.host)
+    if args.workers != 1:
+        fork_processes(args.workers)
+
+    apply_thread_budget(WORKLOAD_ENCODE)
+    state = MatchingState(args.players, args.embedding_cache or None, backend=args.backend,
+                          ocr_workers=ocr_workers, ocr_jobs_path=args.ocr_jobs or None)
+    server = HTTPServer(make_app(state))
+    server.add_sockets(sockets)
+    print(f"API de matching ouvindo em {args.host}:{args.port} (worker {task_id() or 0}).")
+    IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark de recall vs. latência do índice IVF contra a busca exata (brute force).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.ann_recall --size 200000 --queries 200 --n-probe 1 4 8 16 32
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.ann_index import BruteForceIndex, IVFIndex
+
+
+def synthetic_vectors(size: int, dim: int, n_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Gera vetores agrupados em torno de centros aleatórios, imitando perfis de fãs parecidos."""
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size)
+    noise = rng.standard_normal((size, dim)).astype(np.float32) * 0.6
+    return centers[labels] + noise
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(size: int, dim: int, n_queries: int, k: int, n_lists: int, n_probes: list[int], seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    data = synthetic_vectors(size, dim, n_clusters=max(n_lists, 16), rng=rng)
+    queries = data[rng.choice(size, n_queries, replace=False)] + rng.standard_normal((n_queries, dim)).astype(
+        np.float32) * 0.1
+    ids = [str(i) for i in range(size)]
+
+    exact = BruteForceIndex(dim)
+    exact.add(ids, data)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(dim, n_lists=n_lists, background_training=False)
+    ivf.add(ids, data)
+    if not ivf.is_trained:
+        ivf.train()
+    build_seconds = time.perf_counter() - start
+
+    exact_latencies, ground_truth = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        ground_truth.append({i for i, _ in exact.search(query, k)})
+        exact_latencies.append(time.perf_counter() - t0)
+
+    report = {
+        "size": size, "dim": dim, "queries": n_queries, "k": k, "n_lists": ivf.n_lists,
+        "ivf_build_seconds": round(build_seconds, 3),
+        "exact": {"p50_ms": percentile_ms(exact_latencies, 50), "p95_ms": percentile_ms(exact_latencies, 95)},
+        "ivf": [],
+    }
+
+    for n_probe in n_probes:
+        latencies, hits = [], 0
+        for query, truth in zip(queries, ground_truth):
+            t0 = time.perf_counter()
+            found = ivf.search(query, k, n_probe=n_probe)
+            latencies.append(time.perf_counter() - t0)
+            hits += len(truth & {i for i, _ in found})
+        report["ivf"].append({
+            "n_probe": n_probe,
+            "recall_at_k": hits / (k * n_queries),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100_000, help="Quantidade de vetores indexados.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensão dos vetores.")
+    parser.add_argument("--queries", type=int, default=200, help="Quantidade de consultas.")
+    parser.add_argument("--k", type=int, default=10, help="Top-k usado no cálculo de recall.")
+    parser.add_argument("--n-lists", type=int, default=256, help="Número de listas do IVF.")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32], help="Valores de n_probe.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Salva o relatório em JSON neste caminho.")
+    args = parser.parse_args()
+
+    report = run(args.size, args.dim, args.queries, args.k, args.n_lists, args.n_probe, args.seed)
+
+    print(f"Busca exata: p50={report['exact']['p50_ms']:.2f} ms, p95={report['exact']['p95_ms']:.2f} ms")
+    for row in report["ivf"]:
+        print(f"IVF n_probe={row['n_probe']:>3}: recall@{args.k}={row['recall_at_k']:.3f}, "
+              f"p50={row['p50_ms']:.2f} ms, p95={row['p95_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Relatório salvo em '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compara dois relatórios JSON do `benchmarks.signup_pipeline` (ou do `benchmarks.compute_contention`)
+e aponta regressões de latência por etapa, de vazão (campos `*_per_second`) e de pico de RSS
+(`self` e `children`). Sai com código 1 se alguma delas piorou além do limite.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.compare base.json novo.json --metric p95_ms --threshold 10
+"""
+import argparse
+import json
+
+
+def load_report(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _row(name: str, base_value: float, new_value: float, threshold_percent: float,
+         higher_is_better: bool = False) -> dict:
+    change = (new_value - base_value) / base_value * 100 if base_value else 0.0
+    worse = -change if higher_is_better else change
+    return {"stage": name, "baseline": base_value, "candidate": new_value,
+            "change_percent": round(change, 1), "regression": worse > threshold_percent}
+
+
+def compare(baseline: dict, candidate: dict, metric: str, threshold_percent: float) -> list[dict]:
+    """Variação percentual de `metric` para as etapas presentes nos dois relatórios."""
+    rows = []
+    for stage, base_stats in baseline.get("stages", {}).items():
+        new_stats = candidate.get("stages", {}).get(stage)
+        if not new_stats or metric not in base_stats or metric not in new_stats:
+            continue
+        rows.append(_row(stage, base_stats[metric], new_stats[metric], threshold_percent))
+    return rows
+
+
+def compare_throughput(baseline: dict, candidate: dict, threshold_percent: float) -> list[dict]:
+    """Variação das vazões (`*_per_second`); uma queda acima do limite é regressão."""
+    rows = []
+    for key, base_value in baseline.get("throughput", {}).items():
+        new_value = candidate.get("throughput", {}).get(key)
+        if key.endswith("_per_second") and base_value and new_value is not None:
+            rows.append(_row(key, base_value, new_value, threshold_percent, higher_is_better=True))
+    return rows
+
+
+def _flatten(values: dict, prefix: str = "") -> dict[str, float]:
+    """{"after_load": {"self": 1.0}} -> {"after_load.self": 1.0}; aceita também {"self": 1.0}."""
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_peak_rss(baseline: dict, candidate: dict, threshold_percent: float) -> list[dict]:
+    """Variação do pico de RSS (processo e filhos, por momento da medição); crescer acima do limite é regressão."""
+    base_rss = _flatten(baseline.get("peak_rss_mb") or {})
+    new_rss = _flatten(candidate.get("peak_rss_mb") or {})
+    return [_row(f"rss {key}", base_value, new_rss[key], threshold_percent)
+            for key, base_value in base_rss.items() if base_value and key in new_rss]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", help="Relatório de referência.")
+    parser.add_argument("candidate", help="Relatório a comparar.")
+    parser.add_argument("--metric", default="p95_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    parser.add_argument("--threshold", type=float, default=10.0, help="Piora máxima aceita, em %%.")
+    args = parser.parse_args()
+
+    baseline, candidate = load_report(args.baseline), load_report(args.candidate)
+    if baseline.get("params") != candidate.get("params"):
+        print(f"AVISO: parâmetros diferentes entre as execuções:\n  {baseline.get('params')}\n  {candidate.get('params')}")
+
+    sections = [(f"Latência ({args.metric})", "ms", compare(baseline, candidate, args.metric, args.threshold)),
+                ("Vazão", "/s", compare_throughput(baseline, candidate, args.threshold)),
+                ("Pico de RSS", "MB", compare_peak_rss(baseline, candidate, args.threshold))]
+    regressions = []
+    for title, unit, rows in sections:
+        if rows:
+            print(f"{title}:")
+        for row in rows:
+            flag = "  <-- regressão" if row["regression"] else ""
+            print(f"{row['stage']:>32}: {row['baseline']:>10.2f} -> {row['candidate']:>10.2f} {unit} "
+                  f"({row['change_percent']:+.1f}%){flag}")
+        regressions += [row["stage"] for row in rows if row["regression"]]
+
+    if regressions:
+        print(f"Regressões acima de {args.threshold:.0f}%: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
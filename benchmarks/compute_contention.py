@@ -0,0 +1,161 @@
+"""
+Benchmark de contenção de CPU: encodes interativos chegando a uma taxa fixa enquanto OCRs de
+CNH e lotes de re-matching rodam no mesmo processo (como no host de modelos). Mede os
+percentis de latência de cada carga com e sem o escalonador (`utils.compute_scheduler`).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.compute_contention --mode unscheduled --output sem.json
+    python -m benchmarks.compute_contention --mode scheduled --output com.json
+    python -m benchmarks.compare sem.json com.json --metric p95_ms
+
+Cada modo roda num processo separado: o número de threads do torch é global no processo.
+"""
+import argparse
+import json
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from benchmarks.signup_pipeline import StageTimer, git_revision, peak_rss_mb
+from benchmarks.synthetic import synthetic_cnh_pdf, synthetic_profiles
+from utils.compute_scheduler import (WORKLOAD_BATCH, WORKLOAD_ENCODE, ComputeScheduler, ScheduledOCRReader,
+                                     apply_thread_budget, configured_budget)
+from utils.vectorizer import EMBEDDING_BACKENDS, MODEL_NAME, create_model, prepare_user_text
+
+MODES = ("scheduled", "unscheduled")
+
+
+def run(mode: str, duration_seconds: float, encode_rate: float, ocr_streams: int, batch_streams: int,
+        batch_size: int, backend: str, seed: int) -> dict:
+    budget = configured_budget()
+    scheduler = None
+    if mode == "scheduled":
+        apply_thread_budget(WORKLOAD_ENCODE, threads=max(budget.encode_threads, budget.ocr_threads))
+        scheduler = ComputeScheduler(budget)
+
+    def slot(workload: str):
+        return scheduler.slot(workload) if scheduler else nullcontext()
+
+    from utils.ocr import create_ocr_reader, verify_name_from_cnh_pdf
+
+    timer = StageTimer()
+    model = timer.measure("model_load", create_model, MODEL_NAME, backend)
+    reader = timer.measure("ocr_reader_load", create_ocr_reader) if ocr_streams else None
+    if reader is not None and scheduler is not None:
+        reader = ScheduledOCRReader(reader, scheduler)
+
+    profiles = synthetic_profiles(max(batch_size, 256), seed)
+    texts = [prepare_user_text(profile) for profile in profiles]
+    pdfs = [(synthetic_cnh_pdf(p["first_name"], p["last_name"], text_layer=False), p) for p in profiles[:8]]
+    model.encode(texts[:4], convert_to_numpy=True, show_progress_bar=False)
+
+    stop = threading.Event()
+    counts = {"interactive_encodes": 0, "ocr_documents": 0, "batch_texts": 0}
+    counts_lock = threading.Lock()
+
+    def count(name: str, amount: int = 1) -> None:
+        with counts_lock:
+            counts[name] += amount
+
+    def interactive(index: int, arrival: float) -> None:
+        with slot(WORKLOAD_ENCODE):
+            model.encode([texts[index % len(texts)]], convert_to_numpy=True, show_progress_bar=False)
+        # Latência a partir da chegada programada: inclui a espera por CPU e pelo escalonador.
+        timer.record("encode_interactive", time.perf_counter() - arrival)
+        count("interactive_encodes")
+
+    def ocr_stream(stream: int) -> None:
+        i = stream
+        while not stop.is_set():
+            pdf_bytes, profile = pdfs[i % len(pdfs)]
+            timer.measure("ocr_document", verify_name_from_cnh_pdf, pdf_bytes, profile["first_name"],
+                          profile["last_name"], reader=reader)
+            count("ocr_documents")
+            i += ocr_streams
+
+    def batch_stream(stream: int) -> None:
+        offset = stream * batch_size
+        while not stop.is_set():
+            batch = [texts[(offset + j) % len(texts)] for j in range(batch_size)]
+
+            def encode_batch():
+                with slot(WORKLOAD_BATCH):
+                    model.encode(batch, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+            timer.measure("batch_encode", encode_batch)
+            count("batch_texts", batch_size)
+            offset += batch_size
+
+    background = [threading.Thread(target=ocr_stream, args=(s,), daemon=True) for s in range(ocr_streams)]
+    background += [threading.Thread(target=batch_stream, args=(s,), daemon=True) for s in range(batch_streams)]
+    for thread in background:
+        thread.start()
+
+    start = time.perf_counter()
+    interval = 1.0 / encode_rate
+    with ThreadPoolExecutor(max_workers=16, thread_name_prefix="interactive") as executor:
+        index = 0
+        while time.perf_counter() - start < duration_seconds:
+            arrival = start + index * interval
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(interactive, index, arrival)
+            index += 1
+        stop.set()
+    for thread in background:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "benchmark": "compute_contention",
+        "mode": mode,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "budget": budget.__dict__ if scheduler else None,
+        "params": {"duration_seconds": duration_seconds, "encode_rate": encode_rate, "ocr_streams": ocr_streams,
+                   "batch_streams": batch_streams, "batch_size": batch_size, "backend": backend, "seed": seed},
+        "stages": timer.report(),
+        "throughput": {f"{name}_per_second": round(value / elapsed, 2) for name, value in counts.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="scheduled", choices=MODES,
+                        help="scheduled: orçamentos e fila por prioridade; unscheduled: threads padrão do torch.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duração da carga, em segundos.")
+    parser.add_argument("--encode-rate", type=float, default=10.0, help="Encodes interativos por segundo.")
+    parser.add_argument("--ocr-streams", type=int, default=2, help="OCRs de CNH em paralelo, sem pausa.")
+    parser.add_argument("--batch-streams", type=int, default=1, help="Lotes de re-matching em paralelo, sem pausa.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Salva o relatório em JSON neste caminho.")
+    args = parser.parse_args()
+
+    report = run(args.mode, args.duration, args.encode_rate, args.ocr_streams, args.batch_streams,
+                 args.batch_size, args.backend, args.seed)
+
+    print(f"Modo: {report['mode']} (orçamento: {report['budget']})")
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            print(f"{stage:>20}: n={stats['count']:>5}, p50={stats['p50_ms']:.2f} ms, p95={stats['p95_ms']:.2f} ms, "
+                  f"p99={stats['p99_ms']:.2f} ms")
+    print(f"Vazão: {report['throughput']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Relatório salvo em '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Benchmark ponta a ponta do cadastro: texto do perfil -> embedding -> match -> salvamento
+(fila local + FakeRTDB), além da verificação de CNH com PDFs sintéticos. Mede percentis
+de latência por etapa (o flush para o RTDB é medido por lote enviado, `flush_batch`), vazão
+e pico de memória (RSS do processo e dos filhos, separados), e salva o relatório em JSON para
+comparação entre execuções (`python -m benchmarks.compare`).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.signup_pipeline --profiles 500 --concurrency 8 --pdfs 10 --output base.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_cnh_pdf, synthetic_profiles
+from utils.fake_rtdb import FakeRTDB
+from utils.model_host import RemoteModel, connect_model_host
+from utils.player_store import open_player_store
+from utils.similarity_index import SimilarityIndex
+from utils.storage import save_user_profile_rtdb
+from utils.storage_backends import FirebaseStorage
+from utils.vectorizer import EMBEDDING_BACKENDS, MODEL_NAME, create_model, find_best_match, get_vector, prepare_user_text
+from utils.write_queue import StorageFlusher, WriteAheadQueue
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """
+    Pico de memória residente, em MB, do processo (`self`) e do maior filho já encerrado
+    (`children`). São picos de processos diferentes, em momentos diferentes: somá-los não dá
+    o pico da máquina.
+    """
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+
+def summarize(samples: list[float]) -> dict:
+    """Percentis de uma lista de durações em segundos, em milissegundos."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer:
+    """Acumula as durações de cada etapa, de várias threads."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def measure(self, stage: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.record(stage, time.perf_counter() - start)
+        return result
+
+    def report(self) -> dict:
+        return {stage: summarize(samples) for stage, samples in self.samples.items()}
+
+
+def run_signup(profiles: list[dict], model, players_index: SimilarityIndex, writer, concurrency: int,
+               timer: StageTimer) -> float:
+    """Executa o fluxo de cadastro para todos os perfis com `concurrency` threads. Retorna o tempo total."""
+
+    def signup(profile: dict) -> None:
+        session = dict(profile)
+        text = timer.measure("prepare_text", prepare_user_text, session)
+        vector = timer.measure("encode", get_vector, text, model)
+        if vector is not None:
+            session["match_result"] = timer.measure("match", find_best_match, vector, players_index)
+        timer.measure("save_enqueue", save_user_profile_rtdb, session, writer)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(signup, profiles))
+    return time.perf_counter() - start
+
+
+def run_ocr(profiles: list[dict], n_pdfs: int, timer: StageTimer) -> dict:
+    """
+    Verifica PDFs sintéticos alternando camada de texto, página só com imagem e um documento
+    de três páginas só com imagem em que a CNH está na última.
+    """
+    from utils.ocr import create_ocr_reader, verify_name_from_cnh_pdf
+
+    host = connect_model_host()
+    if host:
+        from utils.model_host import RemoteOCRReader
+        reader = RemoteOCRReader(host)
+    else:
+        reader = timer.measure("ocr_reader_load", create_ocr_reader)
+
+    verified = 0
+    for i in range(n_pdfs):
+        profile = profiles[i % len(profiles)]
+        variant = i % 3
+        if variant == 2:
+            pdf_bytes = synthetic_cnh_pdf(profile["first_name"], profile["last_name"], text_layer=False,
+                                          pages=3, cnh_page=2)
+            stage = "ocr_multi_page"
+        else:
+            pdf_bytes = synthetic_cnh_pdf(profile["first_name"], profile["last_name"], text_layer=variant == 0)
+            stage = "ocr_text_layer" if variant == 0 else "ocr_image_only"
+        status, _ = timer.measure(stage, verify_name_from_cnh_pdf, pdf_bytes, profile["first_name"],
+                                  profile["last_name"], reader=reader)
+        verified += status == "Verificado com Sucesso"
+    return {"pdfs": n_pdfs, "verified": verified}
+
+
+def run_flush(flusher: StorageFlusher, timer: StageTimer) -> int:
+    """Drena a fila lote a lote, medindo cada `update` enviado (etapa `flush_batch`). Retorna as escritas enviadas."""
+    flushed = 0
+    while True:
+        start = time.perf_counter()
+        sent = flusher.flush_once()
+        if not sent:
+            return flushed
+        timer.record("flush_batch", time.perf_counter() - start)
+        flushed += sent
+
+
+def run(n_profiles: int, concurrency: int, n_pdfs: int, players_path: str, backend: str,
+        rtdb_latency_ms: float, flush_batch_size: int, seed: int) -> dict:
+    timer = StageTimer()
+    profiles = synthetic_profiles(n_profiles, seed)
+    report = {
+        "benchmark": "signup_pipeline",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {"profiles": n_profiles, "concurrency": concurrency, "pdfs": n_pdfs, "backend": backend,
+                   "rtdb_latency_ms": rtdb_latency_ms, "flush_batch_size": flush_batch_size, "seed": seed},
+        "peak_rss_mb": {},
+    }
+
+    players_index = timer.measure("players_index_load", lambda: SimilarityIndex(open_player_store(players_path)))
+    host = connect_model_host()
+    model = timer.measure("model_load", lambda: RemoteModel(host) if host else create_model(MODEL_NAME, backend))
+    report["peak_rss_mb"]["after_load"] = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = FakeRTDB(latency_seconds=rtdb_latency_ms / 1000)
+        queue = WriteAheadQueue(os.path.join(tmp_dir, "write_queue.sqlite3"))
+        flusher = StorageFlusher(queue, FirebaseStorage(database.reference), batch_size=flush_batch_size)
+
+        signup_seconds = run_signup(profiles, model, players_index, (queue, flusher), concurrency, timer)
+        report["peak_rss_mb"]["after_signup"] = peak_rss_mb()
+
+        flushed = run_flush(flusher, timer)
+        stored = len(database.reference('users').get() or {})
+
+    throughput = {
+        "signup_profiles_per_second": round(n_profiles / signup_seconds, 2),
+        "signup_wall_seconds": round(signup_seconds, 3),
+        "flushed_writes": flushed,
+        "stored_profiles": stored,
+        "rtdb_write_calls": database.write_calls,
+    }
+    flush_seconds = sum(timer.samples.get("flush_batch", []))
+    throughput["flush_writes_per_second"] = round(flushed / flush_seconds, 2) if flush_seconds else None
+
+    if n_pdfs:
+        report["ocr"] = run_ocr(profiles, n_pdfs, timer)
+        report["peak_rss_mb"]["after_ocr"] = peak_rss_mb()
+
+    report["stages"] = timer.report()
+    report["throughput"] = throughput
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=200, help="Quantidade de perfis sintéticos.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Cadastros simultâneos (threads).")
+    parser.add_argument("--pdfs", type=int, default=6, help="PDFs de CNH sintéticos a verificar (0 desativa).")
+    parser.add_argument("--players", default="data/players_vectors.npy", help="Store de vetores dos jogadores.")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--rtdb-latency-ms", type=float, default=20.0, help="Latência simulada por escrita no RTDB.")
+    parser.add_argument("--flush-batch-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Salva o relatório em JSON neste caminho.")
+    args = parser.parse_args()
+
+    report = run(args.profiles, args.concurrency, args.pdfs, args.players, args.backend,
+                 args.rtdb_latency_ms, args.flush_batch_size, args.seed)
+
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            print(f"{stage:>20}: n={stats['count']:>5}, p50={stats['p50_ms']:.2f} ms, p95={stats['p95_ms']:.2f} ms, "
+                  f"p99={stats['p99_ms']:.2f} ms")
+    print(f"Vazão: {report['throughput']['signup_profiles_per_second']} cadastros/s, "
+          f"{report['throughput']['flush_writes_per_second']} escritas/s no flush.")
+    if "ocr" in report:
+        print(f"OCR: {report['ocr']['verified']}/{report['ocr']['pdfs']} PDFs verificados.")
+    print(f"Pico de RSS: {report['peak_rss_mb']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Relatório salvo em '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
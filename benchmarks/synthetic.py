@@ -0,0 +1,76 @@
+"""Entradas sintéticas para os benchmarks: perfis de fãs e PDFs parecidos com a CNH Digital."""
+import random
+
+GAME_ROLES = {
+    "Counter-Strike": ["Entry Fragger", "Suporte", "AWPer", "IGL", "Lurker"],
+    "League of Legends": ["Top", "Jungle", "Mid", "ADC", "Support"],
+}
+FIRST_NAMES = ["João", "Maria", "Pedro", "Ana", "Lucas", "Júlia", "Gabriel", "Beatriz", "Rafael", "Larissa"]
+LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Pereira", "Costa", "Rodrigues", "Almeida", "Nascimento"]
+CITIES = ["São Paulo", "Rio de Janeiro", "Belo Horizonte", "Curitiba", "Recife", "Porto Alegre"]
+PLAYSTYLE_PHRASES = [
+    "gosto de jogar agressivo e abrir espaço para o time",
+    "prefiro jogar com calma e esperar o erro do adversário",
+    "faço as calls e organizo a estratégia da equipe",
+    "sou o suporte que garante a utilidade e as trocas",
+    "jogo focado em mecânica e duelos individuais",
+    "adoro flanquear e pegar o inimigo desprevenido",
+    "controlo o mapa e a visão para o time",
+    "fico no farm e escalo para o fim do jogo",
+    "busco sempre o primeiro abate da rodada",
+    "me adapto ao que o time precisa em cada partida",
+]
+
+
+def synthetic_profiles(count: int, seed: int = 0) -> list[dict]:
+    """Gera perfis com os mesmos campos do `st.session_state` usados no matching e no salvamento."""
+    rng = random.Random(seed)
+    profiles = []
+    for i in range(count):
+        game = rng.choice(list(GAME_ROLES))
+        phrases = rng.sample(PLAYSTYLE_PHRASES, rng.randint(1, 4))
+        profiles.append({
+            "profile_id": f"bench-{seed}-{i:06d}",
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "city": rng.choice(CITIES),
+            "fav_game": game,
+            "role": rng.choice(GAME_ROLES[game]),
+            "nickname": f"fan{rng.randint(1, 99999)}",
+            "playstyle_desc": ". ".join(phrases).capitalize() + ".",
+            "watched_champs": rng.choice(["Sim", "Não"]),
+            "verification_status": "Pendente",
+        })
+    return profiles
+
+
+def synthetic_cnh_pdf(first_name: str, last_name: str, text_layer: bool = True, pages: int = 1,
+                      cnh_page: int = 0) -> bytes:
+    """
+    Renderiza com o PyMuPDF um PDF com o layout aproximado da CNH Digital (campo NOME na
+    parte de cima da página `cnh_page`). Com `text_layer=False`, a página vira imagem,
+    forçando o caminho de OCR.
+    """
+    import fitz
+
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page(width=595, height=842)
+        if page_number == cnh_page:
+            page.insert_text((40, 60), "REPÚBLICA FEDERATIVA DO BRASIL", fontsize=12)
+            page.insert_text((40, 80), "CARTEIRA NACIONAL DE HABILITAÇÃO", fontsize=12)
+            page.insert_text((40, 130), "NOME", fontsize=9)
+            page.insert_text((40, 150), f"{first_name} {last_name}".upper(), fontsize=16)
+            page.insert_text((40, 200), "DOC. IDENTIDADE / ÓRG. EMISSOR / UF", fontsize=9)
+            page.insert_text((40, 220), "12345678 SSP SP", fontsize=12)
+        else:
+            page.insert_text((40, 60), f"Página {page_number + 1} - informações complementares", fontsize=12)
+
+    if not text_layer:
+        image_only = fitz.open()
+        for page in document:
+            pix = page.get_pixmap(dpi=150)
+            new_page = image_only.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pix)
+        document = image_only
+    return document.tobytes()
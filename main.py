@@ -1,14 +1,19 @@
 import os
+import time
+import uuid
 
 import streamlit as st
-import torch
 from dotenv import load_dotenv
 
-from utils.ocr import verify_name_from_cnh_pdf
-from utils.storage import initialize_firebase, save_user_profile_rtdb
-from utils.vectorizer import load_model, prepare_user_text, get_vector, load_player_vectors, find_best_match
-
-torch.classes.__path__ = []
+from utils.api_client import load_matching_client, profile_from_session
+from utils.audience_analytics import load_audience_analytics
+from utils.metrics import PROFILING_MODES, profile_request, profiling_enabled, start_metrics_server
+from utils.ocr_service import JOB_DONE, JOB_NOT_FOUND, JOB_PENDING, JOB_RUNNING, JOB_TIMEOUT
+from utils.pipeline import load_match_pipeline
+from utils.session_resources import UploadTooLargeError, load_session_resources
+from utils.storage import initialize_firebase, save_user_profile_rtdb, update_user_profile_fields
+from utils.vectorizer import load_compute_scheduler, load_fan_index, add_fan_vector, find_similar_fans
+from utils.warmup import import_torch, load_warmup
 
 st.set_page_config(layout="centered")
 
@@ -16,15 +21,45 @@ load_dotenv()
 
 SERVICE_ACCOUNT_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
 DATABASE_URL = os.getenv("FIREBASE_DATABASE_URL")
-
-firebase_initialized = False
-if SERVICE_ACCOUNT_PATH and DATABASE_URL:
-    firebase_initialized = initialize_firebase(SERVICE_ACCOUNT_PATH, DATABASE_URL)
+VERIFICATION_POLL_SECONDS = 1.0
+
+
+@st.cache_resource
+def load_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Endpoint /metrics compartilhado pelas sessões do processo do Streamlit."""
+    return start_metrics_server(port, host)
+
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+if METRICS_PORT:
+    load_metrics_server(METRICS_PORT)
+# Com PROFILING_ENABLED=1, `?profile=cprofile` ou `?profile=sampling` na URL perfila o matching da sessão.
+PROFILE_MODE = st.query_params.get("profile") if profiling_enabled() else None
+if PROFILE_MODE not in PROFILING_MODES:
+    PROFILE_MODE = None
+
+# Limita as threads do torch antes do import em segundo plano (OCR e jobs batch têm orçamentos próprios).
+load_compute_scheduler()
+# Modelo e leitor OCR carregam em segundo plano; as etapas 1-3 não dependem deles.
+matching_client = load_matching_client()
+warmup = load_warmup({"torch": import_torch, "matching": matching_client.warm_up})
+match_pipeline = load_match_pipeline(matching_client)
+# PDF da CNH e vetor do perfil ficam fora do session_state, com limite de upload e remoção por inatividade.
+session_resources = load_session_resources()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")
+
+storage_initialized = False
+if STORAGE_BACKEND == "sqlite":
+    storage_initialized = True
+elif SERVICE_ACCOUNT_PATH and DATABASE_URL:
+    storage_initialized = initialize_firebase(SERVICE_ACCOUNT_PATH, DATABASE_URL)
 else:
     st.error("Erro, variáveis de ambiente não configuradas.")
 
 if 'form_stage' not in st.session_state:
     st.session_state.form_stage = 1
+    st.session_state.profile_id = uuid.uuid4().hex
     st.session_state.first_name = ""
     st.session_state.last_name = ""
     st.session_state.city = ""
@@ -35,13 +70,20 @@ if 'form_stage' not in st.session_state:
     st.session_state.watched_champs = None
     st.session_state.instagram_handle = ""
     st.session_state.cnh_uploaded = False
+    st.session_state.cnh_upload_key = 0
     st.session_state.stage1_complete = False
     st.session_state.stage2_complete = False
     st.session_state.stage3_complete = False
-    st.session_state.cnh_pdf_bytes = None
+    st.session_state.ocr_job_id = None
     st.session_state.match_result = None
+    st.session_state.match_computed = False
+    st.session_state.top_matches = []
+    st.session_state.roster_version = None
+    st.session_state.speculative_match = None
+    st.session_state.saved_verification_status = None
     st.session_state.verification_status = "Pendente"
     st.session_state.profile_saved = False
+session_resources.touch(st.session_state.profile_id)
 
 
 # --- Funções de Callback ---
@@ -49,20 +91,72 @@ def next_stage(current_stage):
     """Avança para a próxima etapa do formulário."""
     st.session_state[f'stage{current_stage}_complete'] = True
 
+    if current_stage == 2:
+        # Os campos do embedding já estão definidos: o matching roda enquanto o usuário faz o upload.
+        st.session_state.speculative_match = match_pipeline.speculate(
+            profile_from_session(st.session_state), k=5, previous=st.session_state.get('speculative_match'))
+
     if current_stage == 3:
-        if st.session_state.get('cnh_pdf_bytes') is not None:
+        if session_resources.get(st.session_state.profile_id, "cnh_pdf") is not None:
             st.session_state.cnh_uploaded = True
             st.session_state.verification_status = "Verificação Solicitada"
             print("Callback Etapa 3: PDF bytes encontrados, status definido para 'Verificação Solicitada'.")
+            poll_cnh_verification()
         else:
             st.session_state.cnh_uploaded = False
             st.session_state.verification_status = "Pulado"
             print("Callback Etapa 3: PDF bytes NÃO encontrados, status definido para 'Pulado'.")
-        st.session_state.cnh_upload = None
+        # Nova chave para o uploader: o Streamlit descarta o UploadedFile da chave anterior e seus bytes.
+        st.session_state.cnh_upload_key += 1
 
     st.session_state.form_stage += 1
 
 
+def poll_cnh_verification() -> bool:
+    """
+    Envia a CNH ao serviço de OCR (se ainda não enviada) e consulta o job.
+    Retorna True enquanto a verificação estiver pendente.
+    """
+    client = matching_client
+    job_id = st.session_state.get('ocr_job_id')
+
+    if job_id is None:
+        pdf_bytes_to_process = session_resources.get(st.session_state.profile_id, "cnh_pdf")
+        first_name_to_verify = st.session_state.get('first_name')
+        last_name_to_verify = st.session_state.get('last_name')
+
+        if not (pdf_bytes_to_process and first_name_to_verify and last_name_to_verify):
+            st.session_state.verification_status = "Erro: Dados Faltando para Verificação"
+            session_resources.release(st.session_state.profile_id, "cnh_pdf")
+            print("Etapa 4: Erro - Dados faltando para iniciar a verificação.")
+            return False
+
+        job_id = client.submit_verification(pdf_bytes_to_process, first_name_to_verify, last_name_to_verify)
+        if job_id is None:
+            print("Etapa 4: Fila de OCR cheia, nova tentativa no próximo ciclo.")
+            return True
+        st.session_state.ocr_job_id = job_id
+        session_resources.release(st.session_state.profile_id, "cnh_pdf")
+        print(f"Etapa 4: Verificação enviada ao serviço de OCR (job {job_id}), bytes do PDF descartados da sessão.")
+
+    job_state, verification_result_status = client.verification_status(job_id)
+    if job_state in (JOB_PENDING, JOB_RUNNING):
+        return True
+
+    client.discard_verification(job_id)
+    st.session_state.ocr_job_id = None
+    if job_state == JOB_DONE:
+        st.session_state.verification_status = verification_result_status
+    elif job_state == JOB_TIMEOUT:
+        st.session_state.verification_status = "Erro: Tempo Esgotado na Verificação"
+    elif job_state == JOB_NOT_FOUND:
+        st.session_state.verification_status = "Erro: Verificação Expirada, Envie o PDF Novamente"
+    else:
+        st.session_state.verification_status = "Erro ao Processar PDF"
+    print(f"Etapa 4: Verificação concluída com status: {st.session_state.verification_status}")
+    return False
+
+
 def get_radio_index(key, options):
     """Retorna o índice da opção selecionada ou None."""
     value = st.session_state.get(key)
@@ -173,26 +267,35 @@ if st.session_state.form_stage >= 3:
         pdf_uploaded_successfully = False
 
         if is_stage3_active:
+            cnh_upload_key = f"cnh_upload_{st.session_state.cnh_upload_key}"
             uploaded_file_widget = st.file_uploader(
                 "Faça upload do PDF da CNH Digital",
                 type=["pdf"],
-                key="cnh_upload",
+                key=cnh_upload_key,
                 help="Arraste e solte ou clique para procurar o PDF.",
                 disabled=False
             )
 
             if uploaded_file_widget is not None:
                 try:
-                    st.session_state.cnh_pdf_bytes = uploaded_file_widget.getvalue()
+                    # O servidor já recusou uploads acima de server.maxUploadSize; esta checagem só evita a cópia
+                    # para a sessão se MAX_UPLOAD_BYTES for menor.
+                    session_resources.check_upload(uploaded_file_widget.size)
+                    pdf_bytes = uploaded_file_widget.getvalue()
+                    session_resources.put(st.session_state.profile_id, "cnh_pdf", pdf_bytes)
                     pdf_uploaded_successfully = True
                     print(
-                        f"Etapa 3 (Rerun pós-upload): PDF '{uploaded_file_widget.name}' lido, {len(st.session_state.cnh_pdf_bytes)} bytes salvos em session_state.")
+                        f"Etapa 3 (Rerun pós-upload): PDF '{uploaded_file_widget.name}' lido, {len(pdf_bytes)} bytes guardados para a verificação.")
+                except UploadTooLargeError as e:
+                    st.error(f"{e} Envie o PDF original da CNH Digital.")
+                    session_resources.release(st.session_state.profile_id, "cnh_pdf")
+                    pdf_uploaded_successfully = False
                 except Exception as e:
                     st.error(f"Erro ao ler o arquivo PDF: {e}")
-                    st.session_state.cnh_pdf_bytes = None
+                    session_resources.release(st.session_state.profile_id, "cnh_pdf")
                     pdf_uploaded_successfully = False
-            elif 'cnh_upload' in st.session_state and st.session_state.cnh_upload is None:
-                st.session_state.cnh_pdf_bytes = None
+            elif st.session_state.get(cnh_upload_key, None) is None:
+                session_resources.release(st.session_state.profile_id, "cnh_pdf")
                 pdf_uploaded_successfully = False
 
             col_btn1, col_btn2 = st.columns(2)
@@ -210,7 +313,7 @@ if st.session_state.form_stage >= 3:
                 elif uploaded_file_widget is not None and not pdf_uploaded_successfully:
                     st.warning("Houve um problema ao ler o PDF. Tente recarregá-lo ou pule.")
                 else:
-                    if st.session_state.get('cnh_pdf_bytes') is None:
+                    if session_resources.get(st.session_state.profile_id, "cnh_pdf") is None:
                         st.info("Sem upload, a verificação será pulada.")
 
         else:
@@ -226,110 +329,120 @@ if st.session_state.form_stage >= 3:
             else:
                 st.info(f"Status da Verificação: {final_status}")
 
-st_model = load_model()
-
 # --- Etapa 4: Resultado ---
 if st.session_state.form_stage >= 4:
     st.divider()
     with st.container(border=True):
         st.subheader(f"🎉 Análise Concluída, {st.session_state.first_name}!")
 
+        if not warmup.is_ready():
+            with st.spinner("Carregando modelos de análise..."):
+                warmup.wait()
+
+        verification_pending = False
         if st.session_state.verification_status == "Verificação Solicitada":
-            with st.spinner("🔍 Processando verificação da CNH... (Isso pode levar alguns segundos)"):
-                print("Etapa 4: Iniciando verificação da CNH...")
-                pdf_bytes_to_process = st.session_state.get('cnh_pdf_bytes')
-                first_name_to_verify = st.session_state.get('first_name')
-                last_name_to_verify = st.session_state.get('last_name')
-
-                if pdf_bytes_to_process and first_name_to_verify and last_name_to_verify:
-                    verification_result_status, _ = verify_name_from_cnh_pdf(
-                        pdf_bytes_to_process,
-                        first_name_to_verify,
-                        last_name_to_verify
-                    )
-                    st.session_state.verification_status = verification_result_status
-                    print(f"Etapa 4: Verificação concluída com status: {verification_result_status}")
-                    st.session_state.cnh_pdf_bytes = None
-                    print("Etapa 4: Bytes do PDF descartados da memória.")
-                else:
-                    st.session_state.verification_status = "Erro: Dados Faltando para Verificação"
-                    st.session_state.cnh_pdf_bytes = None
-                    print("Etapa 4: Erro - Dados faltando para iniciar a verificação.")
-            st.rerun()
+            verification_pending = poll_cnh_verification()
+
+        final_verification_status = st.session_state.verification_status
+        if verification_pending:
+            st.info("⏳ Verificação da CNH em andamento... O resultado aparece aqui assim que terminar.")
+        elif final_verification_status == "Verificado com Sucesso":
+            st.success("Identidade Verificada com Sucesso")
+        elif final_verification_status == "Pulado":
+            st.warning("Verificação de identidade pulada.")
+        elif final_verification_status == "Falha na Verificação (Nome não encontrado)":
+            st.warning("Falha na Verificação: Nome não corresponde ao documento.")
+        elif final_verification_status.startswith("Erro"):
+            st.error(f"Erro durante a verificação: {final_verification_status.split(':', 1)[-1].strip()}")
+
+        st.divider()
+
+        st.write("--- Análise Semântica (Vetorização) ---")
+        if not st.session_state.get('match_computed'):
+            print("Calculando vetor e melhores correspondências...")
+            with profile_request("streamlit-match", PROFILE_MODE):
+                match_response = match_pipeline.resolve(st.session_state.get('speculative_match'),
+                                                        profile_from_session(st.session_state), k=5)
+            st.session_state.speculative_match = None
+            if match_response is None:
+                st.error("Serviço de matching indisponível, vetorização impossível.")
+            elif not match_response[0]["text"]:
+                st.warning("Não foi possível gerar o vetor: sem texto descritivo suficiente.")
+            elif match_response[0]["vector"] is None:
+                st.error("Falha ao gerar o vetor do perfil.")
+            else:
+                session_resources.put(st.session_state.profile_id, "user_vector", match_response[0]["vector"])
+                st.session_state.match_computed = True
+                st.session_state.top_matches = match_response[0]["matches"]
+                st.session_state.match_result = (match_response[0]["matches"] or [None])[0]
+                st.session_state.roster_version = match_response[0].get("roster_version")
+                st.success("Vetor do perfil gerado com sucesso!")
+        else:
+            st.success("Vetor do perfil já foi gerado.")
+            print("Usando resultado da correspondência cacheado na sessão.")
+
+        st.divider()
+        st.subheader("🔥 Seu Match na FURIA!")
+        match_result = st.session_state.get('match_result')
+        top_matches = st.session_state.get('top_matches', [])
+        if match_result:
+            player_name = match_result['name']
+            similarity_score = match_result['score']
+            player_description = match_result.get('text') or 'Descrição não disponível.'
+            st.success(f"Você mais se identifica com: **{player_name}**!")
+            score_emoji = "🔥🔥🔥" if similarity_score > 0.6 else ("🔥🔥" if similarity_score > 0.4 else "🔥")
+            st.metric(label="Nível de Similaridade", value=f"{similarity_score:.2%}", delta=score_emoji)
+            with st.expander(f"Ver descrição de {player_name}"):
+                st.write(player_description)
+            if len(top_matches) > 1:
+                with st.expander("Ver os 5 jogadores mais parecidos com você"):
+                    for position, match in enumerate(top_matches, start=1):
+                        st.write(f"{position}. **{match['name']}** ({match['game'] or '-'}, "
+                                 f"{match['role'] or '-'}): {match['score']:.2%}")
+        elif not st.session_state.get('match_computed'):
+            st.warning("O vetor do seu perfil não pôde ser gerado. A comparação não pode ser realizada.")
+        else:
+            st.error("Não foi possível encontrar um jogador correspondente.")
+
+        st.divider()
+        # O perfil é salvo sem esperar o OCR; quando a verificação termina, só o campo
+        # verification_status do mesmo registro (chave profile_id) é atualizado.
+        if (storage_initialized and st.session_state.get('profile_saved', False)
+                and st.session_state.saved_verification_status != st.session_state.verification_status):
+            if update_user_profile_fields(st.session_state.profile_id,
+                                          {"verification_status": st.session_state.verification_status}):
+                st.session_state.saved_verification_status = st.session_state.verification_status
+                print(f"Status da verificação atualizado no perfil salvo: {st.session_state.verification_status}")
+        if storage_initialized and not st.session_state.get('profile_saved', False):
+            print(f"Tentando salvar perfil ({STORAGE_BACKEND})...")
+            if save_user_profile_rtdb(st.session_state):
+                st.success("Seu perfil foi salvo com sucesso no nosso banco de dados!")
+                if verification_pending:
+                    st.caption("O resultado da verificação será adicionado ao perfil assim que terminar.")
+                st.session_state.profile_saved = True
+                st.session_state.saved_verification_status = st.session_state.verification_status
+                user_vector = session_resources.get(st.session_state.profile_id, "user_vector")
+                audience_analytics = load_audience_analytics()
+                if audience_analytics:
+                    audience_analytics.record(st.session_state, user_vector, fan_id=st.session_state.profile_id)
+                if user_vector is not None:
+                    fan_index = load_fan_index()
+                    similar_fans = find_similar_fans(user_vector, fan_index, k=5)
+                    add_fan_vector(fan_index, st.session_state.profile_id, user_vector)
+                    if similar_fans:
+                        st.caption(f"Encontramos {len(similar_fans)} fãs com estilo parecido com o seu "
+                                   f"(similaridade máxima: {similar_fans[0]['score']:.0%}).")
+                # Depois do índice de fãs, o vetor não é mais usado pela sessão.
+                session_resources.release(st.session_state.profile_id, "user_vector")
+            else:
+                print(f"Falha ao salvar perfil ({STORAGE_BACKEND}).")
+        elif st.session_state.get('profile_saved', False):
+            st.info("Seu perfil já foi salvo nesta sessão.")
+        elif not storage_initialized:
+            st.warning("Não foi possível salvar o perfil (armazenamento não inicializado). Verifique as configurações.")
 
+warmup.mark_first_render()
 
-        else:
-            final_verification_status = st.session_state.verification_status
-            if final_verification_status == "Verificado com Sucesso":
-                st.success("Identidade Verificada com Sucesso")
-            elif final_verification_status == "Pulado":
-                st.warning("Verificação de identidade pulada.")
-            elif final_verification_status == "Falha na Verificação (Nome não encontrado)":
-                st.warning("Falha na Verificação: Nome não corresponde ao documento.")
-            elif final_verification_status.startswith("Erro"):
-                st.error(f"Erro durante a verificação: {final_verification_status.split(':', 1)[-1].strip()}")
-
-            st.divider()
-
-            st.write("--- Análise Semântica (Vetorização) ---")
-            if 'user_vector' not in st.session_state:
-                st.session_state.user_vector = None
-            if st.session_state.user_vector is None and st_model:
-                user_text_to_vectorize = prepare_user_text(st.session_state)
-                if user_text_to_vectorize:
-                    vector = get_vector(user_text_to_vectorize, st_model)
-                    if vector is not None:
-                        st.session_state.user_vector = vector
-                        st.success("Vetor do perfil gerado com sucesso!")
-                    else:
-                        st.error("Falha ao gerar o vetor do perfil.")
-                else:
-                    st.warning("Não foi possível gerar o vetor: sem texto descritivo suficiente.")
-            elif st.session_state.user_vector is not None:
-                st.success("Vetor do perfil já foi gerado.")
-            elif not st_model:
-                st.error("Modelo de IA não carregado, vetorização impossível.")
-
-            st.divider()
-            st.subheader("🔥 Seu Match na FURIA!")
-            if st.session_state.user_vector is not None and st_model:
-                players_data = load_player_vectors('data/players_vectors.json')
-                if players_data:
-                    if st.session_state.get('match_result') is None:
-                        print("Calculando a melhor correspondência...")
-                        match_result = find_best_match(st.session_state.user_vector, players_data)
-                        st.session_state.match_result = match_result
-                    else:
-                        match_result = st.session_state.match_result
-                        print("Usando resultado da correspondência cacheado na sessão.")
-
-                    if match_result:
-                        player_name = match_result['name']
-                        similarity_score = match_result['score']
-                        player_description = match_result['text']
-                        st.success(f"Você mais se identifica com: **{player_name}**!")
-                        score_emoji = "🔥🔥🔥" if similarity_score > 0.6 else ("🔥🔥" if similarity_score > 0.4 else "🔥")
-                        st.metric(label="Nível de Similaridade", value=f"{similarity_score:.2%}", delta=score_emoji)
-                        with st.expander(f"Ver descrição de {player_name}"):
-                            st.write(player_description)
-                    else:
-                        st.error("Não foi possível encontrar um jogador correspondente.")
-                else:
-                    st.error("Não foi possível carregar dados dos jogadores para comparação.")
-            elif st.session_state.user_vector is None and st_model:
-                st.warning("O vetor do seu perfil não pôde ser gerado. A comparação não pode ser realizada.")
-            elif not st_model:
-                st.error("O modelo de IA não pôde ser carregado. A comparação não pode ser realizada.")
-
-            st.divider()
-            if firebase_initialized and not st.session_state.get('profile_saved', False):
-                print("Tentando salvar perfil no Firebase RTDB...")
-                if save_user_profile_rtdb(st.session_state):
-                    st.success("Seu perfil foi salvo com sucesso no nosso banco de dados!")
-                    st.session_state.profile_saved = True
-                else:
-                    print("Falha ao salvar perfil no Firebase RTDB.")
-            elif st.session_state.get('profile_saved', False):
-                st.info("Seu perfil já foi salvo nesta sessão.")
-            elif not firebase_initialized:
-                st.warning("Não foi possível salvar o perfil (Firebase não inicializado). Verifique as configurações.")
+if st.session_state.form_stage >= 4 and verification_pending:
+    time.sleep(VERIFICATION_POLL_SECONDS)
+    st.rerun()
@@ -0,0 +1,51 @@
+import streamlit as st
+
+from utils.audience_analytics import DIMENSIONS, SCORE_BINS, load_audience_analytics
+
+st.set_page_config(layout="wide")
+st.title("📊 Audiência - Know Your Fan")
+
+DIMENSION_LABELS = {"fav_game": "Jogo", "role": "Role", "city": "Cidade", "match_player_name": "Jogador do match"}
+ALL = "Todos"
+
+analytics = load_audience_analytics()
+if not analytics:
+    st.error("Agregados da audiência indisponíveis.")
+    st.stop()
+
+snapshot = analytics.snapshot()
+st.metric("Fãs cadastrados", snapshot["total"])
+
+st.subheader("Quantos fãs...")
+columns = st.columns(len(DIMENSIONS))
+filters = {}
+for column, field in zip(columns, DIMENSIONS):
+    options = [ALL] + list(snapshot["counts"][field])
+    choice = column.selectbox(DIMENSION_LABELS[field], options, key=f"filter_{field}")
+    filters[field] = None if choice == ALL else choice
+st.metric("Fãs com esses filtros", analytics.count(**filters))
+
+st.subheader("Distribuições")
+for field in DIMENSIONS:
+    counts = snapshot["counts"][field]
+    if counts:
+        st.caption(DIMENSION_LABELS[field])
+        st.bar_chart(dict(list(counts.items())[:15]))
+
+st.subheader("Scores de similaridade")
+player = filters["match_player_name"]
+histogram = snapshot["player_score_histograms"].get(player) if player else snapshot["score_histogram"]
+if histogram and any(histogram):
+    st.bar_chart({f"{index / SCORE_BINS:.2f}": count for index, count in enumerate(histogram)})
+else:
+    st.info("Nenhum score registrado para a seleção.")
+
+st.subheader("Segmentos de fãs (clusters dos perfis)")
+clusters = [cluster for cluster in snapshot["clusters"] if cluster["size"]]
+if clusters:
+    st.dataframe([{"Fãs": cluster["size"], **{DIMENSION_LABELS[field]: ", ".join(cluster[field]) for field in DIMENSIONS}}
+                  for cluster in sorted(clusters, key=lambda cluster: -cluster["size"])])
+else:
+    st.info("Os clusters aparecem depois do primeiro lote de perfis com vetor.")
+if snapshot["pending_vectors"]:
+    st.caption(f"{snapshot['pending_vectors']} perfis aguardando o próximo lote do k-means.")
@@ -0,0 +1,99 @@
+import hashlib
+
+import numpy as np
+
+from utils.ann_index import BruteForceIndex, IVFIndex, VectorLog, load_ann_index, open_persistent_index
+from utils.build_fan_index import build_fan_index
+from utils.storage_backends import SQLiteStorage
+
+DIM = 16
+
+
+def vector_for(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+
+
+class StubModel:
+    def encode(self, texts, **kwargs):
+        return np.vstack([vector_for(text) for text in texts])
+
+
+def profile(key: str) -> dict:
+    return {"profile_id": key, "fav_game": "CS2", "role": "Fan", "playstyle_desc": f"estilo {key}"}
+
+
+def save_profile(storage: SQLiteStorage, log: VectorLog, key: str) -> np.ndarray:
+    """Como o app: vetor no log de inserções e perfil no armazenamento."""
+    from utils.vectorizer import prepare_user_text
+
+    vector = StubModel().encode([prepare_user_text(profile(key))])[0]
+    log.append(key, vector)
+    storage.write("users", {key: profile(key)})
+    return vector
+
+
+def test_brute_force_add_replaces_existing_id():
+    index = BruteForceIndex(DIM)
+    index.add(["a", "b"], np.vstack([vector_for("a"), vector_for("b")]))
+    index.add(["a", "a"], np.vstack([vector_for("x"), vector_for("b")]))
+
+    assert index.ids == ["a", "b"]
+    assert [item_id for item_id, _ in index.search(vector_for("b"), k=5)] == ["a", "b"]
+
+
+def test_trained_ivf_add_moves_replaced_id_between_lists():
+    index = IVFIndex(DIM, n_lists=4, n_probe=4, background_training=False)
+    ids = [f"f{i}" for i in range(64)]
+    index.add(ids, np.vstack([vector_for(item_id) for item_id in ids]))
+    index.train()
+    index.add(["f0"], vector_for("novo").reshape(1, -1))
+
+    assert len(index) == 64
+    assert sum(int((rows == 0).sum()) for rows in index._lists) == 1
+    assert index.search(vector_for("novo"), k=1)[0][0] == "f0"
+
+
+def test_restore_drops_duplicated_ids_from_old_snapshots(tmp_path):
+    index = BruteForceIndex(DIM)
+    index.add(["a", "b"], np.vstack([vector_for("a"), vector_for("b")]))
+    # Snapshots gravados antes da inserção idempotente podiam repetir um id.
+    index._append_vectors(vector_for("c").reshape(1, -1) / np.linalg.norm(vector_for("c")))
+    index._ids.append("a")
+    index.save(str(tmp_path / "index.npz"))
+
+    restored = load_ann_index(str(tmp_path / "index.npz"))
+    assert sorted(restored.ids) == ["a", "b"]
+    assert restored.search(vector_for("c"), k=1)[0][0] == "a"
+
+
+def test_profile_saved_during_build_is_indexed_once(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "users.sqlite3"))
+    log = VectorLog(str(tmp_path / "log.sqlite3"))
+    for key in ("a", "b"):
+        save_profile(storage, log, key)
+    log_seq = log.last_seq()
+    # Salvo depois de lido o log_seq e antes da leitura do armazenamento: entra pelos dois caminhos.
+    late = save_profile(storage, log, "late")
+
+    index = build_fan_index(storage, StubModel(), log, log_seq, kind="brute", dim=DIM)
+    snapshot_path = str(tmp_path / "fans.npz")
+    index.save(snapshot_path, metadata={"log_seq": log_seq})
+
+    reopened = open_persistent_index(snapshot_path, str(tmp_path / "log.sqlite3"), kind="brute", dim=DIM)
+    assert sorted(reopened.ids) == ["a", "b", "late"]
+    assert [item_id for item_id, _ in reopened.search(late, k=3)].count("late") == 1
+
+
+def test_logged_vector_missing_from_storage_is_in_snapshot(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "users.sqlite3"))
+    log = VectorLog(str(tmp_path / "log.sqlite3"))
+    save_profile(storage, log, "a")
+    # Vetor no log, perfil ainda na fila de escritas (não chegou ao armazenamento).
+    queued = vector_for("queued")
+    log.append("queued", queued)
+
+    index = build_fan_index(storage, StubModel(), log, log.last_seq(), kind="brute", dim=DIM)
+
+    assert sorted(index.ids) == ["a", "queued"]
+    assert index.search(queued, k=1)[0][0] == "queued"
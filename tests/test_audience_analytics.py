@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from utils.audience_analytics import SCORE_BINS, AudienceAggregates, dimension_key, score_bin
+
+
+@pytest.fixture
+def aggregates(tmp_path):
+    return AudienceAggregates(str(tmp_path / "audience.sqlite3"), n_clusters=2, batch_size=4)
+
+
+def fan(player: str = "FalleN", city: str = "São Paulo", game: str = "CS2", score: float = 0.8) -> dict:
+    return {"fav_game": game, "role": "Fan", "city": city, "match_player_name": player, "match_score": score}
+
+
+def test_city_key_ignores_accents_case_and_spaces():
+    assert dimension_key("city", "  São   PAULO ") == dimension_key("city", "sao paulo") == "sao paulo"
+    assert dimension_key("city", "   ") is None
+    assert dimension_key("fav_game", " CS2 ") == "CS2"
+
+
+def test_record_many_counts_dimensions_and_histograms(aggregates):
+    aggregates.record_many([(fan(city="São Paulo"), None, "a"), (fan(city="sao paulo", player="KSCERATO"), None, "b"),
+                            (fan(city="Recife", game="LoL", score=0.31), None, "c")])
+
+    snapshot = aggregates.snapshot()
+    assert snapshot["total"] == 3
+    # O rótulo exibido é o da primeira grafia vista.
+    assert snapshot["counts"]["city"] == {"São Paulo": 2, "Recife": 1}
+    assert snapshot["counts"]["fav_game"] == {"CS2": 2, "LoL": 1}
+    assert sum(snapshot["score_histogram"]) == 3
+    assert snapshot["score_histogram"][score_bin(0.31)] == 1
+    fallen = snapshot["player_score_histograms"]["FalleN"]
+    assert len(fallen) == SCORE_BINS
+    assert {i: n for i, n in enumerate(fallen) if n} == {score_bin(0.8): 1, score_bin(0.31): 1}
+    assert aggregates.count(city="SAO PAULO", match_player_name="FalleN") == 1
+    assert aggregates.count(fav_game="CS2") == 2
+    assert aggregates.count() == 3
+
+
+def test_profile_without_match_counts_only_in_total_histogram(aggregates):
+    aggregates.record({"fav_game": "CS2", "match_result": {"name": "yuurih", "score": 0.7}})
+    aggregates.record({"fav_game": "CS2"})
+
+    snapshot = aggregates.snapshot()
+    assert snapshot["counts"]["match_player_name"] == {"yuurih": 1}
+    assert sum(snapshot["score_histogram"]) == 1
+    assert aggregates.count(fav_game="CS2") == 2
+
+
+def test_vectors_are_clustered_once_the_batch_fills(aggregates):
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        aggregates.record(fan(), rng.normal(size=8), fan_id=f"f{i}")
+    assert aggregates.snapshot()["pending_vectors"] == 3
+    assert sum(cluster["size"] for cluster in aggregates.snapshot()["clusters"]) == 0
+
+    aggregates.record(fan(), rng.normal(size=8), fan_id="f3")
+    snapshot = aggregates.snapshot()
+    assert snapshot["pending_vectors"] == 0
+    assert sum(cluster["size"] for cluster in snapshot["clusters"]) == 4
+    assert all(cluster["match_player_name"] == ["FalleN"] for cluster in snapshot["clusters"] if cluster["size"])
+
+
+def test_rematch_moves_counts_histograms_and_segments(aggregates):
+    rng = np.random.default_rng(1)
+    for i in range(4):
+        aggregates.record(fan(), rng.normal(size=8), fan_id=f"f{i}")
+
+    aggregates.rematch([("f0", fan(), {"match_player_name": "KSCERATO", "match_score": 0.4})])
+
+    snapshot = aggregates.snapshot()
+    assert snapshot["total"] == 4
+    assert snapshot["counts"]["match_player_name"] == {"FalleN": 3, "KSCERATO": 1}
+    assert snapshot["player_score_histograms"]["KSCERATO"][score_bin(0.4)] == 1
+    assert snapshot["score_histogram"][score_bin(0.8)] == 3
+    segment_players = [player for cluster in snapshot["clusters"] for player in cluster["match_player_name"]]
+    assert sorted(segment_players).count("KSCERATO") == 1
+
+
+def test_rematch_updates_fan_still_waiting_for_kmeans(aggregates):
+    rng = np.random.default_rng(2)
+    aggregates.record(fan(), rng.normal(size=8), fan_id="pending")
+    aggregates.rematch([("pending", fan(), {"match_player_name": "KSCERATO", "match_score": 0.4})])
+    for i in range(3):
+        aggregates.record(fan(player="yuurih"), rng.normal(size=8), fan_id=f"f{i}")
+
+    players = {player for cluster in aggregates.snapshot()["clusters"] for player in cluster["match_player_name"]}
+    assert players == {"KSCERATO", "yuurih"}
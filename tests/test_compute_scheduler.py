@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from utils.compute_scheduler import (DEPLOYMENT_PROFILES, WORKLOAD_BATCH, WORKLOAD_ENCODE, WORKLOAD_OCR,
+                                     ComputeBudget, ComputeScheduler, configured_budget)
+
+
+def budget(cpu_slots: int, encode_threads: int) -> ComputeBudget:
+    return ComputeBudget(cpu_slots=cpu_slots, encode_threads=encode_threads, ocr_threads=1, batch_threads=1,
+                         ocr_processes=1, ocr_page_workers=1)
+
+
+def wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condição não atingida a tempo"
+        time.sleep(0.005)
+
+
+def enqueue(scheduler: ComputeScheduler, workload: str, threads: int | None = None) -> threading.Event:
+    """Pede vaga numa thread e só retorna depois que o pedido entrou na fila."""
+    acquired = threading.Event()
+    waiting = scheduler.stats()["waiting"]
+
+    def run():
+        scheduler.acquire(workload, threads)
+        acquired.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    wait_for(lambda: scheduler.stats()["waiting"] == waiting + 1)
+    return acquired
+
+
+def test_waiters_are_served_by_priority_not_arrival():
+    scheduler = ComputeScheduler(budget(cpu_slots=2, encode_threads=1))
+    held = scheduler.acquire(WORKLOAD_ENCODE, threads=2)
+    batch = enqueue(scheduler, WORKLOAD_BATCH)
+    ocr = enqueue(scheduler, WORKLOAD_OCR)
+    encode = enqueue(scheduler, WORKLOAD_ENCODE)
+
+    scheduler.release(held)
+    assert encode.wait(2)
+    assert scheduler.stats()["waiting"] == 2
+
+    scheduler.release(1)
+    assert ocr.wait(2)
+    assert not batch.is_set()
+
+    scheduler.release(1)
+    assert batch.wait(2)
+    assert scheduler.stats() == {"capacity": 2, "in_use": 1, "waiting": 0}
+
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = ComputeScheduler(budget(cpu_slots=2, encode_threads=1))
+    held = scheduler.acquire(WORKLOAD_ENCODE, threads=2)
+    first = enqueue(scheduler, WORKLOAD_BATCH)
+    second = enqueue(scheduler, WORKLOAD_BATCH)
+
+    scheduler.release(held)
+    assert first.wait(2)
+    assert not second.is_set()
+
+
+def test_lower_priority_does_not_overtake_waiting_request():
+    scheduler = ComputeScheduler(budget(cpu_slots=4, encode_threads=1))
+    scheduler.acquire(WORKLOAD_OCR, threads=2)
+    ocr = enqueue(scheduler, WORKLOAD_OCR, threads=2)  # 2 + 2 passa das 3 vagas fora do encode
+
+    # Um lote de 1 thread caberia, mas há um OCR esperando na frente.
+    batch = enqueue(scheduler, WORKLOAD_BATCH)
+    assert not ocr.is_set() and not batch.is_set()
+
+
+def test_encode_threads_stay_reserved():
+    scheduler = ComputeScheduler(budget(cpu_slots=4, encode_threads=2))
+    assert scheduler.acquire(WORKLOAD_OCR) == 1
+    assert scheduler.acquire(WORKLOAD_BATCH) == 1
+
+    batch = enqueue(scheduler, WORKLOAD_BATCH)
+    assert scheduler.acquire(WORKLOAD_ENCODE) == 2
+    assert scheduler.stats() == {"capacity": 4, "in_use": 4, "waiting": 1}
+    assert not batch.is_set()
+
+    scheduler.release(2)
+    # As vagas do encode voltam, mas OCR e batch continuam limitados a cpu_slots - encode_threads.
+    assert scheduler.stats()["waiting"] == 1
+    scheduler.release(1)
+    assert batch.wait(2)
+
+
+def test_slot_releases_threads_on_error():
+    scheduler = ComputeScheduler(budget(cpu_slots=2, encode_threads=1))
+    with pytest.raises(RuntimeError):
+        with scheduler.slot(WORKLOAD_OCR):
+            raise RuntimeError("falha no OCR")
+    assert scheduler.stats()["in_use"] == 0
+
+
+@pytest.mark.parametrize("name", sorted(DEPLOYMENT_PROFILES))
+def test_profiles_keep_ocr_out_of_encode_threads(name):
+    profile = DEPLOYMENT_PROFILES[name]
+    assert profile.ocr_total_threads <= profile.cpu_slots - profile.encode_threads
+
+
+def test_configured_budget_applies_profile_and_overrides(monkeypatch, capsys):
+    monkeypatch.setenv("COMPUTE_PROFILE", "medium")
+    monkeypatch.setenv("COMPUTE_OCR_THREADS", "3")
+    configured = configured_budget()
+
+    assert configured.cpu_slots == 4
+    assert configured.threads_for(WORKLOAD_OCR) == 3
+    assert "AVISO" in capsys.readouterr().out
+
+
+def test_configured_budget_auto_and_unknown_profile(monkeypatch):
+    monkeypatch.setenv("COMPUTE_PROFILE", "auto")
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+    assert configured_budget() == DEPLOYMENT_PROFILES["large"]
+
+    monkeypatch.setenv("COMPUTE_PROFILE", "huge")
+    with pytest.raises(ValueError):
+        configured_budget()
@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.vectorizer import MicroBatchEncoder
+
+
+class StubModel:
+    """Vetor (código do primeiro caractere, tamanho do texto); o lote com "hold" espera `release`."""
+
+    def __init__(self, fail_on: str | None = None):
+        self.batches: list[list[str]] = []
+        self.fail_on = fail_on
+        self.holding = threading.Event()
+        self.release = threading.Event()
+
+    def encode(self, texts, **kwargs):
+        self.batches.append(list(texts))
+        if "hold" in texts:
+            self.holding.set()
+            self.release.wait(2)
+        if self.fail_on in texts:
+            raise ValueError("Falha simulada no modelo.")
+        return np.array([[ord(text[0]), len(text)] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def model():
+    return StubModel()
+
+
+@pytest.fixture
+def encoder(model):
+    encoder = MicroBatchEncoder(model, max_batch_size=8, max_wait_ms=1.0)
+    yield encoder
+    model.release.set()
+    encoder.close()
+
+
+def hold_worker(encoder: MicroBatchEncoder, model: StubModel):
+    """Ocupa a thread do encoder para que os próximos textos se acumulem na fila."""
+    future = encoder.submit("hold")
+    assert model.holding.wait(2)
+    return future
+
+
+def test_concurrent_texts_are_coalesced_into_one_batch(encoder, model):
+    held = hold_worker(encoder, model)
+    futures = [encoder.submit(text) for text in ("a", "bb", "ccc")]
+    model.release.set()
+
+    held.result(2)
+    [future.result(2) for future in futures]
+    assert model.batches == [["hold"], ["a", "bb", "ccc"]]
+    assert encoder.stats()["batches"] == 2
+
+
+def test_each_future_gets_its_own_vector(encoder, model):
+    held = hold_worker(encoder, model)
+    futures = {text: encoder.submit(text) for text in ("x", "yy", "zzz")}
+    model.release.set()
+
+    held.result(2)
+    for text, future in futures.items():
+        np.testing.assert_array_equal(future.result(2), [ord(text[0]), len(text)])
+
+
+def test_batch_size_is_capped(model):
+    encoder = MicroBatchEncoder(model, max_batch_size=2, max_wait_ms=1.0)
+    held = hold_worker(encoder, model)
+    futures = [encoder.submit(text) for text in ("a", "b", "c")]
+    model.release.set()
+
+    held.result(2)
+    [future.result(2) for future in futures]
+    encoder.close()
+    assert model.batches[1:] == [["a", "b"], ["c"]]
+
+
+def test_model_error_reaches_every_caller_in_the_batch():
+    model = StubModel(fail_on="boom")
+    encoder = MicroBatchEncoder(model, max_batch_size=8, max_wait_ms=1.0)
+    held = hold_worker(encoder, model)
+    futures = [encoder.submit(text) for text in ("a", "boom", "c")]
+    model.release.set()
+
+    held.result(2)
+    for future in futures:
+        with pytest.raises(ValueError, match="Falha simulada"):
+            future.result(2)
+    # O encoder continua atendendo depois da falha.
+    np.testing.assert_array_equal(encoder.encode("ok", timeout=2), [ord("o"), 2])
+    encoder.close()
+
+
+def test_cancelled_future_is_skipped(encoder, model):
+    held = hold_worker(encoder, model)
+    cancelled = encoder.submit("a")
+    kept = encoder.submit("b")
+    assert cancelled.cancel()
+    model.release.set()
+
+    held.result(2)
+    kept.result(2)
+    assert model.batches[1] == ["b"]
+
+
+def test_close_drains_queued_texts_and_rejects_new_ones(model):
+    encoder = MicroBatchEncoder(model, max_batch_size=8, max_wait_ms=1.0)
+    hold_worker(encoder, model)
+    queued = encoder.submit("a")
+    threading.Timer(0.05, model.release.set).start()
+
+    encoder.close()
+    assert not encoder._thread.is_alive()
+    np.testing.assert_array_equal(queued.result(0), [ord("a"), 1])
+    with pytest.raises(RuntimeError):
+        encoder.submit("b")
+    encoder.close()
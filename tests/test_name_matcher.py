@@ -0,0 +1,59 @@
+from utils.name_matcher import MIN_CONFIDENCE, candidate_tokens, match_name, match_name_tokens
+
+CNH_TEXT = "REPUBLICA FEDERATIVA DO BRASIL CARTEIRA NACIONAL DE HABILITACAO NOME {name} DOC IDENTIDADE 1234567"
+
+
+def cnh(name: str) -> str:
+    return CNH_TEXT.format(name=name)
+
+
+def test_accents_and_case_are_ignored():
+    result = match_name(cnh("JOAO DA SILVA CONCEICAO"), "João", "Conceição")
+    assert result.matched
+    assert result.confidence == 1.0
+
+
+def test_ocr_digit_swaps_are_fixed():
+    result = match_name(cnh("J0AO PEDR0 5OUZA"), "João Pedro", "Souza")
+    assert result.matched
+    assert result.confidence == 1.0
+
+
+def test_ocr_split_token_is_joined():
+    assert match_name(cnh("JO AO SOUZA"), "João", "Souza").matched
+
+
+def test_particles_are_not_required():
+    assert match_name(cnh("ANA LIMA"), "Ana", "da Lima").matched
+    assert match_name(cnh("ANA DOS SANTOS LIMA"), "Ana", "Lima").matched
+
+
+def test_small_surname_error_is_tolerated():
+    result = match_name(cnh("MARIA SOUSA"), "Maria", "Souza")
+    assert result.matched
+    assert MIN_CONFIDENCE <= result.confidence < 1.0
+    assert result.token_distances == {"maria": 0, "souza": 1}
+
+
+def test_near_miss_first_name_does_not_match():
+    result = match_name(cnh("MARTA SOUZA"), "Maria", "Souza")
+    assert not result.matched
+    assert result.token_distances["maria"] is None
+
+
+def test_short_surname_must_be_exact():
+    assert not match_name(cnh("ANA LIMO"), "Ana", "Lim").matched
+
+
+def test_missing_surname_does_not_match():
+    assert not match_name(cnh("MARIA SOUZA"), "Maria", "Oliveira").matched
+
+
+def test_empty_name_does_not_match():
+    assert not match_name(cnh("MARIA SOUZA"), "", "Souza").matched
+    assert not match_name(cnh("MARIA SOUZA"), "da", "Souza").matched
+
+
+def test_precomputed_tokens_give_the_same_result():
+    text = cnh("MARIA SOUSA")
+    assert match_name_tokens(candidate_tokens(text), "Maria", "Souza") == match_name(text, "Maria", "Souza")
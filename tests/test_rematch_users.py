@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from utils.audience_analytics import AudienceAggregates
+from utils.player_store import PlayerStore
+from utils.rematch_users import rematch_users
+from utils.storage_backends import SQLiteStorage
+
+PLAYERS = ["Mid", "Support"]
+
+
+class StubModel:
+    """Perfis que falam em 'mid' ficam com o primeiro jogador; os demais, com o segundo."""
+
+    def encode(self, texts, **kwargs):
+        return np.vstack([[1.0, 0.0] if "mid" in text.lower() else [0.0, 1.0] for text in texts]).astype(np.float32)
+
+
+class CrashingStorage(SQLiteStorage):
+    """Cai na primeira gravação de atualizações (antes ou depois de gravar), como um job interrompido."""
+
+    def __init__(self, path: str, crash_after_write: bool):
+        super().__init__(path)
+        self.crash_after_write = crash_after_write
+        self.crashed = False
+
+    def update_users(self, updates: dict[str, dict]) -> None:
+        if self.crashed:
+            super().update_users(updates)
+            return
+        self.crashed = True
+        if self.crash_after_write:
+            super().update_users(updates)
+        raise ConnectionError("Queda simulada.")
+
+
+@pytest.fixture
+def store():
+    return PlayerStore(names=PLAYERS, texts=["Jogador mid.", "Jogador support."],
+                       matrix=np.eye(2, dtype=np.float32), model_name="stub")
+
+
+def users() -> dict[str, dict]:
+    return {f"u{i}": {"fav_game": "LoL", "role": "Mid" if i % 2 else "Support", "city": "Recife",
+                      "playstyle_desc": "jogo de mid" if i % 2 else "jogo de suporte",
+                      "match_player_name": "Antigo", "match_score": 0.5}
+            for i in range(6)}
+
+
+@pytest.mark.parametrize("crash_after_write", [False, True])
+def test_resumed_rematch_keeps_audience_counts_consistent(tmp_path, store, crash_after_write):
+    storage = CrashingStorage(str(tmp_path / "users.sqlite3"), crash_after_write)
+    storage.write("users", users())
+    analytics = AudienceAggregates(str(tmp_path / "audience.sqlite3"))
+    analytics.record_many([(record, None, key) for key, record in users().items()])
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    with pytest.raises(ConnectionError):
+        rematch_users(storage, store, StubModel(), page_size=2, checkpoint_path=checkpoint, analytics=analytics)
+    summary = rematch_users(storage, store, StubModel(), page_size=2, checkpoint_path=checkpoint,
+                            analytics=analytics)
+
+    assert summary["processed"] == 6
+    stored = [record["match_player_name"] for page in storage.iter_users() for _, record in page]
+    assert sorted(stored) == ["Mid"] * 3 + ["Support"] * 3
+    snapshot = analytics.snapshot()
+    assert snapshot["total"] == 6
+    assert snapshot["counts"]["match_player_name"] == {"Mid": 3, "Support": 3}
+    assert "Antigo" not in snapshot["player_score_histograms"]
+
+
+def test_rematch_adjustment_is_idempotent(tmp_path):
+    analytics = AudienceAggregates(str(tmp_path / "audience.sqlite3"))
+    record = users()["u1"]
+    analytics.record(record, fan_id="u1")
+    change = [("u1", record, {"match_player_name": "Mid", "match_score": 0.9})]
+
+    analytics.rematch(change)
+    analytics.rematch(change)
+
+    assert analytics.snapshot()["counts"]["match_player_name"] == {"Mid": 1}
+    assert analytics.count(match_player_name="Mid") == 1
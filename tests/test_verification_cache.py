@@ -0,0 +1,41 @@
+from utils.ocr import STATUS_NAME_NOT_FOUND, STATUS_NO_TEXT, STATUS_VERIFIED
+from utils.verification_cache import VerificationCache
+
+TEXT = "republica federativa do brasil carteira nacional de habilitacao nome joao carlos da silva"
+
+
+def test_fully_read_verified_document_answers_other_names():
+    cache = VerificationCache()
+    cache.store("pdf", (STATUS_VERIFIED, TEXT), complete=True)
+
+    assert cache.lookup("pdf", "Carlos", "Silva") == (STATUS_VERIFIED, None)
+    assert cache.lookup("pdf", "Maria", "Souza") == (STATUS_NAME_NOT_FOUND, None)
+    assert cache.stats()["hits"] == 2
+
+
+def test_partially_read_document_only_answers_names_it_contains():
+    cache = VerificationCache()
+    cache.store("pdf", (STATUS_VERIFIED, TEXT), complete=False)
+
+    assert cache.lookup("pdf", "Joao", "Silva") == (STATUS_VERIFIED, None)
+    assert cache.lookup("pdf", "Maria", "Souza") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_name_not_found_is_final_only_for_complete_documents():
+    cache = VerificationCache()
+    cache.store("complete", (STATUS_NAME_NOT_FOUND, TEXT), complete=True)
+    cache.store("cut", (STATUS_NAME_NOT_FOUND, TEXT), complete=False)
+
+    assert cache.lookup("complete", "Maria", "Souza") == (STATUS_NAME_NOT_FOUND, None)
+    assert cache.lookup("cut", "Maria", "Souza") is None
+    assert cache.lookup("cut", "Joao", "Silva") == (STATUS_VERIFIED, None)
+
+
+def test_empty_text_and_errors():
+    cache = VerificationCache()
+    cache.store("blank", (STATUS_NO_TEXT, ""), complete=True)
+    cache.store("error", ("Erro ao Processar PDF", None))
+
+    assert cache.lookup("blank", "Joao", "Silva") == (STATUS_NO_TEXT, "")
+    assert cache.lookup("error", "Joao", "Silva") is None
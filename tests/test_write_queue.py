@@ -0,0 +1,119 @@
+import pytest
+
+from utils.fake_rtdb import FakeRTDB
+from utils.storage_backends import FirebaseStorage
+from utils.write_queue import StorageFlusher, WriteAheadQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WriteAheadQueue(str(tmp_path / "write_queue.sqlite3"))
+
+
+def make_due(queue: WriteAheadQueue) -> None:
+    """Antecipa as novas tentativas agendadas com backoff."""
+    queue._connection().execute("UPDATE pending_writes SET next_attempt_at = 0")
+
+
+class RejectingStorage(FirebaseStorage):
+    """FakeRTDB que recusa qualquer `update` contendo uma das chaves rejeitadas."""
+
+    def __init__(self, database: FakeRTDB, rejected: set[str]):
+        super().__init__(database.reference)
+        self.rejected = rejected
+
+    def write(self, collection: str, records: dict[str, dict]) -> None:
+        if self.rejected & set(records):
+            raise ValueError("Caminho inválido.")
+        super().write(collection, records)
+
+
+def test_flush_writes_batch_to_fake_rtdb(queue):
+    database = FakeRTDB()
+    flusher = StorageFlusher(queue, FirebaseStorage(database.reference))
+    for key in ("a", "b", "c"):
+        queue.enqueue(key, "users", {"nickname": key})
+
+    assert flusher.flush_all() == 3
+    assert database.reference("users").get() == {key: {"nickname": key} for key in ("a", "b", "c")}
+    assert database.write_calls == 1
+    assert len(queue) == 0
+
+
+def test_transient_failure_is_retried(queue):
+    database = FakeRTDB(fail_next=1)
+    flusher = StorageFlusher(queue, FirebaseStorage(database.reference))
+    queue.enqueue("a", "users", {"nickname": "a"})
+
+    assert flusher.flush_once() == 0
+    assert len(queue) == 1
+    assert flusher.failed_batches == 1
+
+    make_due(queue)
+    assert flusher.flush_once() == 1
+    assert database.reference("users/a").get() == {"nickname": "a"}
+    assert len(queue) == 0
+
+
+def test_ack_of_older_revision_keeps_reenqueued_write(queue):
+    database = FakeRTDB()
+    storage = FirebaseStorage(database.reference)
+    queue.enqueue("a", "users", {"verification_status": "Pendente"})
+    claimed = queue.claim_batch(10)
+    # Reenfileirada enquanto a revisão anterior estava em envio.
+    queue.enqueue("a", "users", {"verification_status": "Verificado"})
+    storage.write("users", {key: payload for key, _, payload, _, _, _ in claimed})
+    queue.ack([(key, revision) for key, _, _, _, revision, _ in claimed])
+
+    assert len(queue) == 1
+    assert StorageFlusher(queue, storage).flush_all() == 1
+    assert database.reference("users/a").get() == {"verification_status": "Verificado"}
+
+
+def test_rejected_write_goes_to_dead_letters_without_blocking_batch(queue):
+    database = FakeRTDB()
+    flusher = StorageFlusher(queue, RejectingStorage(database, {"bad"}), max_backoff_seconds=0,
+                             split_after_attempts=2, max_attempts=4)
+    for key in ("a", "bad", "b"):
+        queue.enqueue(key, "users", {"nickname": key})
+
+    for _ in range(6):
+        make_due(queue)
+        flusher.flush_once()
+
+    assert sorted(database.reference("users").get()) == ["a", "b"]
+    assert len(queue) == 0
+    assert queue.dead_letters() == [("bad", "users", {"nickname": "bad"}, 4, "Caminho inválido.")]
+    assert flusher.dead_letters == 1
+
+    queue.requeue_dead_letter("bad")
+    assert len(queue) == 1
+    assert queue.dead_letters() == []
+
+
+def test_flush_all_continues_after_failed_batch(queue):
+    database = FakeRTDB(fail_next=1)
+    flusher = StorageFlusher(queue, FirebaseStorage(database.reference), batch_size=2)
+    for key in ("a", "b", "c", "d"):
+        queue.enqueue(key, "users", {"nickname": key})
+
+    # O primeiro lote falha e fica com backoff; os demais continuam sendo drenados.
+    assert flusher.flush_all() == 2
+    assert sorted(database.reference("users").get()) == ["c", "d"]
+    assert len(queue) == 2
+
+
+def test_update_merges_into_pending_write_and_keeps_other_fields(queue):
+    database = FakeRTDB()
+    flusher = StorageFlusher(queue, FirebaseStorage(database.reference))
+    queue.enqueue("a", "users", {"created_at": "2026-01-01T00:00:00+00:00", "verification_status": "Pendente"})
+    queue.enqueue_update("a", "users", {"verification_status": "Verificado"})
+    flusher.flush_all()
+    assert database.reference("users/a").get() == {"created_at": "2026-01-01T00:00:00+00:00",
+                                                   "verification_status": "Verificado"}
+
+    database.reference("users/a/match_player_name").set("FalleN")
+    queue.enqueue_update("a", "users", {"verification_status": "Falha"})
+    flusher.flush_all()
+    assert database.reference("users/a").get() == {"created_at": "2026-01-01T00:00:00+00:00",
+                                                   "verification_status": "Falha", "match_player_name": "FalleN"}
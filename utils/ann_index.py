@@ -0,0 +1,477 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from utils.player_store import normalize_rows
+
+_INITIAL_CAPACITY = 1024
+_ASSIGN_CHUNK_SIZE = 65536
+
+
+class BruteForceIndex:
+    """
+    Busca exata por similaridade de cosseno sobre todos os vetores inseridos.
+    Serve de referência para o IVF e de fallback enquanto ele não está treinado.
+    Cada id aparece uma vez só: inserir um id existente substitui o vetor dele.
+    """
+    kind = "brute"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.empty((_INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._lock = threading.RLock()
+        # Metadados gravados junto do índice por `save` (ex.: posição no log de inserções).
+        self.metadata: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self._ids)]
+
+    @property
+    def ids(self) -> list[str]:
+        return self._ids
+
+    def _append_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        """Copia os vetores para o buffer (crescimento geométrico) e retorna as linhas ocupadas."""
+        start = len(self._ids)
+        end = start + vectors.shape[0]
+        if end > self._vectors.shape[0]:
+            capacity = max(end, 2 * self._vectors.shape[0])
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+        self._vectors[start:end] = vectors
+        return np.arange(start, end)
+
+    def _prepare(self, ids: list[str], vectors: np.ndarray) -> np.ndarray:
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if vectors.shape[0] != len(ids):
+            raise ValueError(f"{len(ids)} ids para {vectors.shape[0]} vetores.")
+        return vectors
+
+    def _upsert(self, ids: list[str], vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Substitui os vetores de ids já presentes e acrescenta os novos (repetidos no mesmo lote:
+        vale o último). Chamar com o lock. Retorna (linhas acrescentadas, linhas substituídas).
+        """
+        new_positions: dict[str, int] = {}
+        replaced: dict[int, int] = {}
+        for position, item_id in enumerate(str(i) for i in ids):
+            row = self._rows.get(item_id)
+            if row is None:
+                new_positions.pop(item_id, None)
+                new_positions[item_id] = position
+            else:
+                replaced[row] = position
+        if replaced:
+            replaced_rows = np.fromiter(replaced, dtype=np.intp, count=len(replaced))
+            self._vectors[replaced_rows] = vectors[list(replaced.values())]
+        else:
+            replaced_rows = np.empty(0, dtype=np.intp)
+        if not new_positions:
+            return np.empty(0, dtype=np.intp), replaced_rows
+        rows = self._append_vectors(vectors[list(new_positions.values())])
+        for item_id, row in zip(new_positions, rows):
+            self._rows[item_id] = int(row)
+        self._ids.extend(new_positions)
+        return rows, replaced_rows
+
+    def add(self, ids: list[str], vectors: np.ndarray) -> None:
+        """Insere vetores (normalizados na inserção) com seus respectivos ids; ids existentes são substituídos."""
+        vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self._upsert(ids, vectors)
+
+    def _top_k(self, rows: np.ndarray | None, query: np.ndarray, k: int) -> list[tuple[str, float]]:
+        candidates = self.vectors if rows is None else self._vectors[rows]
+        if candidates.shape[0] == 0:
+            return []
+        scores = candidates @ query
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._ids[int(rows[i]) if rows is not None else int(i)], float(scores[i])) for i in top]
+
+    def _normalize_query(self, query: np.ndarray) -> np.ndarray | None:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else None
+
+    def search(self, query: np.ndarray, k: int = 10) -> list[tuple[str, float]]:
+        """Retorna até k pares (id, score) em ordem decrescente de similaridade."""
+        query = self._normalize_query(query)
+        if query is None or k <= 0:
+            return []
+        with self._lock:
+            return self._top_k(None, query, k)
+
+    def _arrays(self) -> dict[str, np.ndarray]:
+        return {"vectors": self.vectors, "ids": np.asarray(self._ids, dtype=str)}
+
+    def _params(self) -> dict:
+        return {"dim": self.dim}
+
+    def _serialize(self, metadata: dict | None = None) -> tuple[str, dict[str, np.ndarray]]:
+        """Cabeçalho e cópia dos arrays do índice, tirados de uma vez sob o lock."""
+        with self._lock:
+            header = json.dumps({"kind": self.kind, "params": self._params(), "metadata": metadata or {}})
+            return header, {name: array.copy() for name, array in self._arrays().items()}
+
+    def save(self, path: str, metadata: dict | None = None) -> None:
+        """
+        Salva o índice num único arquivo `.npz` (sem pickle), de forma atômica (ver `write_index_file`).
+        A escrita acontece fora do lock: buscas e inserções seguem normalmente.
+        """
+        write_index_file(path, *self._serialize(metadata))
+
+    def _restore(self, data) -> np.ndarray:
+        """
+        Carrega os arrays salvos. Snapshots antigos podem repetir um id: fica a última ocorrência.
+        Retorna as linhas do arquivo mantidas.
+        """
+        ids = [str(i) for i in data["ids"]]
+        last_rows = {item_id: row for row, item_id in enumerate(ids)}
+        keep = np.fromiter(sorted(last_rows.values()), dtype=np.intp, count=len(last_rows))
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        if ids:
+            self._append_vectors(data["vectors"][keep].astype(np.float32, copy=False))
+            self._ids = [ids[row] for row in keep]
+            self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+        return keep
+
+
+def write_index_file(path: str, header: str, arrays: dict[str, np.ndarray]) -> None:
+    """Grava um arquivo temporário e o renomeia: uma queda no meio da escrita não corrompe o índice salvo."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, header=np.asarray(header), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class IVFIndex(BruteForceIndex):
+    """
+    Índice IVF (inverted file): os vetores são agrupados por k-means esférico em
+    `n_lists` listas, e cada consulta só pontua as `n_probe` listas mais próximas.
+
+    Até atingir `train_threshold` vetores, o índice responde com busca exata; ao
+    atingir, treina os centróides automaticamente e passa a usar as listas. Com
+    `background_training` (padrão), o treino automático roda numa thread própria e a
+    inserção que atingiu o limite retorna na hora; a busca exata continua até o fim do treino.
+    """
+    kind = "ivf"
+
+    def __init__(self, dim: int, n_lists: int = 256, n_probe: int = 8, train_threshold: int | None = None,
+                 seed: int = 0, background_training: bool = True):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold or n_lists * 39
+        self.seed = seed
+        self.background_training = background_training
+        self.centroids: np.ndarray | None = None
+        self._lists: list[np.ndarray] = []
+        self._training = False
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray | None = None) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        assignments = np.empty(vectors.shape[0], dtype=np.intp)
+        for start in range(0, vectors.shape[0], _ASSIGN_CHUNK_SIZE):
+            chunk = vectors[start:start + _ASSIGN_CHUNK_SIZE]
+            assignments[start:start + chunk.shape[0]] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
+
+    def _index_rows(self, rows: np.ndarray, assignments: np.ndarray) -> None:
+        order = np.argsort(assignments, kind="stable")
+        sorted_lists = assignments[order]
+        boundaries = np.searchsorted(sorted_lists, np.arange(self.n_lists + 1))
+        for list_id in range(self.n_lists):
+            new_rows = rows[order[boundaries[list_id]:boundaries[list_id + 1]]]
+            if new_rows.size:
+                self._lists[list_id] = np.concatenate([self._lists[list_id], new_rows])
+
+    def train(self, sample: np.ndarray | None = None, n_iter: int = 10) -> None:
+        """
+        Treina os centróides com k-means esférico e redistribui todos os vetores já inseridos.
+        O k-means roda fora do lock (buscas e inserções continuam, com busca exata); só a troca
+        para os novos centróides e a redistribuição seguram o índice.
+
+        Args:
+            sample: vetores de treino; por padrão, uma amostra dos vetores do índice;
+            n_iter: número de iterações do k-means.
+        """
+        rng = np.random.default_rng(self.seed)
+        if sample is None:
+            with self._lock:
+                vectors = self.vectors
+                size = min(len(vectors), self.n_lists * 64)
+                sample = vectors[rng.choice(len(vectors), size, replace=False)]
+        sample = normalize_rows(sample)
+        n_lists = min(self.n_lists, sample.shape[0])
+        if n_lists == 0:
+            raise ValueError("Não há vetores para treinar o índice IVF.")
+
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        with self._lock:
+            self.centroids = centroids
+            self.n_lists = n_lists
+            self._lists = [np.empty(0, dtype=np.intp) for _ in range(n_lists)]
+            if len(self):
+                self._index_rows(np.arange(len(self)), self._assign(self.vectors))
+
+    def _train_in_background(self) -> None:
+        try:
+            self.train()
+            print(f"Índice IVF treinado com {len(self)} vetores ({self.n_lists} listas).")
+        except Exception as e:
+            print(f"Erro ao treinar o índice IVF: {e}")
+        finally:
+            self._training = False
+
+    def add(self, ids: list[str], vectors: np.ndarray) -> None:
+        vectors = self._prepare(ids, vectors)
+        with self._lock:
+            rows, replaced_rows = self._upsert(ids, vectors)
+            if self.is_trained:
+                if replaced_rows.size:
+                    # O vetor substituído pode ter mudado de lista.
+                    self._lists = [list_rows[~np.isin(list_rows, replaced_rows)] for list_rows in self._lists]
+                    rows = np.concatenate([rows, replaced_rows])
+                if rows.size:
+                    self._index_rows(rows, self._assign(self._vectors[rows]))
+            elif len(self) >= self.train_threshold and not self._training:
+                if self.background_training:
+                    self._training = True
+                    threading.Thread(target=self._train_in_background, name="ivf-train", daemon=True).start()
+                else:
+                    self.train()
+
+    def search(self, query: np.ndarray, k: int = 10, n_probe: int | None = None) -> list[tuple[str, float]]:
+        query = self._normalize_query(query)
+        if query is None or k <= 0:
+            return []
+        with self._lock:
+            if not self.is_trained:
+                return self._top_k(None, query, k)
+            n_probe = min(n_probe or self.n_probe, self.n_lists)
+            centroid_scores = self.centroids @ query
+            probes = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+            rows = np.concatenate([self._lists[list_id] for list_id in probes])
+            return self._top_k(rows, query, k)
+
+    def _arrays(self) -> dict[str, np.ndarray]:
+        arrays = super()._arrays()
+        if self.is_trained:
+            assignments = np.empty(len(self), dtype=np.intp)
+            for list_id, rows in enumerate(self._lists):
+                assignments[rows] = list_id
+            arrays["centroids"] = self.centroids
+            arrays["assignments"] = assignments
+        return arrays
+
+    def _params(self) -> dict:
+        return {"dim": self.dim, "n_lists": self.n_lists, "n_probe": self.n_probe,
+                "train_threshold": self.train_threshold, "seed": self.seed}
+
+    def _restore(self, data) -> np.ndarray:
+        keep = super()._restore(data)
+        if "centroids" in data:
+            self.centroids = data["centroids"].astype(np.float32, copy=False)
+            self.n_lists = self.centroids.shape[0]
+            self._lists = [np.empty(0, dtype=np.intp) for _ in range(self.n_lists)]
+            self._index_rows(np.arange(len(self)), data["assignments"][keep].astype(np.intp))
+        return keep
+
+
+ANN_INDEX_TYPES = {cls.kind: cls for cls in (BruteForceIndex, IVFIndex)}
+
+
+def create_ann_index(kind: str, dim: int, **params) -> BruteForceIndex:
+    """Cria um índice vazio do tipo `kind` ('brute' ou 'ivf')."""
+    if kind not in ANN_INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconhecido: {kind}. Opções: {', '.join(ANN_INDEX_TYPES)}")
+    return ANN_INDEX_TYPES[kind](dim, **params)
+
+
+def load_ann_index(path: str) -> BruteForceIndex:
+    """Carrega um índice salvo com `save`, recriando o tipo, os parâmetros e os metadados originais."""
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data["header"]))
+        index = create_ann_index(header["kind"], **header["params"])
+        index._restore(data)
+        index.metadata = header.get("metadata", {})
+    return index
+
+
+_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vector_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id TEXT NOT NULL,
+    vector BLOB NOT NULL
+);
+"""
+
+
+class VectorLog:
+    """
+    Log durável (SQLite, modo WAL) das inserções num índice ANN, compartilhado pelos processos.
+    Cada inserção ganha um número de sequência crescente; os vetores ficam em float32.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_LOG_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, item_id: str, vector: np.ndarray) -> int:
+        """Grava a inserção em disco. Retorna o número de sequência."""
+        blob = np.asarray(vector, dtype=np.float32).reshape(-1).tobytes()
+        return self._connection().execute("INSERT INTO vector_log (item_id, vector) VALUES (?, ?)",
+                                          (item_id, blob)).lastrowid
+
+    def since(self, seq: int, dim: int, until: int | None = None) -> tuple[int, list[str], np.ndarray]:
+        """
+        Inserções com sequência maior que `seq` (e até `until`, inclusive, se informado).
+        Retorna (última sequência lida, ids, vetores).
+        """
+        rows = self._connection().execute(
+            "SELECT seq, item_id, vector FROM vector_log WHERE seq > ? AND seq <= ? ORDER BY seq",
+            (seq, until if until is not None else 2 ** 63 - 1)).fetchall()
+        if not rows:
+            return seq, [], np.empty((0, dim), dtype=np.float32)
+        vectors = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+        return rows[-1][0], [row[1] for row in rows], vectors
+
+    def last_seq(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM vector_log").fetchone()[0]
+
+
+class PersistentANNIndex:
+    """
+    Índice ANN durável e compartilhado entre processos. Cada inserção vai primeiro para o
+    `VectorLog`, e cada processo aplica as inserções dos outros (lidas do log) antes de buscar;
+    nenhuma inserção se perde num reinício nem é sobrescrita por outro processo.
+
+    O `.npz` é só um snapshot para acelerar a carga, com a posição do log que ele já contém
+    (`log_seq`): é regravado de forma atômica, numa thread, a cada `snapshot_every` inserções, e
+    ao abrir o índice o log é reaplicado a partir dessa posição.
+    """
+
+    def __init__(self, index: BruteForceIndex, log: VectorLog, snapshot_path: str | None = None,
+                 applied_seq: int = 0, snapshot_every: int = 1000):
+        self.index = index
+        self.log = log
+        self.snapshot_path = snapshot_path
+        self.applied_seq = applied_seq
+        self.snapshot_every = snapshot_every
+        self._snapshot_seq = applied_seq
+        self._snapshotting = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def ids(self) -> list[str]:
+        return self.index.ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.index.vectors
+
+    def sync(self) -> int:
+        """Aplica as inserções do log ainda não vistas por este processo. Retorna quantas foram aplicadas."""
+        with self._lock:
+            last_seq, ids, vectors = self.log.since(self.applied_seq, self.index.dim)
+            if ids:
+                self.index.add(ids, vectors)
+                self.applied_seq = last_seq
+            due = (self.snapshot_path and not self._snapshotting
+                   and self.applied_seq - self._snapshot_seq >= self.snapshot_every)
+            if due:
+                self._snapshotting = True
+        if due:
+            threading.Thread(target=self._snapshot_in_background, name="ann-snapshot", daemon=True).start()
+        return len(ids)
+
+    def add(self, item_id: str, vector: np.ndarray) -> None:
+        self.log.append(item_id, vector)
+        self.sync()
+
+    def search(self, query: np.ndarray, k: int = 10, **kwargs) -> list[tuple[str, float]]:
+        self.sync()
+        return self.index.search(query, k, **kwargs)
+
+    def snapshot(self) -> None:
+        """Grava o snapshot com a posição do log aplicada até aqui."""
+        with self._lock:
+            seq = self.applied_seq
+            header, arrays = self.index._serialize({"log_seq": seq})
+        write_index_file(self.snapshot_path, header, arrays)
+        self._snapshot_seq = seq
+
+    def _snapshot_in_background(self) -> None:
+        try:
+            self.snapshot()
+            print(f"Snapshot do índice salvo em {self.snapshot_path} (log até {self._snapshot_seq}).")
+        except Exception as e:
+            print(f"Erro ao salvar snapshot do índice em {self.snapshot_path}: {e}")
+        finally:
+            self._snapshotting = False
+
+
+def open_persistent_index(snapshot_path: str, log_path: str, kind: str = "ivf", dim: int = 768,
+                          snapshot_every: int = 1000) -> PersistentANNIndex:
+    """Carrega o snapshot (ou cria um índice vazio) e reaplica as inserções do log feitas depois dele."""
+    index, applied_seq = None, 0
+    if os.path.exists(snapshot_path):
+        try:
+            index = load_ann_index(snapshot_path)
+            applied_seq = int(index.metadata.get("log_seq", 0))
+        except Exception as e:
+            print(f"Erro ao carregar snapshot do índice de {snapshot_path}, reconstruindo pelo log: {e}")
+    if index is None:
+        index = create_ann_index(kind, dim)
+    persistent = PersistentANNIndex(index, VectorLog(log_path), snapshot_path, applied_seq, snapshot_every)
+    replayed = persistent.sync()
+    print(f"Índice {index.kind} com {len(index)} vetores ({replayed} reaplicados do log {log_path}).")
+    return persistent
@@ -0,0 +1,163 @@
+import base64
+import os
+import time
+
+import numpy as np
+import requests
+import streamlit as st
+
+from utils.ocr_service import JOB_DONE, JOB_ERROR, JOB_NOT_FOUND, load_ocr_service
+from utils.vectorizer import load_micro_batch_encoder, load_roster_registry, prepare_user_text
+
+PROFILE_FIELDS = ("fav_game", "role", "playstyle_desc")
+
+
+def profile_from_session(session_state) -> dict:
+    """Extrai do session_state apenas os campos usados no matching."""
+    return {field: session_state.get(field) for field in PROFILE_FIELDS}
+
+
+class LocalMatchingClient:
+    """
+    Executa matching e verificação no próprio processo do Streamlit. Usado quando
+    MATCHING_API_URL não está configurada; mesma interface do `HttpMatchingClient`.
+
+    Args:
+        timeout_seconds: espera máxima pelo encoder numa chamada de `match_profiles`.
+    """
+
+    def __init__(self, timeout_seconds: float = 30.0):
+        self.timeout_seconds = timeout_seconds
+
+    def warm_up(self) -> dict:
+        """Carrega modelo, índice dos jogadores e workers de OCR. Retorna {recurso: pronto}."""
+        encoder = load_micro_batch_encoder()
+        if encoder:
+            encoder.encode("aquecimento")
+        return {
+            "modelo": encoder is not None,
+            "jogadores": load_roster_registry('data/players_vectors.npy') is not None,
+            "ocr": load_ocr_service().warm_up(),
+        }
+
+    def match_profiles(self, profiles: list[dict], k: int = 5) -> list[dict] | None:
+        """
+        Returns:
+            Para cada perfil, {'text', 'vector' (ndarray ou None), 'matches', 'roster_version'};
+            None se o modelo ou o elenco dos jogadores não estiverem disponíveis. Se o encoder
+            falhar ou não responder em `timeout_seconds`, os vetores ficam None.
+        """
+        encoder = load_micro_batch_encoder()
+        registry = load_roster_registry('data/players_vectors.npy')
+        if not encoder or not registry:
+            return None
+        # Uma versão do elenco para a chamada inteira, mesmo que uma recarga aconteça no meio.
+        roster = registry.current()
+
+        texts = [prepare_user_text(profile) for profile in profiles]
+        results = [{"text": text, "vector": None, "matches": [], "roster_version": roster.version} for text in texts]
+        valid_rows = [row for row, text in enumerate(texts) if text]
+        if valid_rows:
+            futures = [encoder.submit(texts[row]) for row in valid_rows]
+            deadline = time.monotonic() + self.timeout_seconds
+            try:
+                vectors = np.vstack([future.result(timeout=max(0.0, deadline - time.monotonic()))
+                                     for future in futures])
+                matches = roster.index.search_batch(vectors, k=k)
+            except Exception as e:
+                for future in futures:
+                    future.cancel()
+                print(f"Erro ao gerar os vetores do matching ({type(e).__name__}): {e}")
+                return results
+            for position, row in enumerate(valid_rows):
+                results[row]["vector"] = vectors[position]
+                results[row]["matches"] = matches[position]
+        return results
+
+    def submit_verification(self, pdf_bytes: bytes, first_name: str, last_name: str) -> str | None:
+        return load_ocr_service().submit(pdf_bytes, first_name, last_name)
+
+    def verification_status(self, job_id: str) -> tuple[str, str | None]:
+        state, result = load_ocr_service().status(job_id)
+        return state, result[0] if state == JOB_DONE else None
+
+    def discard_verification(self, job_id: str) -> None:
+        load_ocr_service().discard(job_id)
+
+
+class HttpMatchingClient:
+    """Cliente da API de matching (`api/server.py`)."""
+
+    def __init__(self, base_url: str, timeout_seconds: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout_seconds = timeout_seconds
+        self._session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        return self._session.request(method, f"{self.base_url}{path}", timeout=self.timeout_seconds, **kwargs)
+
+    def warm_up(self) -> dict:
+        """Confere se a API está no ar (o aquecimento dos modelos acontece no próprio servidor)."""
+        try:
+            self._request("GET", "/health").raise_for_status()
+            return {"api": True}
+        except requests.RequestException as e:
+            print(f"API de matching indisponível no aquecimento: {e}")
+            return {"api": False}
+
+    def match_profiles(self, profiles: list[dict], k: int = 5) -> list[dict] | None:
+        try:
+            response = self._request("POST", "/match", json={"profiles": profiles, "k": k, "include_vectors": True})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Erro ao chamar a API de matching: {e}")
+            return None
+        print(f"API de matching respondeu em {response.headers.get('X-Process-Time-Ms')} ms "
+              f"({response.headers.get('Server-Timing')}).")
+        results = response.json()["results"]
+        for result in results:
+            if result.get("vector") is not None:
+                result["vector"] = np.asarray(result["vector"], dtype=np.float32)
+        return results
+
+    def submit_verification(self, pdf_bytes: bytes, first_name: str, last_name: str) -> str | None:
+        payload = {"pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+                   "first_name": first_name, "last_name": last_name}
+        try:
+            response = self._request("POST", "/verify-cnh", json=payload)
+        except requests.RequestException as e:
+            print(f"Erro ao enviar verificação à API: {e}")
+            return None
+        if response.status_code == 503:
+            return None
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    def verification_status(self, job_id: str) -> tuple[str, str | None]:
+        try:
+            response = self._request("GET", f"/verify-cnh/{job_id}")
+            if response.status_code == 404:
+                return JOB_NOT_FOUND, None
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Erro ao consultar job de verificação {job_id}: {e}")
+            return JOB_ERROR, None
+        body = response.json()
+        return body["state"], body.get("status")
+
+    def discard_verification(self, job_id: str) -> None:
+        try:
+            self._request("DELETE", f"/verify-cnh/{job_id}")
+        except requests.RequestException as e:
+            print(f"Erro ao descartar job de verificação {job_id}: {e}")
+
+
+@st.cache_resource
+def load_matching_client() -> LocalMatchingClient | HttpMatchingClient:
+    """Cliente HTTP se MATCHING_API_URL estiver definida; senão, execução local."""
+    api_url = os.getenv("MATCHING_API_URL")
+    if api_url:
+        print(f"Usando API de matching em {api_url}.")
+        return HttpMatchingClient(api_url, float(os.getenv("MATCHING_API_TIMEOUT_SECONDS", "30")))
+    print("MATCHING_API_URL não definida, matching executado localmente.")
+    return LocalMatchingClient(float(os.getenv("MATCHING_API_TIMEOUT_SECONDS", "30")))
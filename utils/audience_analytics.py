@@ -0,0 +1,417 @@
+"""
+Agregados da audiência mantidos de forma incremental: contagens por jogo, role, cidade e
+jogador do match, histogramas de score e clusters (mini-batch k-means) dos vetores dos fãs.
+Cada perfil salvo atualiza os agregados em O(1) num SQLite compartilhado pelos processos; o
+painel (`pages/`) lê o estado pronto, sem percorrer o nó `users`. O re-matching
+(`utils.rematch_users`) ajusta as contagens dos perfis que mudaram de jogador.
+
+Reconstrução completa a partir do armazenamento (uma leitura de todos os perfis):
+    python -m utils.audience_analytics --storage sqlite
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import streamlit as st
+from dotenv import load_dotenv
+
+from utils.metrics import span
+from utils.name_matcher import normalize_tokens
+from utils.player_store import normalize_rows
+
+DIMENSIONS = ("fav_game", "role", "city", "match_player_name")
+SCORE_BINS = 20
+N_CLUSTERS = 8
+CLUSTER_BATCH_SIZE = 32
+AGGREGATES_PATH = 'data/audience_aggregates.sqlite3'
+
+
+def dimension_key(field: str, value) -> str | None:
+    """Chave de agregação de um campo. Cidades ignoram caixa e acentos ('sao paulo' == 'São Paulo')."""
+    if value is None or not str(value).strip():
+        return None
+    if field == "city":
+        return " ".join(normalize_tokens(str(value))) or None
+    return str(value).strip()
+
+
+def score_bin(score: float) -> int:
+    return min(max(int(score * SCORE_BINS), 0), SCORE_BINS - 1)
+
+
+class MiniBatchKMeans:
+    """
+    K-means esférico (vetores L2-normalizados, similaridade de cosseno) atualizado em mini-lotes:
+    cada centróide anda em direção à média do lote com passo 1/n, onde n é o total de vetores
+    que ele já recebeu. Os primeiros vetores ficam num buffer até formar o primeiro lote.
+    """
+
+    def __init__(self, n_clusters: int = N_CLUSTERS, batch_size: int = CLUSTER_BATCH_SIZE, seed: int = 0):
+        self.n_clusters = n_clusters
+        self.batch_size = max(batch_size, n_clusters)
+        self.seed = seed
+        self.centroids: np.ndarray | None = None
+        self.counts = np.zeros(n_clusters, dtype=np.int64)
+        self.pending: list[np.ndarray] = []
+
+    def _init_centroids(self, batch: np.ndarray) -> None:
+        """k-means++ sobre o primeiro lote."""
+        rng = np.random.default_rng(self.seed)
+        chosen = [int(rng.integers(batch.shape[0]))]
+        for _ in range(1, self.n_clusters):
+            distances = 1.0 - (batch @ batch[chosen].T).max(axis=1)
+            distances = np.clip(distances, 0.0, None)
+            total = distances.sum()
+            chosen.append(int(rng.choice(batch.shape[0], p=distances / total)) if total > 0
+                          else int(rng.integers(batch.shape[0])))
+        self.centroids = batch[chosen].copy()
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors @ self.centroids.T).argmax(axis=1)
+
+    def partial_fit(self, vectors: np.ndarray) -> np.ndarray | None:
+        """
+        Acrescenta vetores ao buffer e processa um lote quando ele enche.
+
+        Returns:
+            Clusters dos vetores do buffer processado (na ordem de chegada), ou None se o lote
+            ainda não encheu.
+        """
+        self.pending.extend(normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)))
+        if len(self.pending) < self.batch_size:
+            return None
+        batch = np.vstack(self.pending)
+        self.pending = []
+        if self.centroids is None:
+            self._init_centroids(batch)
+        assignments = self.assign(batch)
+        for cluster in np.unique(assignments):
+            members = batch[assignments == cluster]
+            self.counts[cluster] += len(members)
+            step = len(members) / self.counts[cluster]
+            self.centroids[cluster] = (1.0 - step) * self.centroids[cluster] + step * members.mean(axis=0)
+        self.centroids = normalize_rows(self.centroids)
+        return assignments
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS combinations (
+    fav_game TEXT NOT NULL,
+    role TEXT NOT NULL,
+    city TEXT NOT NULL,
+    match_player_name TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (fav_game, role, city, match_player_name)
+);
+CREATE TABLE IF NOT EXISTS labels (
+    key TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS score_histogram (
+    player TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (player, bin)
+);
+CREATE TABLE IF NOT EXISTS clusters (
+    cluster INTEGER PRIMARY KEY,
+    centroid BLOB NOT NULL,
+    n INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_profiles (
+    cluster INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    key TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (cluster, field, key)
+);
+CREATE TABLE IF NOT EXISTS fan_clusters (
+    fan_id TEXT PRIMARY KEY,
+    cluster INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fan_matches (
+    fan_id TEXT PRIMARY KEY,
+    keys TEXT NOT NULL,
+    score REAL
+);
+CREATE TABLE IF NOT EXISTS pending_vectors (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    fan_id TEXT,
+    vector BLOB NOT NULL,
+    keys TEXT NOT NULL
+);
+"""
+
+
+def profile_keys(profile: dict) -> dict[str, str | None]:
+    """Chaves de agregação de um perfil (campos de `build_user_payload`, do session_state ou do armazenamento)."""
+    keys = {field: dimension_key(field, profile.get(field)) for field in DIMENSIONS}
+    match_result = profile.get("match_result") or {}
+    keys["match_player_name"] = keys["match_player_name"] or dimension_key("match_player_name", match_result.get("name"))
+    return keys
+
+
+def profile_score(profile: dict) -> float | None:
+    match_result = profile.get("match_result") or {}
+    score = profile.get("match_score", match_result.get("score"))
+    return None if score is None else float(score)
+
+
+def _same_bin(a: float | None, b: float | None) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    return score_bin(a) == score_bin(b)
+
+
+class AudienceAggregates:
+    """
+    Agregados da audiência num SQLite (modo WAL) compartilhado pelos processos do app: cada
+    perfil salvo é uma transação de incrementos (`n = n + 1`), gravada na hora, sem que um
+    processo sobrescreva as contagens de outro. Os vetores ficam em `pending_vectors` até formar
+    um lote do k-means, processado na mesma transação pelo processo que completou o lote.
+    """
+
+    def __init__(self, path: str = AGGREGATES_PATH, n_clusters: int = N_CLUSTERS,
+                 batch_size: int = CLUSTER_BATCH_SIZE):
+        self.path = path
+        self.n_clusters = n_clusters
+        self.batch_size = max(batch_size, n_clusters)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def record(self, profile: dict, vector: np.ndarray | None = None, fan_id: str | None = None) -> None:
+        """Soma um perfil aos agregados. `fan_id` permite ajustar o segmento do fã depois de um re-matching."""
+        self.record_many([(profile, vector, fan_id)])
+
+    def record_many(self, items: list[tuple[dict, np.ndarray | None, str | None]]) -> None:
+        """Soma vários perfis numa única transação (usado na reconstrução)."""
+        with span("analytics_record"), self._transaction() as conn:
+            for profile, vector, fan_id in items:
+                keys = profile_keys(profile)
+                score = profile_score(profile)
+                self._add(conn, keys, score, 1)
+                if fan_id is not None:
+                    self._set_fan_match(conn, fan_id, keys, score)
+                if keys["city"] is not None:
+                    conn.execute("INSERT OR IGNORE INTO labels (key, label) VALUES (?, ?)",
+                                 (f"city:{keys['city']}", str(profile.get("city")).strip()))
+                if vector is not None:
+                    conn.execute("INSERT INTO pending_vectors (fan_id, vector, keys) VALUES (?, ?, ?)",
+                                 (fan_id, np.asarray(vector, dtype=np.float32).tobytes(),
+                                  json.dumps(keys, ensure_ascii=False)))
+                    self._fit_pending(conn)
+
+    def rematch(self, changes: list[tuple[str, dict, dict]]) -> None:
+        """
+        Move perfis re-matcheados do jogador/score contados para os novos. Idempotente: o que
+        está contado para cada fã fica em `fan_matches`, e um fã que já está no match novo não
+        é movido de novo (ex.: ao retomar um re-matching interrompido).
+
+        Args:
+            changes: (fan_id, registro salvo antes do re-matching, atualização a gravar).
+        """
+        with self._transaction() as conn:
+            for fan_id, record, update in changes:
+                counted = conn.execute("SELECT keys, score FROM fan_matches WHERE fan_id = ?", (fan_id,)).fetchone()
+                if counted is not None:
+                    old_keys, old_score = json.loads(counted[0]), counted[1]
+                else:
+                    old_keys, old_score = profile_keys(record), profile_score(record)
+                new_record = {**record, **update}
+                new_record.pop("match_result", None)
+                new_keys, new_score = profile_keys(new_record), profile_score(new_record)
+                self._set_fan_match(conn, fan_id, new_keys, new_score)
+                if old_keys == new_keys and _same_bin(old_score, new_score):
+                    continue
+                self._add(conn, old_keys, old_score, -1)
+                self._add(conn, new_keys, new_score, 1)
+                row = conn.execute("SELECT cluster FROM fan_clusters WHERE fan_id = ?", (fan_id,)).fetchone()
+                if row is not None and old_keys["match_player_name"] != new_keys["match_player_name"]:
+                    self._add_cluster_keys(conn, row[0], {"match_player_name": old_keys["match_player_name"]}, -1)
+                    self._add_cluster_keys(conn, row[0], {"match_player_name": new_keys["match_player_name"]}, 1)
+                # Vetor ainda no buffer do k-means: o segmento vai contar o jogador novo quando o lote rodar.
+                conn.execute("UPDATE pending_vectors SET keys = ? WHERE fan_id = ?",
+                             (json.dumps(new_keys, ensure_ascii=False), fan_id))
+            self._drop_empty(conn)
+
+    @staticmethod
+    def _set_fan_match(conn: sqlite3.Connection, fan_id: str, keys: dict[str, str | None],
+                       score: float | None) -> None:
+        conn.execute("INSERT OR REPLACE INTO fan_matches (fan_id, keys, score) VALUES (?, ?, ?)",
+                     (fan_id, json.dumps(keys, ensure_ascii=False), score))
+
+    def _add(self, conn: sqlite3.Connection, keys: dict[str, str | None], score: float | None, delta: int) -> None:
+        conn.execute("INSERT INTO combinations (fav_game, role, city, match_player_name, n) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT DO UPDATE SET n = n + excluded.n",
+                     (*(keys[field] or "" for field in DIMENSIONS), delta))
+        if score is None:
+            return
+        players = [""] + ([keys["match_player_name"]] if keys["match_player_name"] is not None else [])
+        conn.executemany("INSERT INTO score_histogram (player, bin, n) VALUES (?, ?, ?) "
+                         "ON CONFLICT DO UPDATE SET n = n + excluded.n",
+                         [(player, score_bin(score), delta) for player in players])
+
+    @staticmethod
+    def _add_cluster_keys(conn: sqlite3.Connection, cluster: int, keys: dict[str, str | None], delta: int) -> None:
+        conn.executemany("INSERT INTO cluster_profiles (cluster, field, key, n) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT DO UPDATE SET n = n + excluded.n",
+                         [(cluster, field, key, delta) for field, key in keys.items() if key is not None])
+
+    @staticmethod
+    def _drop_empty(conn: sqlite3.Connection) -> None:
+        for table in ("combinations", "score_histogram", "cluster_profiles"):
+            conn.execute(f"DELETE FROM {table} WHERE n <= 0")
+
+    def _fit_pending(self, conn: sqlite3.Connection) -> None:
+        """Processa um lote do k-means quando `pending_vectors` enche (dentro da transação de escrita)."""
+        if conn.execute("SELECT COUNT(*) FROM pending_vectors").fetchone()[0] < self.batch_size:
+            return
+        pending = conn.execute("SELECT seq, fan_id, vector, keys FROM pending_vectors ORDER BY seq").fetchall()
+        stored = conn.execute("SELECT centroid, n FROM clusters ORDER BY cluster").fetchall()
+        kmeans = MiniBatchKMeans(len(stored) or self.n_clusters, self.batch_size)
+        if stored:
+            kmeans.centroids = np.vstack([np.frombuffer(centroid, dtype=np.float32) for centroid, _ in stored])
+            kmeans.counts = np.asarray([n for _, n in stored], dtype=np.int64)
+        assignments = kmeans.partial_fit(np.vstack([np.frombuffer(vector, dtype=np.float32)
+                                                    for _, _, vector, _ in pending]))
+        conn.executemany("INSERT OR REPLACE INTO clusters (cluster, centroid, n) VALUES (?, ?, ?)",
+                         [(cluster, kmeans.centroids[cluster].astype(np.float32).tobytes(), int(kmeans.counts[cluster]))
+                          for cluster in range(kmeans.n_clusters)])
+        for (_, fan_id, _, keys), cluster in zip(pending, assignments):
+            self._add_cluster_keys(conn, int(cluster), json.loads(keys), 1)
+            if fan_id is not None:
+                conn.execute("INSERT OR REPLACE INTO fan_clusters (fan_id, cluster) VALUES (?, ?)",
+                             (fan_id, int(cluster)))
+        conn.execute("DELETE FROM pending_vectors WHERE seq <= ?", (pending[-1][0],))
+
+    def clear(self) -> None:
+        """Apaga todos os agregados (antes de uma reconstrução)."""
+        with self._transaction() as conn:
+            for table in ("combinations", "labels", "score_histogram", "clusters", "cluster_profiles",
+                          "fan_clusters", "fan_matches", "pending_vectors"):
+                conn.execute(f"DELETE FROM {table}")
+
+    def count(self, **filters: str | None) -> int:
+        """Fãs que atendem aos filtros (fav_game, role, city, match_player_name; None = qualquer)."""
+        wanted = {field: dimension_key(field, filters.get(field)) for field in DIMENSIONS}
+        conditions = [(f"{field} = ?", key) for field, key in wanted.items() if key is not None]
+        where = f" WHERE {' AND '.join(condition for condition, _ in conditions)}" if conditions else ""
+        return self._connection().execute(f"SELECT COALESCE(SUM(n), 0) FROM combinations{where}",
+                                          [key for _, key in conditions]).fetchone()[0]
+
+    def snapshot(self) -> dict:
+        """Estado atual para exibição, lido numa única transação."""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            labels = dict(conn.execute("SELECT key, label FROM labels").fetchall())
+
+            def label(field: str, key: str) -> str:
+                return labels.get(f"{field}:{key}", key)
+
+            counts = {field: {label(field, key): n for key, n in conn.execute(
+                f"SELECT {field}, SUM(n) AS total FROM combinations WHERE {field} != '' "
+                f"GROUP BY {field} HAVING total > 0 ORDER BY total DESC")}
+                for field in DIMENSIONS}
+            histograms: dict[str, list[int]] = {}
+            for player, bin_index, n in conn.execute("SELECT player, bin, n FROM score_histogram"):
+                histograms.setdefault(player, [0] * SCORE_BINS)[bin_index] = n
+            sizes = dict(conn.execute("SELECT cluster, n FROM clusters").fetchall())
+            top_keys: dict[tuple[int, str], list[str]] = {}
+            for cluster, field, key, _ in conn.execute(
+                    "SELECT cluster, field, key, n FROM cluster_profiles WHERE n > 0 ORDER BY n DESC"):
+                keys = top_keys.setdefault((cluster, field), [])
+                if len(keys) < 3:
+                    keys.append(label(field, key))
+            snapshot = {
+                "total": conn.execute("SELECT COALESCE(SUM(n), 0) FROM combinations").fetchone()[0],
+                "counts": counts,
+                "score_histogram": histograms.pop("", [0] * SCORE_BINS),
+                "player_score_histograms": histograms,
+                "clusters": [{"size": sizes.get(cluster, 0),
+                              **{field: top_keys.get((cluster, field), []) for field in DIMENSIONS}}
+                             for cluster in range(max(len(sizes), self.n_clusters))],
+                "pending_vectors": conn.execute("SELECT COUNT(*) FROM pending_vectors").fetchone()[0],
+            }
+        finally:
+            conn.execute("COMMIT")
+        return snapshot
+
+
+@st.cache_resource
+def load_audience_analytics(path: str = AGGREGATES_PATH) -> AudienceAggregates | None:
+    """Agregados da audiência (banco criado vazio se não existir)."""
+    try:
+        analytics = AudienceAggregates(path)
+        print(f"Agregados da audiência carregados ({analytics.count()} perfis).")
+        return analytics
+    except Exception as e:
+        print(f"Erro ao carregar agregados da audiência de {path}: {e}")
+        return None
+
+
+def rebuild_aggregates(storage, path: str = AGGREGATES_PATH, fan_index=None, page_size: int = 5000,
+                       n_clusters: int = N_CLUSTERS, batch_size: int = CLUSTER_BATCH_SIZE) -> AudienceAggregates:
+    """Recalcula tudo a partir dos perfis salvos e dos vetores do índice de fãs (quando houver)."""
+    rows = {fan_id: row for row, fan_id in enumerate(fan_index.ids)} if fan_index is not None else {}
+    aggregates = AudienceAggregates(path, n_clusters, batch_size)
+    aggregates.clear()
+    total = 0
+    for page in storage.iter_users(page_size=page_size):
+        aggregates.record_many([(record, fan_index.vectors[rows[key]] if key in rows else None, key)
+                                for key, record in page])
+        total += len(page)
+        print(f"  {total} perfis agregados.")
+    return aggregates
+
+
+def main():
+    from utils.ann_index import open_persistent_index
+    from utils.rematch_users import open_storage
+    from utils.vectorizer import FAN_INDEX_PATH, FAN_VECTOR_LOG_PATH
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Reconstrói os agregados da audiência a partir dos perfis salvos.")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "firebase"), choices=["firebase", "sqlite"])
+    parser.add_argument("--sqlite-path", default=os.getenv("SQLITE_STORAGE_PATH", 'data/users.sqlite3'))
+    parser.add_argument("--fan-index", default=FAN_INDEX_PATH, help="Snapshot do índice de fãs com os vetores.")
+    parser.add_argument("--fan-log", default=FAN_VECTOR_LOG_PATH, help="Log de inserções do índice de fãs.")
+    parser.add_argument("--output", default=AGGREGATES_PATH, help="Banco SQLite dos agregados.")
+    parser.add_argument("--clusters", type=int, default=N_CLUSTERS)
+    parser.add_argument("--batch-size", type=int, default=CLUSTER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fan_index = open_persistent_index(args.fan_index, args.fan_log) \
+        if os.path.exists(args.fan_index) or os.path.exists(args.fan_log) else None
+    aggregates = rebuild_aggregates(open_storage(args.storage, args.sqlite_path), args.output, fan_index,
+                                    n_clusters=args.clusters, batch_size=args.batch_size)
+    print(json.dumps(aggregates.snapshot(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
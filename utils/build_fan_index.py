@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.ann_index import IVFIndex, VectorLog, create_ann_index
+from utils.compute_scheduler import WORKLOAD_BATCH, apply_thread_budget
+from utils.embedding_cache import EmbeddingCache
+from utils.rematch_users import open_storage
+from utils.storage_backends import StorageBackend
+from utils.vectorizer import (EMBEDDING_BACKENDS, FAN_INDEX_PATH, FAN_VECTOR_LOG_PATH, MODEL_NAME, create_model,
+                              embedding_model_id, get_vectors, prepare_user_text)
+
+# --- Configurações ---
+# Executar a partir da raiz do projeto: python -m utils.build_fan_index --help
+PAGE_SIZE = 5000
+BATCH_SIZE = 256
+
+
+def build_fan_index(storage: StorageBackend, model, log: VectorLog, log_seq: int, cache: EmbeddingCache | None = None,
+                    kind: str = "ivf", dim: int = 768, page_size: int = PAGE_SIZE, batch_size: int = BATCH_SIZE):
+    """
+    Constrói o índice de fãs do zero. Primeiro entram os vetores do log de inserções até
+    `log_seq` (inclusive fãs cujo perfil ainda está na fila de escritas); depois, os perfis salvos
+    que não estão no log, com os textos codificados em lote (repetidos uma vez só, com o cache de
+    embeddings do app). No IVF, um treino final usa amostra de toda a base (o treino automático
+    só vê os primeiros perfis). Um perfil salvo durante a construção pode entrar pelo
+    armazenamento e de novo pelo log depois de `log_seq`: o índice mantém um vetor por id.
+    """
+    index = create_ann_index(kind, dim, **({"background_training": False} if kind == "ivf" else {}))
+    _, logged_ids, logged_vectors = log.since(0, dim, until=log_seq)
+    if logged_ids:
+        index.add(logged_ids, logged_vectors)
+    logged = set(logged_ids)
+    print(f"  {len(index)} vetores lidos do log (até a posição {log_seq}).")
+
+    start_time = time.perf_counter()
+    processed = 0
+    for page in storage.iter_users(page_size=page_size):
+        page = [(key, record) for key, record in page if key not in logged]
+        texts = {key: prepare_user_text(record) for key, record in page}
+        unique_texts = sorted({text for text in texts.values() if text})
+        processed += len(page)
+        if not unique_texts:
+            continue
+        vectors = get_vectors(unique_texts, model, cache, batch_size=batch_size)
+        rows = {text: row for row, text in enumerate(unique_texts)}
+        keys = [key for key, _ in page if texts[key]]
+        index.add(keys, vectors[[rows[texts[key]] for key in keys]])
+        elapsed = time.perf_counter() - start_time
+        print(f"  {processed} perfis lidos, {len(index)} vetores no índice ({processed / elapsed:.0f} perfis/s).")
+
+    if isinstance(index, IVFIndex) and len(index):
+        start = time.perf_counter()
+        index.train()
+        print(f"IVF treinado com {index.n_lists} listas em {time.perf_counter() - start:.1f}s.")
+    return index
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Constrói o índice de fãs a partir de todos os perfis salvos.")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "firebase"), choices=["firebase", "sqlite"])
+    parser.add_argument("--sqlite-path", default=os.getenv("SQLITE_STORAGE_PATH", 'data/users.sqlite3'))
+    parser.add_argument("--output", default=FAN_INDEX_PATH, help="Snapshot do índice de fãs.")
+    parser.add_argument("--log", default=FAN_VECTOR_LOG_PATH, help="Log de inserções compartilhado com o app.")
+    parser.add_argument("--kind", default="ivf", choices=["ivf", "brute"])
+    parser.add_argument("--model", default=MODEL_NAME, help="Modelo Sentence Transformer.")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Usuários lidos por página.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tamanho do lote de codificação.")
+    parser.add_argument("--embedding-cache", default="data/embedding_cache.sqlite3",
+                        help="Cache de embeddings compartilhado com o app (vazio para desativar).")
+    args = parser.parse_args()
+
+    apply_thread_budget(WORKLOAD_BATCH)
+    # Inserções do app feitas durante a construção ficam depois desta posição e são reaplicadas ao abrir.
+    log = VectorLog(args.log)
+    log_seq = log.last_seq()
+    model = create_model(args.model, args.backend)
+    cache = EmbeddingCache(args.embedding_cache, embedding_model_id(args.model, args.backend)) \
+        if args.embedding_cache else None
+
+    index = build_fan_index(open_storage(args.storage, args.sqlite_path), model, log, log_seq, cache, kind=args.kind,
+                            page_size=args.page_size, batch_size=args.batch_size)
+    index.save(args.output, metadata={"log_seq": log_seq})
+    print(json.dumps({"vectors": len(index), "kind": index.kind, "log_seq": log_seq, "output": args.output},
+                     indent=2, ensure_ascii=False))
+    print("Reinicie o app para carregar o novo snapshot.")
+
+
+if __name__ == "__main__":
+    main()
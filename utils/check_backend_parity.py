@@ -0,0 +1,95 @@
+"""
+Compara as rankings de matching de um backend de inferência (int8/onnx) com o fp32 (torch).
+
+Só consultas que não estão entre os candidatos contam: perfis sintéticos de fã e cada
+descrição de `data/players.json` ranqueada contra os demais jogadores (sem ela mesma,
+que seria sempre o top-1 em qualquer backend). A verificação falha se, em qualquer um
+dos dois grupos, o top-1 ou a sobreposição do top-k divergirem além dos limites.
+
+Uso (a partir da raiz do projeto):
+    python -m utils.check_backend_parity --backend int8
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.player_store import normalize_rows
+from utils.vectorizer import EMBEDDING_BACKENDS, MODEL_NAME, create_model
+
+FAN_QUERIES = [
+    "Jogo preferido: Counter-Strike. Role principal: Entry Fragger. Descrição do estilo: jogo agressivo, sempre o primeiro a entrar no bomb.",
+    "Jogo preferido: Counter-Strike. Role principal: AWPer. Descrição do estilo: paciente, seguro o ângulo e espero o pick.",
+    "Jogo preferido: Counter-Strike. Role principal: IGL. Descrição do estilo: gosto de chamar as táticas e ler o adversário.",
+    "Jogo preferido: League of Legends. Role principal: Jungle. Descrição do estilo: faço muitos ganks cedo e controlo objetivos.",
+    "Jogo preferido: League of Legends. Role principal: Support. Descrição do estilo: protejo o ADC e cuido da visão do mapa.",
+    "Jogo preferido: League of Legends. Role principal: Mid. Descrição do estilo: jogo de roaming e pressão nas rotas laterais.",
+]
+
+
+def encode(backend: str, model_name: str, texts: list[str]) -> tuple[np.ndarray, float]:
+    model = create_model(model_name, backend)
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+    return normalize_rows(vectors), time.perf_counter() - start
+
+
+def rankings(player_vectors: np.ndarray, query_vectors: np.ndarray, exclude: np.ndarray | None = None) -> np.ndarray:
+    """Jogadores em ordem de similaridade para cada consulta; `exclude[i]` (>= 0) tira um jogador da consulta i."""
+    scores = query_vectors @ player_vectors.T
+    if exclude is not None:
+        rows = np.flatnonzero(exclude >= 0)
+        scores[rows, exclude[rows]] = -np.inf
+    return np.argsort(-scores, axis=1, kind="stable")
+
+
+def agreement(reference_rank: np.ndarray, candidate_rank: np.ndarray, k: int) -> tuple[float, float]:
+    """(concordância do top-1, sobreposição média do top-k) entre duas rankings."""
+    top1 = float(np.mean(reference_rank[:, 0] == candidate_rank[:, 0]))
+    overlap = float(np.mean([len(set(r[:k]) & set(c[:k])) / k for r, c in zip(reference_rank, candidate_rank)]))
+    return top1, overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", required=True, choices=[b for b in EMBEDDING_BACKENDS if b != "torch"])
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--players", default="data/players.json")
+    parser.add_argument("--k", type=int, default=5, help="Tamanho do top-k comparado.")
+    parser.add_argument("--min-top1-agreement", type=float, default=0.9)
+    parser.add_argument("--min-topk-overlap", type=float, default=0.8)
+    args = parser.parse_args()
+
+    with open(args.players, 'r', encoding='utf-8') as f:
+        player_texts = [text for text in json.load(f).values() if isinstance(text, str) and text]
+    texts = player_texts + FAN_QUERIES
+
+    reference, reference_seconds = encode("torch", args.model, texts)
+    candidate, candidate_seconds = encode(args.backend, args.model, texts)
+
+    n_players = len(player_texts)
+    # Cada jogador, como consulta, é excluído da própria ranking.
+    exclude = np.concatenate([np.arange(n_players), np.full(len(FAN_QUERIES), -1)])
+    reference_rank = rankings(reference[:n_players], reference, exclude)
+    candidate_rank = rankings(candidate[:n_players], candidate, exclude)
+
+    k = min(args.k, n_players - 1)
+    groups = {"fãs sintéticos": slice(n_players, None), "jogadores (sem si mesmos)": slice(0, n_players)}
+    vector_cosine = np.sum(reference * candidate, axis=1)
+
+    print(f"Consultas: {len(FAN_QUERIES)} fãs sintéticos + {n_players} jogadores contra os demais")
+    print(f"Cosseno fp32 vs {args.backend}: média={vector_cosine.mean():.4f}, mínimo={vector_cosine.min():.4f}")
+    ok = True
+    for group, rows in groups.items():
+        top1_agreement, topk_overlap = agreement(reference_rank[rows], candidate_rank[rows], k)
+        print(f"{group}: concordância do top-1 {top1_agreement:.2%}, sobreposição do top-{k} {topk_overlap:.2%}")
+        ok = ok and top1_agreement >= args.min_top1_agreement and topk_overlap >= args.min_topk_overlap
+    print(f"Tempo de codificação: torch={reference_seconds:.2f}s, {args.backend}={candidate_seconds:.2f}s")
+
+    print("Paridade OK." if ok else "Paridade FALHOU: rankings divergem além dos limites.")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Orçamento de CPU por tipo de carga. O torch (embeddings e EasyOCR), o OpenCV e o pool de
+páginas do OCR dimensionam as threads pela máquina inteira; com um encode e um OCR ao mesmo
+tempo no mesmo contêiner, os dois disputam os núcleos e ficam lentos.
+
+Aqui cada carga recebe um número fixo de threads e uma prioridade:
+    encode (interativo) > ocr > batch (re-matching, geração de vetores)
+
+- Dentro de um processo, `ComputeScheduler` limita as threads em uso e atende a fila por
+  prioridade (um encode que chega passa na frente de OCRs e lotes que ainda não começaram).
+  Só no host de modelos (utils/model_host.py) OCR e encode passam pelo mesmo escalonador; no
+  Streamlit e na API ele só enfileira os encodes, e o OCR dos processos do
+  `OCRVerificationService` fica de fora.
+- Entre processos (workers de OCR, jobs batch), `apply_thread_budget` ajusta as threads do
+  torch/OpenCV e o `nice` do processo, para o sistema operacional preferir o interativo.
+
+Perfis por tamanho de deployment (`COMPUTE_PROFILE`): small, medium, large ou auto (pelo
+número de CPUs); cada valor pode ser sobrescrito com COMPUTE_<CAMPO>, ex.: COMPUTE_OCR_THREADS=2.
+"""
+import heapq
+import itertools
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, replace
+
+from utils.metrics import REGISTRY
+
+WORKLOAD_ENCODE = "encode"
+WORKLOAD_OCR = "ocr"
+WORKLOAD_BATCH = "batch"
+# Menor valor = maior prioridade.
+WORKLOAD_PRIORITY = {WORKLOAD_ENCODE: 0, WORKLOAD_OCR: 1, WORKLOAD_BATCH: 2}
+WORKLOAD_NICE = {WORKLOAD_ENCODE: 0, WORKLOAD_OCR: 5, WORKLOAD_BATCH: 10}
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@dataclass(frozen=True)
+class ComputeBudget:
+    """
+    Threads por carga e tamanho dos pools.
+
+    Attributes:
+        cpu_slots: threads que o escalonador do processo deixa rodar ao mesmo tempo;
+        encode_threads: threads do torch por encode interativo;
+        ocr_threads: threads do torch/OpenCV por OCR;
+        batch_threads: threads do torch dos jobs batch;
+        ocr_processes: processos do serviço de OCR (OCR_WORKERS sobrescreve);
+        ocr_page_workers: páginas de um mesmo PDF em OCR ao mesmo tempo (OCR_PAGE_WORKERS sobrescreve).
+    """
+    cpu_slots: int
+    encode_threads: int
+    ocr_threads: int
+    batch_threads: int
+    ocr_processes: int
+    ocr_page_workers: int
+
+    @property
+    def ocr_total_threads(self) -> int:
+        """Threads de OCR com todos os processos e páginas ocupados (fora do escalonador do processo)."""
+        return self.ocr_processes * self.ocr_page_workers * self.ocr_threads
+
+    def threads_for(self, workload: str) -> int:
+        return {WORKLOAD_ENCODE: self.encode_threads, WORKLOAD_OCR: self.ocr_threads,
+                WORKLOAD_BATCH: self.batch_threads}[workload]
+
+
+# Os processos de OCR não passam pelo `ComputeScheduler` do processo do app: cada perfil mantém
+# ocr_processes × ocr_page_workers × ocr_threads <= cpu_slots - encode_threads, para o OCR
+# nunca ocupar os núcleos reservados ao encode interativo.
+DEPLOYMENT_PROFILES = {
+    # 2 vCPUs: um núcleo para o interativo, o outro para OCR e batch.
+    "small": ComputeBudget(cpu_slots=2, encode_threads=1, ocr_threads=1, batch_threads=1,
+                           ocr_processes=1, ocr_page_workers=1),
+    # 4 vCPUs
+    "medium": ComputeBudget(cpu_slots=4, encode_threads=2, ocr_threads=1, batch_threads=1,
+                            ocr_processes=2, ocr_page_workers=1),
+    # 8+ vCPUs
+    "large": ComputeBudget(cpu_slots=8, encode_threads=4, ocr_threads=2, batch_threads=2,
+                           ocr_processes=2, ocr_page_workers=1),
+}
+
+
+def profile_for_cpus(cpu_count: int) -> str:
+    if cpu_count <= 2:
+        return "small"
+    return "medium" if cpu_count < 8 else "large"
+
+
+def configured_budget() -> ComputeBudget:
+    """Orçamento do perfil em COMPUTE_PROFILE (padrão auto), com as sobrescritas COMPUTE_<CAMPO>."""
+    profile = os.getenv("COMPUTE_PROFILE", "auto")
+    if profile == "auto":
+        profile = profile_for_cpus(os.cpu_count() or 1)
+    if profile not in DEPLOYMENT_PROFILES:
+        raise ValueError(f"COMPUTE_PROFILE desconhecido: {profile}. Opções: auto, {', '.join(DEPLOYMENT_PROFILES)}")
+    overrides = {budget_field.name: int(os.environ[f"COMPUTE_{budget_field.name.upper()}"])
+                 for budget_field in fields(ComputeBudget) if os.getenv(f"COMPUTE_{budget_field.name.upper()}")}
+    budget = replace(DEPLOYMENT_PROFILES[profile], **overrides)
+    if budget.ocr_total_threads > budget.cpu_slots - budget.encode_threads:
+        print(f"AVISO: o OCR pode usar {budget.ocr_total_threads} threads ({budget.ocr_processes} processo(s) × "
+              f"{budget.ocr_page_workers} página(s) × {budget.ocr_threads} thread(s)), mais que as "
+              f"{budget.cpu_slots - budget.encode_threads} fora das reservadas ao encode.")
+    return budget
+
+
+def apply_thread_budget(workload: str, budget: ComputeBudget | None = None, threads: int | None = None) -> int:
+    """
+    Limita as threads do processo para a carga `workload` e baixa sua prioridade no sistema
+    operacional (nice) conforme `WORKLOAD_NICE`. Chame no início do processo: as variáveis
+    OMP/MKL só valem para bibliotecas importadas depois; o torch já importado é ajustado na hora.
+
+    Returns:
+        Número de threads aplicado.
+    """
+    threads = threads or (budget or configured_budget()).threads_for(workload)
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if workload == WORKLOAD_OCR:
+        try:
+            import cv2
+
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
+    if hasattr(os, "nice"):
+        increment = WORKLOAD_NICE[workload] - os.nice(0)
+        if increment > 0:
+            os.nice(increment)
+    return threads
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    threads: int = field(compare=False)
+    limit: int = field(compare=False)
+    event: threading.Event = field(compare=False)
+
+
+class ComputeScheduler:
+    """
+    Semáforo com prioridade: cada carga ocupa `threads` das `cpu_slots` vagas do processo
+    enquanto roda. Quem está esperando é atendido por prioridade e, na mesma prioridade, por
+    ordem de chegada; ninguém passa na frente de um pedido de prioridade maior que ainda não
+    coube (cargas em execução não são interrompidas). As vagas de um encode interativo ficam
+    sempre reservadas: OCR e batch juntos nunca ocupam mais que `cpu_slots - encode_threads`.
+    """
+
+    def __init__(self, budget: ComputeBudget):
+        self.budget = budget
+        self.capacity = budget.cpu_slots
+        self._in_use = 0
+        self._waiting: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _threads(self, workload: str, threads: int | None) -> int:
+        return min(threads or self.budget.threads_for(workload), self.capacity)
+
+    def _limit(self, workload: str, threads: int) -> int:
+        if workload == WORKLOAD_ENCODE:
+            return self.capacity
+        return max(self.capacity - self.budget.encode_threads, threads)
+
+    def _wake(self) -> None:
+        while self._waiting and self._in_use + self._waiting[0].threads <= self._waiting[0].limit:
+            waiter = heapq.heappop(self._waiting)
+            self._in_use += waiter.threads
+            waiter.event.set()
+
+    def acquire(self, workload: str, threads: int | None = None) -> int:
+        """Bloqueia até haver vaga para a carga. Retorna as threads reservadas (devolva com `release`)."""
+        threads = self._threads(workload, threads)
+        limit = self._limit(workload, threads)
+        priority = WORKLOAD_PRIORITY[workload]
+        with self._lock:
+            # Só quem tem prioridade maior que todos na fila pode entrar direto.
+            if (not self._waiting or priority < self._waiting[0].priority) and self._in_use + threads <= limit:
+                self._in_use += threads
+                return threads
+            waiter = _Waiter(priority, next(self._sequence), threads, limit, threading.Event())
+            heapq.heappush(self._waiting, waiter)
+        REGISTRY.increment("kyf_compute_waits_total", workload=workload)
+        waiter.event.wait()
+        return threads
+
+    def release(self, threads: int) -> None:
+        with self._lock:
+            self._in_use -= threads
+            self._wake()
+
+    @contextmanager
+    def slot(self, workload: str, threads: int | None = None):
+        """Reserva vagas durante o bloco: `with scheduler.slot("ocr"): reader.readtext(...)`."""
+        reserved = self.acquire(workload, threads)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"capacity": self.capacity, "in_use": self._in_use, "waiting": len(self._waiting)}
+
+
+class ScheduledOCRReader:
+    """Envolve um leitor OCR para que cada `readtext` passe pelo escalonador."""
+
+    def __init__(self, reader, scheduler: ComputeScheduler, workload: str = WORKLOAD_OCR):
+        self.reader = reader
+        self.scheduler = scheduler
+        self.workload = workload
+
+    def readtext(self, image, **kwargs) -> list:
+        with self.scheduler.slot(self.workload):
+            return self.reader.readtext(image, **kwargs)
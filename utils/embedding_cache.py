@@ -0,0 +1,141 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+_EVICT_CHECK_INTERVAL = 64
+_STATS_FLUSH_INTERVAL = 32
+_TOUCH_INTERVAL_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza Unicode (NFKC) e espaços, para que textos equivalentes gerem a mesma chave."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class EmbeddingCache:
+    """
+    Cache em disco (SQLite, modo WAL) de embeddings de textos, compartilhado entre
+    processos. A chave é o hash do nome do modelo mais o texto normalizado; a
+    remoção é LRU, limitada a `max_entries` entradas.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = 100_000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._session_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._puts_since_check = 0
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Uma conexão por thread; o SQLite serializa a escrita entre processos."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key_for(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._pending_stats[name] += amount
+            self._session_stats[name] += amount
+            pending = sum(self._pending_stats.values())
+        if pending >= _STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def flush_stats(self) -> None:
+        """Soma os contadores acumulados neste processo aos contadores persistidos."""
+        with self._lock:
+            pending = self._pending_stats
+            self._pending_stats = {name: 0 for name in pending}
+        self._connection().executemany(
+            "UPDATE stats SET value = value + ? WHERE name = ?",
+            [(value, name) for name, value in pending.items() if value])
+
+    def get(self, text: str) -> np.ndarray | None:
+        """Retorna o vetor em cache para o texto, ou None."""
+        key = self.key_for(text)
+        conn = self._connection()
+        row = conn.execute("SELECT vector, last_access FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+
+        now = time.time()
+        if now - row[1] > _TOUCH_INTERVAL_SECONDS:
+            conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        """Armazena o vetor (float32) do texto, removendo as entradas mais antigas se passar do limite."""
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+            (self.key_for(text), blob, time.time()))
+
+        with self._lock:
+            self._puts_since_check += 1
+            should_check = self._puts_since_check >= _EVICT_CHECK_INTERVAL
+            if should_check:
+                self._puts_since_check = 0
+        if should_check:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove as entradas menos usadas até ficar em 90% de `max_entries`. Retorna quantas removeu."""
+        conn = self._connection()
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if total <= self.max_entries:
+            return 0
+        excess = total - int(self.max_entries * 0.9)
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)", (excess,))
+        self._count("evictions", excess)
+        return excess
+
+    def stats(self) -> dict:
+        """Contadores deste processo ('session') e totais persistidos de todos os processos ('total')."""
+        self.flush_stats()
+        conn = self._connection()
+        totals = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        with self._lock:
+            session = dict(self._session_stats)
+        lookups = totals.get("hits", 0) + totals.get("misses", 0)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "session": session,
+            "total": totals,
+            "hit_rate": totals.get("hits", 0) / lookups if lookups else 0.0,
+        }
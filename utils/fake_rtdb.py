@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+import uuid
+
+
+class FakeRTDB:
+    """
+    Banco em memória que imita a API de referências do `firebase_admin.db`
+    (`reference(path)` com `get`, `set`, `push` e `update` multi-caminho), para
+    testar o fluxo de escrita e rodar benchmarks sem credenciais.
+
+    Args:
+        latency_seconds: atraso artificial por operação de escrita;
+        fail_next: quantidade de próximas escritas que devem falhar.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, fail_next: int = 0):
+        self.data: dict = {}
+        self.latency_seconds = latency_seconds
+        self.fail_next = fail_next
+        self.write_calls = 0
+        self._lock = threading.Lock()
+
+    def reference(self, path: str = '/') -> "FakeReference":
+        return FakeReference(self, path)
+
+    def _before_write(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.write_calls += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise ConnectionError("Falha simulada do FakeRTDB.")
+
+    @staticmethod
+    def _split(path: str) -> list[str]:
+        return [part for part in path.split('/') if part]
+
+    def _get(self, parts: list[str]):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, parts: list[str], value) -> None:
+        if not parts:
+            self.data = copy.deepcopy(value) if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+
+class FakeReference:
+    def __init__(self, database: FakeRTDB, path: str):
+        self._db = database
+        self.path = path
+        self._parts = FakeRTDB._split(path)
+        self.key = self._parts[-1] if self._parts else None
+
+    def child(self, path: str) -> "FakeReference":
+        return FakeReference(self._db, '/'.join(self._parts + FakeRTDB._split(path)))
+
+    def get(self):
+        with self._db._lock:
+            return self._db._get(self._parts)
+
+    def set(self, value) -> None:
+        self._db._before_write()
+        with self._db._lock:
+            self._db._set(self._parts, value)
+
+    def push(self, value=None) -> "FakeReference":
+        self._db._before_write()
+        child = self.child(uuid.uuid4().hex)
+        with self._db._lock:
+            self._db._set(child._parts, value if value is not None else {})
+        return child
+
+    def update(self, value: dict) -> None:
+        """Atualização multi-caminho: cada chave pode ser um caminho relativo ('users/abc')."""
+        self._db._before_write()
+        with self._db._lock:
+            for relative_path, child_value in value.items():
+                self._db._set(self._parts + FakeRTDB._split(relative_path), child_value)
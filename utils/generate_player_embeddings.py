@@ -1,70 +1,147 @@
+import argparse
 import json
 import os
+import time
+from collections.abc import Iterator
 
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from utils.compute_scheduler import WORKLOAD_BATCH, apply_thread_budget
+from utils.player_store import open_player_store, save_player_store, text_hash
+from utils.vectorizer import EMBEDDING_BACKENDS, create_model
+
 # --- Configurações ---
-INPUT_JSON_PATH = '../data/players.json'
-OUTPUT_JSON_PATH = '../data/players_vectors.json'
+# Executar a partir da raiz do projeto: python -m utils.generate_player_embeddings --help
+INPUT_JSON_PATH = 'data/players.json'
+OUTPUT_STORE_PATH = 'data/players_vectors.npy'
 MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+BATCH_SIZE = 32
 
 
-def generate_embeddings():
-    """
-    Carrega os dados dos jogadores, gera embeddings para suas descrições
-    e salva um novo JSON com nome, texto original e embedding.
-    """
-    print(f"Carregando o modelo Sentence Transformer...")
-    model = SentenceTransformer(MODEL_NAME)
-    print("Modelo carregado com sucesso.")
-
-    if not os.path.exists(INPUT_JSON_PATH):
-        print(f"ERRO: Arquivo de entrada '{INPUT_JSON_PATH}' não encontrado.")
-        return
+def load_players(input_path: str) -> list[dict] | None:
+    """Lê o JSON {nome: descrição} e retorna apenas as entradas com descrição válida."""
+    if not os.path.exists(input_path):
+        print(f"ERRO: Arquivo de entrada '{input_path}' não encontrado.")
+        return None
 
-    print(f"Lendo dados dos jogadores de '{INPUT_JSON_PATH}'...")
+    print(f"Lendo dados dos jogadores de '{input_path}'...")
     try:
-        with open(INPUT_JSON_PATH, 'r', encoding='utf-8') as f:
+        with open(input_path, 'r', encoding='utf-8') as f:
             players_data = json.load(f)
     except json.JSONDecodeError as e:
         print(f"ERRO: Falha ao decodificar o JSON de entrada: {e}")
-        return
+        return None
     except Exception as e:
         print(f"ERRO inesperado ao ler o arquivo de entrada: {e}")
-        return
-
-    player_embeddings_list = []
-    total_players = len(players_data)
-    print(f"Gerando embeddings para {total_players} jogadores...")
-
-    for i, (player_name, description_text) in enumerate(players_data.items()):
-        print(f"  Processando [{i + 1}/{total_players}]: {player_name}")
+        return None
 
+    players = []
+    for player_name, description_text in players_data.items():
         if not isinstance(description_text, str) or not description_text:
-            print(f"    AVISO: Descrição inválida ou vazia para {player_name}. Pulando.")
+            print(f"  AVISO: Descrição inválida ou vazia para {player_name}. Pulando.")
             continue
+        players.append({"name": player_name, "text": description_text})
+    return players
+
+
+def load_cached_embeddings(output_path: str, model_name: str, backend: str) -> dict[str, np.ndarray]:
+    """
+    Lê a store existente e retorna {hash do texto: vetor}, para reaproveitar
+    embeddings de descrições que não mudaram. Ignora stores de outro modelo ou backend.
+    """
+    if not os.path.exists(output_path):
+        return {}
+    try:
+        store = open_player_store(output_path)
+    except Exception as e:
+        print(f"AVISO: Store existente em '{output_path}' ilegível, tudo será recalculado: {e}")
+        return {}
+    if store.model_name != model_name or store.backend != backend:
+        print(f"AVISO: Store existente foi gerada com '{store.model_name}' (backend {store.backend}), "
+              f"tudo será recalculado.")
+        return {}
+    return {text_hash(text): np.array(store.matrix[row]) for row, text in enumerate(store.texts)}
 
-        try:
-            embedding = model.encode(description_text, convert_to_numpy=True)
 
-            embedding_list = embedding.tolist()
+def encode_in_batches(model: SentenceTransformer, texts: list[str], batch_size: int) -> Iterator[np.ndarray]:
+    """Codifica os textos em lotes de `batch_size`, entregando cada lote assim que fica pronto."""
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        yield model.encode(batch, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        print(f"  Codificados [{min(start + batch_size, len(texts))}/{len(texts)}]")
 
-            player_embeddings_list.append({
-                "name": player_name,
-                "text": description_text,
-                "embedding": embedding_list
-            })
-        except Exception as e:
-            print(f"Erro ao processar {player_name}: {e}")
 
-    print(f"\nSalvando os dados processados em '{OUTPUT_JSON_PATH}'...")
+def generate_embeddings(input_path: str = INPUT_JSON_PATH, output_path: str = OUTPUT_STORE_PATH,
+                        model_name: str = MODEL_NAME, batch_size: int = BATCH_SIZE, force: bool = False,
+                        backend: str = "torch") -> bool:
+    """
+    Carrega os dados dos jogadores, gera embeddings em lote apenas para descrições
+    novas ou alteradas e salva a matriz float32 normalizada (.npy) com um sidecar
+    JSON de nomes e textos. O `backend` deve ser o mesmo usado pelo app (EMBEDDING_BACKEND),
+    para que os scores sejam comparáveis.
+    """
+    start_time = time.time()
+
+    players = load_players(input_path)
+    if players is None:
+        return False
+    if not players:
+        print("ERRO: Nenhuma descrição válida encontrada, nada a salvar.")
+        return False
+
+    cached = {} if force else load_cached_embeddings(output_path, model_name, backend)
+    hashes = [text_hash(player["text"]) for player in players]
+    pending_rows = [row for row, h in enumerate(hashes) if h not in cached]
+    print(f"{len(players)} jogadores: {len(players) - len(pending_rows)} reaproveitados, "
+          f"{len(pending_rows)} a codificar.")
+
+    model = None
+    if pending_rows:
+        model = create_model(model_name, backend)
+        dim = model.get_sentence_embedding_dimension()
+    else:
+        dim = next(iter(cached.values())).shape[0]
+
+    embeddings = np.empty((len(players), dim), dtype=np.float32)
+    for row, h in enumerate(hashes):
+        if h in cached:
+            embeddings[row] = cached[h]
+
+    if model is not None:
+        print(f"Gerando embeddings em lotes de {batch_size}...")
+        pending_texts = [players[row]["text"] for row in pending_rows]
+        offset = 0
+        for batch_vectors in encode_in_batches(model, pending_texts, batch_size):
+            batch_rows = pending_rows[offset:offset + len(batch_vectors)]
+            embeddings[batch_rows] = batch_vectors
+            offset += len(batch_vectors)
+
+    print(f"\nSalvando os dados processados em '{output_path}'...")
     try:
-        with open(OUTPUT_JSON_PATH, 'w', encoding='utf-8') as f:
-            json.dump(player_embeddings_list, f, indent=2, ensure_ascii=False)
-        print("Arquivo de embeddings salvo com sucesso!")
+        save_player_store(output_path, players, embeddings, model_name=model_name, backend=backend)
+        print(f"Arquivo de embeddings salvo com sucesso! ({time.time() - start_time:.2f} segundos)")
+        return True
     except Exception as e:
         print(f"Erro inesperado ao salvar o arquivo de saída: {e}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera a store de embeddings dos jogadores.")
+    parser.add_argument("--input", default=INPUT_JSON_PATH, help="JSON {nome: descrição} dos jogadores.")
+    parser.add_argument("--output", default=OUTPUT_STORE_PATH, help="Arquivo .npy de saída (sidecar .meta.json).")
+    parser.add_argument("--model", default=MODEL_NAME, help="Modelo Sentence Transformer.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tamanho do lote de codificação.")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS,
+                        help="Backend de inferência (o mesmo do app).")
+    parser.add_argument("--force", action="store_true", help="Recalcula todos os embeddings, ignorando o cache.")
+    args = parser.parse_args()
+
+    apply_thread_budget(WORKLOAD_BATCH)
+    ok = generate_embeddings(args.input, args.output, args.model, args.batch_size, args.force, args.backend)
+    raise SystemExit(0 if ok else 1)
 
 
 if __name__ == "__main__":
-    generate_embeddings()
+    main()
@@ -0,0 +1,301 @@
+"""
+Métricas do caminho crítico: spans de tempo por etapa alimentam histogramas
+exportados no formato texto do Prometheus, e um gancho opcional de profiling
+(cProfile ou amostragem de pilhas) pode ser ligado para requisições individuais.
+
+    with span("encode"):
+        ...
+
+    start_metrics_server(9100)  # GET /metrics
+
+Cada processo tem o próprio registro; os workers do pool de OCR devolvem os spans
+junto com o resultado (`collect_spans`) para que o processo pai os registre.
+"""
+import collections
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_METRIC = "kyf_stage_duration_seconds"
+STAGE_ERRORS_METRIC = "kyf_stage_errors_total"
+PROFILES_DIR = 'data/profiles'
+
+
+class Histogram:
+    """Histograma cumulativo no modelo do Prometheus (buckets `le`, soma e contagem)."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Histogramas, contadores e gauges identificados por (nome, labels)."""
+
+    def __init__(self):
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = collections.defaultdict(float)
+        self._gauges: dict[tuple[str, tuple], float] = {}
+        self._help: dict[str, str] = {
+            STAGE_METRIC: "Duração de cada etapa do pipeline.",
+            STAGE_ERRORS_METRIC: "Etapas que terminaram com exceção.",
+        }
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1.0, **labels) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def snapshot(self) -> dict[str, dict]:
+        """Resumo {stage: {count, sum_seconds}} do histograma de etapas (usado em logs e no /health)."""
+        with self._lock:
+            return {dict(labels).get("stage", ""): {"count": h.count, "sum_seconds": round(h.total, 6)}
+                    for (name, labels), h in self._histograms.items() if name == STAGE_METRIC}
+
+    @staticmethod
+    def _labels(labels: tuple, extra: dict | None = None) -> str:
+        items = list(labels) + list((extra or {}).items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in items) + "}"
+
+    def render(self) -> str:
+        """Exposição no formato texto do Prometheus (versão 0.0.4)."""
+        lines = []
+        with self._lock:
+            for metric_type, series in (("histogram", self._histograms), ("counter", self._counters),
+                                        ("gauge", self._gauges)):
+                for name in sorted({name for name, _ in series}):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if metric_type != "histogram":
+                            lines.append(f"{name}{self._labels(labels)} {value}")
+                            continue
+                        for bound, count in zip(value.buckets, value.counts):
+                            lines.append(f"{name}_bucket{self._labels(labels, {'le': bound})} {count}")
+                        lines.append(f"{name}_bucket{self._labels(labels, {'le': '+Inf'})} {value.count}")
+                        lines.append(f"{name}_sum{self._labels(labels)} {value.total}")
+                        lines.append(f"{name}_count{self._labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+_collector = threading.local()
+
+
+def record_span(stage: str, seconds: float, error: bool = False) -> None:
+    REGISTRY.observe(STAGE_METRIC, seconds, stage=stage)
+    if error:
+        REGISTRY.increment(STAGE_ERRORS_METRIC, stage=stage)
+    spans = getattr(_collector, "spans", None)
+    if spans is not None:
+        spans.append((stage, seconds, error))
+
+
+@contextmanager
+def span(stage: str):
+    """Mede a duração do bloco e a registra no histograma da etapa (erros também são contados)."""
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start, error)
+
+
+def timed(stage: str):
+    """Decorador equivalente a envolver a função inteira em `span(stage)`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_spans():
+    """Guarda também numa lista os spans da thread atual (para devolvê-los de outro processo)."""
+    previous = getattr(_collector, "spans", None)
+    spans: list[tuple[str, float, bool]] = []
+    _collector.spans = spans
+    try:
+        yield spans
+    finally:
+        _collector.spans = previous
+
+
+def record_spans(spans: list[tuple[str, float, bool]]) -> None:
+    """Registra spans coletados em outro processo."""
+    for stage, seconds, error in spans:
+        record_span(stage, seconds, error)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """Sobe o endpoint /metrics numa thread em segundo plano. Retorna None se a porta estiver ocupada."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Não foi possível abrir o endpoint de métricas em {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Métricas disponíveis em http://{host}:{port}/metrics")
+    return server
+
+
+class SamplingProfiler:
+    """
+    Amostrador de pilhas no estilo do py-spy: uma thread lê periodicamente o frame
+    atual da thread alvo e conta as pilhas no formato "collapsed" (uma linha por
+    pilha, frames separados por ';'), que pode ser convertido em flame graph.
+    """
+
+    def __init__(self, thread_id: int | None = None, interval_seconds: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval_seconds = interval_seconds
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+PROFILING_MODES = ("cprofile", "sampling")
+
+
+class RequestProfiler:
+    """
+    Perfila um trecho entre `start()` e `stop()`: 'cprofile' grava .prof e imprime as
+    funções mais caras; 'sampling' grava as pilhas amostradas em .folded.
+    """
+
+    def __init__(self, name: str, mode: str, output_dir: str = PROFILES_DIR):
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Modo de profiling desconhecido: {mode}. Opções: {', '.join(PROFILING_MODES)}")
+        self.name = name
+        self.mode = mode
+        self.output_dir = output_dir
+        self._profiler: cProfile.Profile | None = None
+        self._sampler: SamplingProfiler | None = None
+
+    def start(self) -> "RequestProfiler":
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = SamplingProfiler().start()
+        return self
+
+    def stop(self) -> str:
+        """Encerra e grava o perfil. Retorna o caminho do arquivo."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_path = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        if self._profiler is not None:
+            self._profiler.disable()
+            path = f"{base_path}.prof"
+            self._profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+            print(f"Profile de '{self.name}' salvo em {path}\n{summary.getvalue()}")
+            return path
+        self._sampler.stop()
+        path = f"{base_path}.folded"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self._sampler.collapsed())
+        print(f"Amostras de pilha de '{self.name}' salvas em {path} ({sum(self._sampler.stacks.values())} amostras).")
+        return path
+
+
+@contextmanager
+def profile_request(name: str, mode: str | None = None, output_dir: str = PROFILES_DIR):
+    """Perfila o bloco no modo informado ('cprofile' ou 'sampling'); com `mode` vazio, não faz nada."""
+    if not mode:
+        yield
+        return
+    profiler = RequestProfiler(name, mode, output_dir).start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+
+
+def profiling_enabled() -> bool:
+    """O profiling por requisição só é aceito com PROFILING_ENABLED=1."""
+    return os.getenv("PROFILING_ENABLED") == "1"
@@ -0,0 +1,233 @@
+"""
+Host local de modelos: um único processo carrega o Sentence Transformer e o
+EasyOCR e atende os processos do Streamlit/API por um socket Unix, para que a
+memória da máquina não cresça a cada worker de interface adicionado.
+
+Uso:
+    python -m utils.model_host --socket /tmp/know-your-fan-models.sock
+    MODEL_HOST_SOCKET=/tmp/know-your-fan-models.sock streamlit run main.py
+"""
+import argparse
+import os
+import queue
+import threading
+from multiprocessing.connection import Client, Connection, Listener
+
+import numpy as np
+
+from utils.compute_scheduler import (WORKLOAD_ENCODE, WORKLOAD_OCR, ComputeBudget, ComputeScheduler,
+                                     apply_thread_budget, configured_budget)
+
+DEFAULT_SOCKET_PATH = "/tmp/know-your-fan-models.sock"
+
+
+def configured_model_host() -> str | None:
+    """Caminho do socket do host de modelos (MODEL_HOST_SOCKET), ou None para carregar localmente."""
+    return os.getenv("MODEL_HOST_SOCKET") or None
+
+
+def _authkey() -> bytes | None:
+    authkey = os.getenv("MODEL_HOST_AUTHKEY")
+    return authkey.encode() if authkey else None
+
+
+class ModelHostClient:
+    """
+    Conexão com o host de modelos. Cada thread usa a própria conexão (as conexões
+    do `multiprocessing` não são thread-safe). Uma conexão quebrada é refeita uma vez, só
+    quando o envio falha: depois de enviado, o pedido nunca é repetido (o host pode já estar
+    processando), e um `TimeoutError` sobe direto para quem chamou.
+    """
+
+    def __init__(self, socket_path: str, timeout_seconds: float = 120.0):
+        self.socket_path = socket_path
+        self.timeout_seconds = timeout_seconds
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.socket_path, family="AF_UNIX", authkey=_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, operation: str, *args):
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send((operation, args))
+                break
+            except (EOFError, ConnectionError, OSError):
+                self._drop_connection()
+                if attempt:
+                    raise
+        try:
+            ready = conn.poll(self.timeout_seconds)
+            if ready:
+                status, result = conn.recv()
+        except (EOFError, ConnectionError, OSError):
+            self._drop_connection()
+            raise
+        if not ready:
+            # A resposta atrasada chegaria na próxima chamada: a conexão é descartada.
+            self._drop_connection()
+            raise TimeoutError(f"Host de modelos não respondeu a '{operation}' em {self.timeout_seconds:.0f}s.")
+        if status == "error":
+            raise RuntimeError(f"Erro no host de modelos ({operation}): {result}")
+        return result
+
+    def info(self) -> dict:
+        return self.call("info")
+
+
+class RemoteModel:
+    """Substituto do `SentenceTransformer` que codifica no host de modelos (mesma assinatura de `encode`)."""
+
+    def __init__(self, client: ModelHostClient):
+        self.client = client
+        info = client.info()
+        self.model_name = info["model_name"]
+        self.backend = info["backend"]
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        vectors = self.client.call("encode", [sentences] if single else list(sentences))
+        return vectors[0] if single else vectors
+
+
+class RemoteOCRReader:
+    """Substituto do `easyocr.Reader` que executa o `readtext` no host de modelos."""
+
+    def __init__(self, client: ModelHostClient):
+        self.client = client
+
+    def readtext(self, image: np.ndarray, **kwargs) -> list:
+        return self.client.call("readtext", np.ascontiguousarray(image), kwargs)
+
+
+def connect_model_host(socket_path: str | None = None) -> ModelHostClient | None:
+    """Cliente do host configurado, ou None se MODEL_HOST_SOCKET não estiver definida."""
+    socket_path = socket_path or configured_model_host()
+    return ModelHostClient(socket_path) if socket_path else None
+
+
+class ModelHost:
+    """
+    Processo dono dos modelos. Textos de conexões diferentes entram no mesmo
+    `MicroBatchEncoder`, então pedidos simultâneos de vários workers viram um lote só.
+    Cada leitor EasyOCR atende um `readtext` por vez; com `ocr_readers` leitores (padrão:
+    `ocr_processes` do orçamento), até esse número de OCRs roda em paralelo, ao custo da
+    memória de um leitor a mais por vaga.
+    """
+
+    def __init__(self, socket_path: str, model_name: str, backend: str = "torch", load_ocr: bool = True,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, budget: ComputeBudget | None = None,
+                 ocr_readers: int | None = None):
+        from utils.ocr import create_ocr_reader
+        from utils.vectorizer import MicroBatchEncoder, create_model
+
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.backend = backend
+        # Encode e OCR dividem os núcleos deste processo; o escalonador dá prioridade ao encode.
+        budget = budget or configured_budget()
+        self.scheduler = ComputeScheduler(budget)
+        self.encoder = MicroBatchEncoder(create_model(model_name, backend), max_batch_size=max_batch_size,
+                                         max_wait_ms=max_wait_ms, scheduler=self.scheduler)
+        self.ocr_readers = (ocr_readers or budget.ocr_processes) if load_ocr else 0
+        self._ocr_pool: queue.Queue = queue.Queue()
+        for _ in range(self.ocr_readers):
+            self._ocr_pool.put(create_ocr_reader())
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        futures = [self.encoder.submit(text) for text in texts]
+        return np.vstack([future.result() for future in futures]) if futures else np.empty((0, 0), np.float32)
+
+    def _readtext(self, image: np.ndarray, kwargs: dict) -> list:
+        if not self.ocr_readers:
+            raise RuntimeError("Host iniciado sem o modelo OCR.")
+        reader = self._ocr_pool.get()
+        try:
+            with self.scheduler.slot(WORKLOAD_OCR):
+                return reader.readtext(image, **kwargs)
+        finally:
+            self._ocr_pool.put(reader)
+
+    def _handle(self, operation: str, args: tuple):
+        if operation == "encode":
+            return self._encode(*args)
+        if operation == "readtext":
+            return self._readtext(*args)
+        if operation == "info":
+            return {"model_name": self.model_name, "backend": self.backend, "ocr": self.ocr_readers > 0,
+                    "ocr_readers": self.ocr_readers,
+                    "pid": os.getpid(), "encoder": self.encoder.stats(), "scheduler": self.scheduler.stats()}
+        raise ValueError(f"Operação desconhecida: {operation}")
+
+    def _serve_connection(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    operation, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self._handle(operation, args))
+                except Exception as e:
+                    reply = ("error", str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        with Listener(self.socket_path, family="AF_UNIX", authkey=_authkey()) as listener:
+            os.chmod(self.socket_path, 0o600)
+            print(f"Host de modelos ouvindo em {self.socket_path} (pid {os.getpid()}).")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Conexão recusada pelo host de modelos: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main():
+    from utils.vectorizer import EMBEDDING_BACKENDS, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Host compartilhado dos modelos de embeddings e OCR.")
+    parser.add_argument("--socket", default=configured_model_host() or DEFAULT_SOCKET_PATH)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--no-ocr", action="store_true", help="Não carrega o EasyOCR.")
+    parser.add_argument("--ocr-readers", type=int, default=int(os.getenv("MODEL_HOST_OCR_READERS", "0")),
+                        help="Leitores EasyOCR em paralelo (0 = ocr_processes do perfil de CPU).")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")),
+                        help="Porta do endpoint /metrics (0 desativa).")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        from utils.metrics import start_metrics_server
+        start_metrics_server(args.metrics_port)
+
+    budget = configured_budget()
+    # O processo roda os dois tipos de carga; o torch recebe o maior dos dois orçamentos.
+    apply_thread_budget(WORKLOAD_ENCODE, threads=max(budget.encode_threads, budget.ocr_threads))
+    ModelHost(args.socket, args.model, args.backend, load_ocr=not args.no_ocr,
+              max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+              max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5")), budget=budget,
+              ocr_readers=args.ocr_readers or None).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+# Partículas comuns em sobrenomes brasileiros; não são exigidas no documento.
+NAME_PARTICLES = frozenset({"da", "das", "de", "do", "dos", "e", "d"})
+# Trocas típicas do OCR em texto que só deveria ter letras.
+OCR_DIGIT_FIXES = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "6": "g", "7": "t", "8": "b"})
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Confiança mínima (média por token) para aceitar o nome, além de todos os tokens encontrados.
+MIN_CONFIDENCE = 0.85
+
+
+def normalize_tokens(text: str, fix_ocr_digits: bool = False) -> list[str]:
+    """Minúsculas, sem acentos (NFKD), separando em tokens alfanuméricos."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    without_marks = "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    if fix_ocr_digits:
+        without_marks = without_marks.translate(OCR_DIGIT_FIXES)
+    return [token for token in _NON_ALNUM.split(without_marks) if token]
+
+
+def max_edits(token: str) -> int:
+    """Distância tolerada para um token do nome: exato até 3 letras, 1 erro até 6, 2 acima disso."""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 6 else 2
+
+
+def bounded_levenshtein(a: str, b: str, bound: int) -> int | None:
+    """
+    Distância de edição entre `a` e `b` se for <= `bound`, senão None. Só calcula a faixa
+    diagonal de largura 2*bound+1, então o custo é O(len(a) * bound).
+    """
+    if abs(len(a) - len(b)) > bound:
+        return None
+    if a == b:
+        return 0
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - bound), min(len(b), i + bound)
+        current = [bound + 1] * (len(b) + 1)
+        current[0] = i if i <= bound else bound + 1
+        for j in range(low, high + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        if min(current[low - 1:high + 1]) > bound:
+            return None
+        previous = current
+    return previous[len(b)] if previous[len(b)] <= bound else None
+
+
+@dataclass
+class NameMatch:
+    """Resultado da verificação: `matched`, confiança em [0, 1] e a melhor distância por token."""
+    matched: bool
+    confidence: float
+    token_distances: dict[str, int | None] = field(default_factory=dict)
+
+
+def candidate_tokens(ocr_text: str) -> frozenset[str]:
+    """Conjunto de tokens do OCR mais as junções de tokens vizinhos ('jo ao' -> 'joao')."""
+    tokens = normalize_tokens(ocr_text, fix_ocr_digits=True)
+    return frozenset(tokens) | frozenset(a + b for a, b in zip(tokens, tokens[1:]))
+
+
+def match_name(ocr_text: str, first_name: str, last_name: str) -> NameMatch:
+    """
+    Verifica se o nome informado aparece no texto do OCR, ignorando acentos, caixa e partículas
+    (da, de, dos...). O primeiro nome precisa aparecer exato ('Maria' não aceita 'Marta'); os
+    tokens do sobrenome toleram até `max_edits` erros de caractere. Todos os tokens precisam ser
+    encontrados e a confiança (média de 1 - distância/tamanho) precisa chegar a `MIN_CONFIDENCE`.
+    Linear no número de tokens do OCR (o nome tem poucos tokens e a distância é limitada).
+    """
+    return match_name_tokens(candidate_tokens(ocr_text), first_name, last_name)
+
+
+def match_name_tokens(candidates: frozenset[str], first_name: str, last_name: str) -> NameMatch:
+    """Como `match_name`, mas a partir de um conjunto já calculado por `candidate_tokens`."""
+    first = [token for token in normalize_tokens(first_name) if token not in NAME_PARTICLES]
+    expected = first + [token for token in normalize_tokens(last_name) if token not in NAME_PARTICLES]
+    if not first:
+        return NameMatch(False, 0.0)
+
+    by_length: dict[int, list[str]] = {}
+    for candidate in candidates:
+        by_length.setdefault(len(candidate), []).append(candidate)
+
+    distances: dict[str, int | None] = {}
+    for token in expected:
+        if token in candidates:
+            distances[token] = 0
+            continue
+        if token == first[0]:
+            distances[token] = None
+            continue
+        bound = max_edits(token)
+        best = None
+        for length in range(len(token) - bound, len(token) + bound + 1):
+            for candidate in by_length.get(length, ()):
+                distance = bounded_levenshtein(token, candidate, bound if best is None else best - 1)
+                if distance is not None:
+                    best = distance
+                    if best <= 1:
+                        break
+            if best is not None and best <= 1:
+                break
+        distances[token] = best
+
+    scores = [1 - distance / len(token) if distance is not None else 0.0 for token, distance in distances.items()]
+    confidence = round(sum(scores) / len(scores), 4)
+    matched = all(distance is not None for distance in distances.values()) and confidence >= MIN_CONFIDENCE
+    return NameMatch(matched, confidence, distances)
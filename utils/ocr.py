@@ -1,86 +1,309 @@
+import os
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-import easyocr
-import fitz
+import numpy as np
 import streamlit as st
-import torch
 
+from utils.compute_scheduler import configured_budget
+from utils.metrics import record_span, span, timed
+from utils.name_matcher import match_name
 
-@st.cache_resource
-def load_ocr_reader():
+if TYPE_CHECKING:
+    import fitz
+
+# Região (frações x0, y0, x1, y1 da página 1) onde fica a frente da CNH Digital, com o campo NOME.
+CNH_NAME_REGION = (0.0, 0.0, 1.0, 0.45)
+TEXT_LAYER_MIN_CHARS = 20
+ROI_OCR_DPI = 150
+FULL_PAGE_OCR_DPI = 300
+# Palavras que indicam, na camada de texto, uma página com a CNH (processada antes das demais).
+CNH_PAGE_KEYWORDS = ("habilitação", "habilitacao", "cnh", "detran")
+# Orçamento por documento: páginas verificadas, tempo total e threads de OCR em paralelo.
+CNH_MAX_PAGES = int(os.getenv("CNH_MAX_PAGES", "4"))
+CNH_TIME_BUDGET_SECONDS = float(os.getenv("CNH_TIME_BUDGET_SECONDS", "20"))
+
+STATUS_VERIFIED = "Verificado com Sucesso"
+STATUS_NAME_NOT_FOUND = "Falha na Verificação (Nome não encontrado)"
+STATUS_NO_TEXT = "Falha na Verificação (OCR não extraiu texto)"
+
+
+@dataclass(frozen=True)
+class CNHVerification:
     """
-    Carrega o leitor OCR com os idiomas especificados.
-    :return: Instância do leitor OCR.
+    Resultado de `verify_cnh_pdf`. `complete` é False quando parte do documento ficou sem leitura
+    (nome encontrado antes do fim do plano de OCR, limite de páginas, prazo ou erro de OCR): o
+    texto pode não ter outro nome que um OCR completo acharia.
+    """
+    status: str
+    text: str | None
+    complete: bool = True
+
+    def as_tuple(self) -> tuple[str, str | None]:
+        return self.status, self.text
+
+
+@timed("ocr_model_load")
+def create_ocr_reader():
+    """
+    Cria o leitor OCR com os idiomas especificados, sem depender do Streamlit
+    (usado também pelos processos do serviço de verificação).
+    :return: Instância do leitor OCR ou None em caso de erro.
     """
     print(f"Carregando modelo EasyOCR...")
     try:
+        import easyocr
+        import torch
+
         reader = easyocr.Reader(['pt'], gpu=torch.cuda.is_available())
         print("Modelo EasyOCR carregado.")
         return reader
     except Exception as e:
         print(f"Erro ao carregar modelo EasyOCR: {e}")
-        st.error(f"Não foi possível carregar o modelo de OCR: {e}")
         return None
 
 
-def verify_name_from_cnh_pdf(pdf_bytes: bytes, first_name: str, last_name: str) -> tuple[str, str | None]:
+@st.cache_resource
+def load_ocr_reader():
     """
-    Tenta extrair texto de um PDF (renderizando como imagem) e verifica
-    se o primeiro e último nome fornecidos estão presentes.
+    Carrega o leitor OCR com os idiomas especificados.
+    Com MODEL_HOST_SOCKET definida, usa o leitor do host compartilhado (`utils.model_host`).
+    :return: Instância do leitor OCR.
     """
-    start_time = time.time()
-    reader = load_ocr_reader()
+    from utils.model_host import RemoteOCRReader, connect_model_host
 
+    host = connect_model_host()
+    reader = RemoteOCRReader(host) if host else create_ocr_reader()
     if reader is None:
-        return "Erro: Modelo OCR não carregado", None
+        st.error("Não foi possível carregar o modelo de OCR.")
+    return reader
 
-    if not pdf_bytes or not first_name or not last_name:
-        return "Erro: Dados de entrada inválidos", None
 
-    extracted_text_all_pages = ""
-    try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        num_pages = len(pdf_document)
-        print(f"Processando PDF com {num_pages} página(s).")
+def ocr_page_workers() -> int:
+    """
+    Páginas de um PDF em OCR ao mesmo tempo: OCR_PAGE_WORKERS ou o orçamento do perfil. Lido a
+    cada documento, não na importação, para valer o ambiente do processo que faz o OCR.
+    """
+    return int(os.getenv("OCR_PAGE_WORKERS", "0")) or configured_budget().ocr_page_workers
+
+
+def _names_found(text: str, first_name: str, last_name: str) -> bool:
+    with span("name_check"):
+        return match_name(text, first_name, last_name).matched
+
+
+def _pixmap_to_array(pix: "fitz.Pixmap") -> np.ndarray:
+    """Expõe as amostras do pixmap como array (sem codificar/decodificar PNG)."""
+    samples = np.frombuffer(pix.samples, dtype=np.uint8)
+    if pix.n == 1:
+        return samples.reshape(pix.height, pix.width)
+    return samples.reshape(pix.height, pix.width, pix.n)
+
+
+def _rasterize(page: "fitz.Page", dpi: int, clip: "fitz.Rect | None" = None) -> np.ndarray:
+    import fitz
+
+    with span("rasterize"):
+        return _pixmap_to_array(page.get_pixmap(dpi=dpi, clip=clip, colorspace=fitz.csGRAY, alpha=False))
+
+
+def _ocr_image(reader, image: np.ndarray) -> tuple[str, float]:
+    """Executa numa thread do pool: o span é registrado por quem coleta o resultado (os spans são por thread)."""
+    start = time.perf_counter()
+    text = " ".join(reader.readtext(image, detail=0, paragraph=False)).lower()
+    return text, time.perf_counter() - start
+
+
+def _name_region(page: "fitz.Page") -> "fitz.Rect":
+    import fitz
 
-        page_num_to_process = min(1, num_pages)
+    x0, y0, x1, y1 = CNH_NAME_REGION
+    rect = page.rect
+    return fitz.Rect(rect.x0 + rect.width * x0, rect.y0 + rect.height * y0,
+                     rect.x0 + rect.width * x1, rect.y0 + rect.height * y1)
 
-        for page_number in range(page_num_to_process):
+
+def page_priority(page_number: int, text_layer: str) -> int:
+    """
+    Ordem de OCR das páginas: a primeira (frente da CNH Digital), depois as que mencionam a
+    CNH na camada de texto, depois as sem texto (digitalizações) e, por último, as demais.
+    """
+    if page_number == 0:
+        return 0
+    if any(keyword in text_layer for keyword in CNH_PAGE_KEYWORDS):
+        return 1
+    return 2 if len(text_layer.strip()) < TEXT_LAYER_MIN_CHARS else 3
+
+
+def ocr_plan(text_layers: list[str]) -> list[tuple[int, int, bool]]:
+    """
+    Sequência de OCR (página, DPI, só a região do nome?): primeiro a região do nome de todas
+    as páginas, por prioridade, e só depois as páginas inteiras, na mesma ordem.
+    """
+    order = sorted(range(len(text_layers)), key=lambda page_number: page_priority(page_number, text_layers[page_number]))
+    return ([(page_number, ROI_OCR_DPI, True) for page_number in order]
+            + [(page_number, FULL_PAGE_OCR_DPI, False) for page_number in order])
+
+
+def extract_document_text(reader, pdf_document: "fitz.Document", first_name: str, last_name: str,
+                          max_pages: int = CNH_MAX_PAGES, time_budget_seconds: float = CNH_TIME_BUDGET_SECONDS,
+                          ocr_workers: int | None = None) -> tuple[str, str, bool]:
+    """
+    Extrai o texto das primeiras `max_pages` páginas em camadas, parando assim que os nomes
+    forem encontrados:
+    1. camada de texto embutida no PDF de todas as páginas (sem OCR);
+    2. OCR da região do nome de cada página, em DPI reduzido;
+    3. OCR das páginas inteiras, em DPI alto.
+
+    As imagens são geradas nesta thread, na ordem de `ocr_plan` (o PyMuPDF não é thread-safe),
+    e o OCR roda em paralelo em até `ocr_workers` threads (padrão: `ocr_page_workers()`). Quando
+    os nomes aparecem ou o prazo `time_budget_seconds` acaba, as páginas que ainda não começaram
+    são canceladas.
+
+    Returns:
+        (texto extraído em minúsculas, descrição da última etapa executada, se todas as etapas
+        do plano foram lidas — False quando os nomes apareceram antes, ou o orçamento ou um erro
+        de OCR cortou a extração).
+    """
+    deadline = time.monotonic() + time_budget_seconds
+    ocr_workers = ocr_workers or ocr_page_workers()
+    page_count = min(len(pdf_document), max_pages)
+    complete = len(pdf_document) <= page_count
+    if not complete:
+        print(f"  PDF com {len(pdf_document)} páginas, verificando apenas as {page_count} primeiras.")
+
+    with span("text_layer"):
+        text_layers = [pdf_document.load_page(page_number).get_text().lower() for page_number in range(page_count)]
+    extracted_text = " ".join(text_layers)
+    plan = ocr_plan(text_layers)
+    if len(extracted_text.strip()) >= TEXT_LAYER_MIN_CHARS and _names_found(extracted_text, first_name, last_name):
+        return extracted_text, "camada de texto", complete and not plan
+
+    texts = [extracted_text]
+    steps_read = 0
+    last_step = "camada de texto"
+    found = False
+    pending: dict[Future, str] = {}
+    executor = ThreadPoolExecutor(max_workers=max(ocr_workers, 1), thread_name_prefix="cnh-page-ocr")
+
+    def collect(futures) -> bool:
+        nonlocal last_step, complete, steps_read
+        for future in futures:
+            step = pending.pop(future)
+            try:
+                text, seconds = future.result()
+            except Exception as e:
+                record_span("ocr", 0.0, error=True)
+                print(f"  Erro no OCR ({step}): {e}")
+                complete = False
+                continue
+            record_span("ocr", seconds)
+            steps_read += 1
+            texts.append(text)
+            last_step = step
+            if _names_found(" ".join(texts), first_name, last_name):
+                return True
+        return False
+
+    try:
+        for page_number, dpi, name_region_only in plan:
+            if time.monotonic() >= deadline:
+                print(f"  Prazo de {time_budget_seconds:.0f}s esgotado, páginas restantes ignoradas.")
+                complete = False
+                break
             page = pdf_document.load_page(page_number)
+            image = _rasterize(page, dpi, clip=_name_region(page) if name_region_only else None)
+            step = f"OCR da {'região do nome' if name_region_only else 'página inteira'} (página {page_number + 1})"
+            pending[executor.submit(_ocr_image, reader, image)] = step
+            # Mantém no máximo um lote de imagens à frente do OCR.
+            while len(pending) >= max(ocr_workers, 1) and not found:
+                done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                found = collect(done)
+            if found:
+                break
+
+        while pending and not found:
+            done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"  Prazo de {time_budget_seconds:.0f}s esgotado com {len(pending)} OCR(s) em andamento.")
+                break
+            found = collect(done)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        print(f"  {len(pending)} OCR(s) de página cancelados ou abandonados.")
+    complete = complete and steps_read == len(plan)
+    return " ".join(texts), last_step, complete
+
+
+def verify_name_from_cnh_pdf(pdf_bytes: bytes, first_name: str, last_name: str,
+                             reader=None) -> tuple[str, str | None]:
+    """
+    Tenta extrair texto de um PDF (camada de texto, depois OCR da região do nome e,
+    só se necessário, OCR das páginas inteiras; ver `extract_document_text`) e verifica se
+    o primeiro e último nome fornecidos estão presentes (`utils.name_matcher.match_name`:
+    sem acentos, ignorando partículas, primeiro nome exato e poucos erros de caractere no sobrenome).
+    Se `reader` não for informado, usa o leitor cacheado do Streamlit.
+    """
+    return verify_cnh_pdf(pdf_bytes, first_name, last_name, reader).as_tuple()
+
+
+def verify_cnh_pdf(pdf_bytes: bytes, first_name: str, last_name: str, reader=None,
+                   time_budget_seconds: float = CNH_TIME_BUDGET_SECONDS) -> CNHVerification:
+    """
+    Como `verify_name_from_cnh_pdf`, informando também se o documento foi lido por inteiro.
+    `time_budget_seconds` limita o OCR do documento (ver `extract_document_text`).
+    """
+    start_time = time.time()
+    if reader is None:
+        reader = load_ocr_reader()
 
-            pix = page.get_pixmap(dpi=300)
-            img_bytes = pix.tobytes("png")
+    if reader is None:
+        return CNHVerification("Erro: Modelo OCR não carregado", None)
 
-            print(f"  Executando OCR na página {page_number + 1}...")
-            ocr_results = reader.readtext(img_bytes, detail=0, paragraph=True)
+    if not pdf_bytes or not first_name or not last_name:
+        return CNHVerification("Erro: Dados de entrada inválidos", None)
 
-            page_text = " ".join(ocr_results).lower()
-            extracted_text_all_pages += page_text + " "
-            print(f"  Texto extraído da página {page_number + 1} (primeiros 100 chars): {page_text[:100]}...")
+    try:
+        import fitz
 
-        pdf_document.close()
+        with span("pdf_open"):
+            pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        print(f"Processando PDF com {len(pdf_document)} página(s).")
+        try:
+            extracted_text_all_pages, last_step, complete = extract_document_text(
+                reader, pdf_document, first_name, last_name, time_budget_seconds=time_budget_seconds)
+        finally:
+            pdf_document.close()
+        print(f"  Texto extraído até a etapa '{last_step}' em {time.time() - start_time:.2f}s "
+              f"(primeiros 100 chars): {extracted_text_all_pages.strip()[:100]}...")
 
     except Exception as e:
         print(f"Erro ao processar o PDF ou renderizar imagem: {e}")
-        return "Erro ao Processar PDF", None
+        return CNHVerification("Erro ao Processar PDF", None)
 
     print("Verificando nomes no texto extraído...")
     if not extracted_text_all_pages.strip():
         print("  Falha: Nenhum texto foi extraído pelo OCR.")
-        return "Falha na Verificação (OCR não extraiu texto)", ""
-
-    first_name_lower = first_name.lower()
-    last_name_lower = last_name.lower()
+        return CNHVerification(STATUS_NO_TEXT, "", complete)
 
-    if first_name_lower in extracted_text_all_pages and last_name_lower in extracted_text_all_pages:
-        status = "Verificado com Sucesso"
-        print(f"  Sucesso: Nomes '{first_name}' e '{last_name}' encontrados.")
+    with span("name_check"):
+        name_match = match_name(extracted_text_all_pages, first_name, last_name)
+    if name_match.matched:
+        status = STATUS_VERIFIED
+        print(f"  Sucesso: Nomes '{first_name}' e '{last_name}' encontrados "
+              f"(confiança {name_match.confidence:.2f}, distâncias {name_match.token_distances}).")
     else:
-        status = "Falha na Verificação (Nome não encontrado)"
-        print(f"  Falha: Nomes '{first_name}' ou '{last_name}' não encontrados no texto.")
+        status = STATUS_NAME_NOT_FOUND
+        print(f"  Falha: Nomes '{first_name}' ou '{last_name}' não encontrados no texto "
+              f"(confiança {name_match.confidence:.2f}, distâncias {name_match.token_distances}).")
         print(f"  Texto completo extraído (lower): {extracted_text_all_pages}")
 
     end_time = time.time()
     print(f"Verificação concluída em {end_time - start_time:.2f} segundos.")
 
-    return status, extracted_text_all_pages.strip()
+    return CNHVerification(status, extracted_text_all_pages.strip(), complete)
@@ -0,0 +1,317 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+from utils.compute_scheduler import WORKLOAD_OCR, apply_thread_budget, configured_budget
+from utils.metrics import collect_spans, record_spans, span
+from utils.model_host import RemoteOCRReader, connect_model_host
+from utils.ocr import CNH_TIME_BUDGET_SECONDS, STATUS_VERIFIED, create_ocr_reader, verify_cnh_pdf
+from utils.verification_cache import VerificationCache, pdf_fingerprint
+
+JOB_PENDING = "pendente"
+JOB_RUNNING = "em execução"
+JOB_DONE = "concluído"
+JOB_TIMEOUT = "tempo esgotado"
+JOB_ERROR = "erro"
+JOB_NOT_FOUND = "desconhecido"
+STATUS_JOB_EXPIRED = "Erro: Tempo Esgotado na Verificação"
+
+_worker_reader = None
+
+
+def _init_worker():
+    """
+    Inicializa um leitor EasyOCR por processo do pool. Com MODEL_HOST_SOCKET definida, o
+    worker só renderiza o PDF e o OCR roda no host compartilhado.
+    """
+    global _worker_reader
+    apply_thread_budget(WORKLOAD_OCR)
+    host = connect_model_host()
+    _worker_reader = RemoteOCRReader(host) if host else create_ocr_reader()
+
+
+def _worker_ready() -> bool:
+    return _worker_reader is not None
+
+
+def _run_verification(pdf_bytes: bytes, first_name: str, last_name: str,
+                      deadline: float) -> tuple[tuple[str, str | None], list, bool]:
+    """
+    Executa a verificação no worker até o prazo do job (`deadline`, em `time.time()`): um job
+    que já venceu na fila é pulado, e o OCR do documento para no prazo, liberando o processo
+    para o próximo job. Retorna o resultado, os spans de tempo medidos no processo e se o
+    documento foi lido por inteiro (ver `CNHVerification.complete`).
+    """
+    if _worker_reader is None:
+        return ("Erro: Modelo OCR não carregado", None), [], True
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return (STATUS_JOB_EXPIRED, None), [], True
+    with collect_spans() as spans:
+        with span("verify_cnh"):
+            verification = verify_cnh_pdf(pdf_bytes, first_name, last_name, reader=_worker_reader,
+                                          time_budget_seconds=min(CNH_TIME_BUDGET_SECONDS, remaining))
+    if not verification.complete and verification.status != STATUS_VERIFIED and time.time() >= deadline:
+        # Cortado pelo prazo do job, não pelo orçamento do documento: não é uma falha de nome.
+        return (STATUS_JOB_EXPIRED, None), spans, True
+    return verification.as_tuple(), spans, verification.complete
+
+
+_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verification_jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    status TEXT,
+    deadline REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class VerificationJobStore:
+    """
+    Estado dos jobs de verificação em SQLite (modo WAL), compartilhado pelos workers da API.
+    O job roda no pool do worker que recebeu o envio, mas a consulta pode chegar a qualquer
+    worker. Guarda só o estado e o status final, nunca o PDF nem o texto extraído.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_JOBS_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, state: str, deadline: float, status: str | None = None) -> None:
+        self._connection().execute(
+            "INSERT INTO verification_jobs (job_id, state, status, deadline, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, state, status, deadline, time.time()))
+
+    def update(self, job_id: str, state: str, status: str | None = None) -> None:
+        """Atualiza um job existente (um job já descartado não é recriado)."""
+        self._connection().execute(
+            "UPDATE verification_jobs SET state = ?, status = ?, updated_at = ? WHERE job_id = ?",
+            (state, status, time.time(), job_id))
+
+    def get(self, job_id: str) -> tuple[str, str | None, float] | None:
+        """(estado, status, prazo) do job, ou None se não existir."""
+        return self._connection().execute(
+            "SELECT state, status, deadline FROM verification_jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def delete(self, job_id: str) -> None:
+        self._connection().execute("DELETE FROM verification_jobs WHERE job_id = ?", (job_id,))
+
+    def prune(self, older_than: float) -> None:
+        self._connection().execute("DELETE FROM verification_jobs WHERE updated_at < ?", (older_than,))
+
+
+@dataclass
+class VerificationJob:
+    job_id: str
+    future: Future
+    submitted_at: float
+    deadline: float
+    finished_at: float | None = None
+    status: str = field(default=JOB_PENDING)
+    pdf_hash: str | None = None
+
+
+class OCRVerificationService:
+    """
+    Serviço de verificação de CNH em um pool de processos, fora da thread do script
+    do Streamlit. A fila é limitada (`max_pending`): quando cheia, `submit` recusa o
+    job e a interface tenta novamente depois. Cada job tem um prazo (`timeout_seconds`).
+
+    Jobs que estouram o prazo são cancelados se ainda estiverem na fila. O prazo também vai
+    para o worker, que para o OCR do documento ao atingi-lo (no máximo o `readtext` em
+    andamento termina depois), então um PDF lento não prende o processo além do prazo; o
+    resultado que chegar depois do prazo é descartado.
+
+    Com um `VerificationCache`, reenvios do mesmo PDF são respondidos na hora, sem OCR.
+    Com um `VerificationJobStore`, o estado dos jobs é publicado para os outros processos
+    (workers da API) e `status` responde também por jobs enviados a outro processo.
+    """
+
+    def __init__(self, max_workers: int | None = None, max_pending: int | None = None,
+                 timeout_seconds: float = 60.0, result_ttl_seconds: float = 300.0,
+                 cache: VerificationCache | None = None, job_store: VerificationJobStore | None = None):
+        self.max_workers = max_workers or configured_budget().ocr_processes
+        self.max_pending = max_pending or self.max_workers * 4
+        self.timeout_seconds = timeout_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self.cache = cache
+        self.job_store = job_store
+        self._jobs: dict[str, VerificationJob] = {}
+        # Reentrante: o callback de um future já concluído roda dentro de `submit`.
+        self._lock = threading.RLock()
+
+    def _active_jobs(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status in (JOB_PENDING, JOB_RUNNING))
+
+    def _prune(self, now: float) -> None:
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.result_ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.job_store is not None:
+            self.job_store.prune(now - self.timeout_seconds - self.result_ttl_seconds)
+
+    def _publish(self, job: VerificationJob) -> None:
+        if self.job_store is None:
+            return
+        status = job.future.result()[0][0] if job.status == JOB_DONE else None
+        self.job_store.update(job.job_id, job.status, status)
+
+    def _track(self, job: VerificationJob) -> None:
+        self._jobs[job.job_id] = job
+        if self.job_store is not None:
+            self.job_store.create(job.job_id, job.status, job.deadline)
+        job.future.add_done_callback(lambda _: self._finish(job))
+
+    def _finish(self, job: VerificationJob) -> None:
+        """Registra o resultado assim que o future termina, mesmo que ninguém consulte este processo."""
+        with self._lock:
+            if job.status not in (JOB_PENDING, JOB_RUNNING):
+                return
+            job.status = JOB_ERROR if job.future.cancelled() or job.future.exception() else JOB_DONE
+            job.finished_at = time.time()
+            if job.status == JOB_DONE:
+                result, spans, complete = job.future.result()
+                record_spans(spans)
+                if self.cache is not None and job.pdf_hash is not None:
+                    self.cache.store(job.pdf_hash, result, complete=complete)
+            self._publish(job)
+
+    def submit(self, pdf_bytes: bytes, first_name: str, last_name: str) -> str | None:
+        """Enfileira uma verificação. Retorna o id do job, ou None se a fila estiver cheia."""
+        now = time.time()
+        pdf_hash = cached = None
+        if self.cache is not None:
+            pdf_hash = pdf_fingerprint(pdf_bytes)
+            cached = self.cache.lookup(pdf_hash, first_name, last_name)
+        with self._lock:
+            self._prune(now)
+            for job in list(self._jobs.values()):
+                self._refresh(job, now)
+            if cached is not None:
+                job_id = uuid.uuid4().hex
+                future: Future = Future()
+                future.set_result((cached, [], True))
+                self._track(VerificationJob(job_id, future, submitted_at=now, deadline=now))
+                return job_id
+            if self._active_jobs() >= self.max_pending:
+                print(f"Fila de OCR cheia ({self.max_pending} jobs), verificação recusada.")
+                return None
+
+            job_id = uuid.uuid4().hex
+            deadline = now + self.timeout_seconds
+            future = self._executor.submit(_run_verification, pdf_bytes, first_name, last_name, deadline)
+            self._track(VerificationJob(job_id, future, submitted_at=now, deadline=deadline, pdf_hash=pdf_hash))
+        print(f"Job de OCR {job_id} enfileirado.")
+        return job_id
+
+    def _refresh(self, job: VerificationJob, now: float) -> None:
+        if job.status not in (JOB_PENDING, JOB_RUNNING):
+            return
+        if job.future.done():
+            self._finish(job)
+        elif now > job.deadline:
+            job.status = JOB_TIMEOUT
+            job.finished_at = now
+            job.future.cancel()
+            self._publish(job)
+        elif job.future.running() and job.status != JOB_RUNNING:
+            job.status = JOB_RUNNING
+            self._publish(job)
+
+    def status(self, job_id: str) -> tuple[str, tuple[str, str | None] | None]:
+        """
+        Consulta um job.
+
+        Returns:
+            (estado, resultado), onde o resultado é a tupla de `verify_name_from_cnh_pdf`
+            quando o estado é JOB_DONE, e None nos demais casos. Um id desconhecido (ou já
+            descartado) tem estado JOB_NOT_FOUND. Jobs de outro processo, lidos do
+            `job_store`, trazem só o status (o texto extraído fica no processo de origem).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self._shared_status(job_id)
+            self._refresh(job, time.time())
+            if job.status == JOB_DONE:
+                return JOB_DONE, job.future.result()[0]
+            if job.status == JOB_ERROR and not job.future.cancelled():
+                print(f"Erro no job de OCR {job_id}: {job.future.exception()}")
+            return job.status, None
+
+    def _shared_status(self, job_id: str) -> tuple[str, tuple[str, str | None] | None]:
+        row = self.job_store.get(job_id) if self.job_store is not None else None
+        if row is None:
+            return JOB_NOT_FOUND, None
+        state, status, deadline = row
+        if state in (JOB_PENDING, JOB_RUNNING) and time.time() > deadline:
+            return JOB_TIMEOUT, None
+        return state, ((status, None) if state == JOB_DONE else None)
+
+    def discard(self, job_id: str) -> None:
+        """Esquece um job já consumido pela interface (e cancela se ainda estiver na fila)."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if self.job_store is not None:
+            self.job_store.delete(job_id)
+        if job is not None:
+            job.future.cancel()
+
+    def warm_up(self, timeout_seconds: float | None = None) -> bool:
+        """
+        Sobe os processos do pool e carrega o leitor EasyOCR em cada um antes do primeiro
+        job. Retorna True se todos os workers responderam com o leitor carregado.
+        """
+        futures = [self._executor.submit(_worker_ready) for _ in range(self.max_workers)]
+        try:
+            return all(future.result(timeout=timeout_seconds) for future in futures)
+        except Exception as e:
+            print(f"Erro ao aquecer os workers de OCR: {e}")
+            return False
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def configured_verification_cache() -> VerificationCache | None:
+    """Cache de resultados por hash do PDF (VERIFICATION_CACHE_TTL_SECONDS=0 desativa)."""
+    ttl_seconds = float(os.getenv("VERIFICATION_CACHE_TTL_SECONDS", "600"))
+    if ttl_seconds <= 0:
+        return None
+    return VerificationCache(ttl_seconds, int(os.getenv("VERIFICATION_CACHE_MAX_ENTRIES", "1000")))
+
+
+@st.cache_resource
+def load_ocr_service() -> OCRVerificationService:
+    """Serviço de verificação compartilhado pelo processo (configurável por variáveis de ambiente)."""
+    max_workers = int(os.getenv("OCR_WORKERS", "0")) or None
+    max_pending = int(os.getenv("OCR_MAX_PENDING", "0")) or None
+    timeout_seconds = float(os.getenv("OCR_JOB_TIMEOUT_SECONDS", "60"))
+    service = OCRVerificationService(max_workers, max_pending, timeout_seconds, cache=configured_verification_cache())
+    print(f"Serviço de OCR iniciado com {service.max_workers} processo(s), fila máxima de {service.max_pending}.")
+    return service
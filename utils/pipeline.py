@@ -0,0 +1,78 @@
+import hashlib
+import json
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import streamlit as st
+
+from utils.api_client import PROFILE_FIELDS, HttpMatchingClient, LocalMatchingClient
+from utils.metrics import REGISTRY, span
+
+
+def profile_fingerprint(profile: dict) -> str:
+    """Hash dos campos que entram no embedding; muda sempre que uma edição invalida o match."""
+    payload = json.dumps({field: profile.get(field) for field in PROFILE_FIELDS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SpeculativeMatch:
+    fingerprint: str
+    future: Future
+
+
+class MatchPipeline:
+    """
+    Antecipa o embedding e o matching do perfil: assim que a etapa 2 é enviada, o cálculo
+    começa em segundo plano enquanto o usuário ainda está no upload da CNH. Na etapa 4, o
+    resultado é reaproveitado se os campos do perfil não mudaram; caso contrário, o cálculo
+    especulativo é cancelado e refeito.
+    """
+
+    def __init__(self, client: LocalMatchingClient | HttpMatchingClient, max_workers: int = 4):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-match")
+
+    def _match(self, profile: dict, k: int) -> list[dict] | None:
+        with span("speculative_match"):
+            return self.client.match_profiles([profile], k=k)
+
+    def speculate(self, profile: dict, k: int = 5, previous: SpeculativeMatch | None = None) -> SpeculativeMatch:
+        """Inicia o matching em segundo plano (cancelando um especulativo anterior de outro perfil)."""
+        fingerprint = profile_fingerprint(profile)
+        if previous is not None:
+            if previous.fingerprint == fingerprint:
+                return previous
+            previous.future.cancel()
+        print(f"Matching especulativo iniciado para o perfil {fingerprint[:12]}.")
+        return SpeculativeMatch(fingerprint, self._executor.submit(self._match, dict(profile), k))
+
+    def resolve(self, speculative: SpeculativeMatch | None, profile: dict, k: int = 5) -> list[dict] | None:
+        """
+        Resultado do matching para `profile`: o especulativo, se ainda for válido, ou um
+        cálculo novo (o especulativo obsoleto é cancelado ou tem o resultado descartado).
+        """
+        if speculative is not None and speculative.fingerprint == profile_fingerprint(profile):
+            try:
+                # Mesmo limite do cliente: um encoder travado não segura a página.
+                result = speculative.future.result(timeout=self.client.timeout_seconds)
+                REGISTRY.increment("kyf_speculative_match_total", outcome="hit")
+                return result
+            except CancelledError:
+                pass
+            except Exception as e:
+                print(f"Erro no matching especulativo, recalculando: {e}")
+            REGISTRY.increment("kyf_speculative_match_total", outcome="failed")
+        elif speculative is not None:
+            speculative.future.cancel()
+            REGISTRY.increment("kyf_speculative_match_total", outcome="stale")
+            print("Perfil mudou depois da etapa 2, matching especulativo descartado.")
+        else:
+            REGISTRY.increment("kyf_speculative_match_total", outcome="missing")
+        return self.client.match_profiles([profile], k=k)
+
+
+@st.cache_resource
+def load_match_pipeline(_client: LocalMatchingClient | HttpMatchingClient) -> MatchPipeline:
+    """Pipeline compartilhado pelas sessões do processo (um cliente de matching por processo)."""
+    return MatchPipeline(_client)
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+META_SUFFIX = '.meta.json'
+
+_GAME_PATTERN = re.compile(r"Jogo preferido:\s*([^.]+)\.")
+_ROLE_PATTERN = re.compile(r"Role principal:\s*([^.]+)\.")
+
+
+@dataclass(frozen=True)
+class PlayerStore:
+    """
+    Matriz de embeddings dos jogadores (float32, linhas L2-normalizadas) e os
+    metadados correspondentes. A matriz normalmente é um memmap somente leitura.
+    """
+    names: list[str]
+    texts: list[str]
+    matrix: np.ndarray
+    model_name: str | None = None
+    games: list[str | None] | None = None
+    roles: list[str | None] | None = None
+    backend: str = "torch"
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def player(self, index: int) -> dict:
+        """Retorna nome, texto, jogo e role do jogador na linha `index` da matriz."""
+        return {
+            "name": self.names[index],
+            "text": self.texts[index],
+            "game": self.games[index] if self.games else None,
+            "role": self.roles[index] if self.roles else None,
+        }
+
+
+class BackendMismatchError(ValueError):
+    pass
+
+
+def check_store_backend(store: PlayerStore, backend: str, model_name: str | None = None) -> None:
+    """
+    Confere se os vetores dos jogadores foram gerados com o mesmo backend (e modelo) que vai
+    codificar as consultas: scores de backends diferentes não são comparáveis.
+
+    Raises:
+        BackendMismatchError: se o backend ou o modelo (quando registrado no sidecar) divergirem.
+    """
+    if store.backend != backend:
+        raise BackendMismatchError(f"vetores dos jogadores gerados com backend '{store.backend}', mas as consultas "
+                                   f"usam '{backend}'. Regere com --backend {backend}.")
+    if model_name and store.model_name and store.model_name != model_name:
+        raise BackendMismatchError(f"vetores dos jogadores gerados com '{store.model_name}', mas as consultas "
+                                   f"usam '{model_name}'.")
+
+
+def meta_path_for(matrix_path: str) -> str:
+    """Caminho do arquivo de metadados (sidecar) associado a uma matriz `.npy`."""
+    return os.path.splitext(matrix_path)[0] + META_SUFFIX
+
+
+def extract_game_and_role(text: str) -> tuple[str | None, str | None]:
+    """Extrai jogo e role de um texto no formato gerado por `prepare_user_text`."""
+    game_match = _GAME_PATTERN.search(text or "")
+    role_match = _ROLE_PATTERN.search(text or "")
+    return (game_match.group(1).strip() if game_match else None,
+            role_match.group(1).strip() if role_match else None)
+
+
+def text_hash(text: str) -> str:
+    """Hash de conteúdo (sha256) de uma descrição, usado para detectar textos alterados."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def roster_fingerprint(store: PlayerStore) -> str:
+    """Identifica a versão do elenco (nomes, textos, modelo e backend)."""
+    digest = hashlib.sha256(f"{store.model_name}\0{store.backend}".encode("utf-8"))
+    for name, text in zip(store.names, store.texts):
+        digest.update(f"\0{name}\0{text_hash(text)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Retorna uma cópia float32 da matriz com cada linha L2-normalizada."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def save_player_store(matrix_path: str, players: list[dict], embeddings: np.ndarray,
+                      model_name: str | None = None, backend: str = "torch") -> None:
+    """
+    Salva os embeddings como matriz float32 contígua e normalizada (`.npy`) e
+    nomes/textos num sidecar JSON. A escrita é atômica (arquivo temporário + replace).
+
+    Args:
+        matrix_path: caminho do arquivo `.npy` de saída;
+        players: lista de dicionários com 'name' e 'text', na mesma ordem das linhas;
+        embeddings: matriz (n_jogadores, dim) com os embeddings brutos;
+        model_name: nome do modelo usado para gerar os embeddings;
+        backend: backend de inferência usado (ver `utils.vectorizer.EMBEDDING_BACKENDS`).
+    """
+    matrix = np.ascontiguousarray(normalize_rows(embeddings))
+    if matrix.ndim != 2 or matrix.shape[0] != len(players):
+        raise ValueError(f"Matriz com shape {matrix.shape} incompatível com {len(players)} jogadores.")
+
+    meta = {
+        "format_version": STORE_FORMAT_VERSION,
+        "model_name": model_name,
+        "backend": backend,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "normalized": True,
+        "players": [_player_meta(p) for p in players],
+    }
+
+    meta_path = meta_path_for(matrix_path)
+    tmp_matrix_path = matrix_path + '.tmp'
+    tmp_meta_path = meta_path + '.tmp'
+
+    with open(tmp_matrix_path, 'wb') as f:
+        np.save(f, matrix, allow_pickle=False)
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    os.replace(tmp_matrix_path, matrix_path)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def _player_meta(player: dict) -> dict:
+    text = player.get("text", "")
+    game, role = extract_game_and_role(text)
+    return {
+        "name": player["name"],
+        "text": text,
+        "text_hash": text_hash(text),
+        "game": player.get("game") or game,
+        "role": player.get("role") or role,
+    }
+
+
+def open_player_store(matrix_path: str) -> PlayerStore:
+    """
+    Abre a matriz via mmap (sem cópia) e lê o sidecar de metadados.
+
+    Raises:
+        FileNotFoundError: se a matriz ou o sidecar não existirem;
+        ValueError: se o conteúdo dos arquivos for inconsistente.
+    """
+    meta_path = meta_path_for(matrix_path)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    if meta.get("format_version") != STORE_FORMAT_VERSION:
+        raise ValueError(f"Versão de formato não suportada em {meta_path}: {meta.get('format_version')}")
+
+    matrix = np.load(matrix_path, mmap_mode='r', allow_pickle=False)
+    players = meta.get("players", [])
+
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        raise ValueError(f"Matriz inválida em {matrix_path}: dtype={matrix.dtype}, shape={matrix.shape}")
+    if matrix.shape[0] != len(players) or matrix.shape[1] != meta.get("dim"):
+        raise ValueError(
+            f"Matriz {matrix.shape} não corresponde aos metadados ({len(players)} jogadores, dim={meta.get('dim')}).")
+
+    return PlayerStore(
+        names=[p["name"] for p in players],
+        texts=[p.get("text", "") for p in players],
+        matrix=matrix,
+        model_name=meta.get("model_name"),
+        games=[p.get("game") for p in players],
+        roles=[p.get("role") for p in players],
+        backend=meta.get("backend", "torch"),
+    )
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.audience_analytics import AGGREGATES_PATH, AudienceAggregates
+from utils.compute_scheduler import WORKLOAD_BATCH, apply_thread_budget
+from utils.embedding_cache import EmbeddingCache
+from utils.player_store import (BackendMismatchError, PlayerStore, check_store_backend, normalize_rows,
+                                open_player_store, roster_fingerprint)
+from utils.roster import roster_version
+from utils.storage_backends import FirebaseStorage, SQLiteStorage, StorageBackend
+from utils.vectorizer import EMBEDDING_BACKENDS, MODEL_NAME, create_model, embedding_model_id, get_vectors, \
+    prepare_user_text
+
+# --- Configurações ---
+# Executar a partir da raiz do projeto: python -m utils.rematch_users --help
+PLAYERS_STORE_PATH = 'data/players_vectors.npy'
+CHECKPOINT_PATH = 'data/rematch_checkpoint.json'
+PAGE_SIZE = 5000
+BATCH_SIZE = 256
+SCORE_TOLERANCE = 1e-6
+
+
+def load_checkpoint(path: str, fingerprint: str) -> dict | None:
+    """Lê o checkpoint se ele for da mesma versão do elenco; caso contrário, recomeça do início."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("roster_fingerprint") != fingerprint:
+        print("AVISO: checkpoint de outra versão do elenco, recomeçando do início.")
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """Grava o checkpoint de forma atômica (arquivo temporário + rename)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def best_matches(vectors: np.ndarray, store: PlayerStore) -> tuple[np.ndarray, np.ndarray]:
+    """Melhor jogador de cada vetor com uma única multiplicação de matrizes. Retorna (linhas, scores)."""
+    scores = normalize_rows(vectors) @ store.matrix.T
+    rows = scores.argmax(axis=1)
+    return rows, scores[np.arange(len(rows)), rows]
+
+
+def rematch_page(page: list[tuple[str, dict]], model, store: PlayerStore, cache: EmbeddingCache | None,
+                 batch_size: int, timings: dict[str, float], version: str | None = None) -> dict[str, dict]:
+    """
+    Recalcula o match de uma página de usuários. Textos repetidos são codificados uma vez só.
+    Retorna apenas as atualizações de quem mudou de jogador ou de score (com a `version` do elenco).
+    """
+    texts = {key: prepare_user_text(record) for key, record in page}
+    unique_texts = sorted({text for text in texts.values() if text})
+    if not unique_texts:
+        return {}
+
+    start = time.perf_counter()
+    vectors = get_vectors(unique_texts, model, cache, batch_size=batch_size)
+    timings["encode"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows, scores = best_matches(vectors, store)
+    best_by_text = {text: (store.names[int(row)], float(score)) for text, row, score in zip(unique_texts, rows, scores)}
+    timings["score"] += time.perf_counter() - start
+
+    updates = {}
+    for key, record in page:
+        if not texts[key]:
+            continue
+        name, score = best_by_text[texts[key]]
+        if record.get("match_player_name") != name or abs((record.get("match_score") or 0.0) - score) > SCORE_TOLERANCE:
+            updates[key] = {"match_player_name": name, "match_score": score, "roster_version": version}
+    return updates
+
+
+def rematch_users(storage: StorageBackend, store: PlayerStore, model, cache: EmbeddingCache | None = None,
+                  page_size: int = PAGE_SIZE, batch_size: int = BATCH_SIZE, checkpoint_path: str = CHECKPOINT_PATH,
+                  restart: bool = False, dry_run: bool = False, analytics: AudienceAggregates | None = None) -> dict:
+    """
+    Percorre os usuários em páginas e regrava `match_player_name`/`match_score` contra o elenco
+    atual. A leitura da próxima página acontece em paralelo com a codificação da atual, e um
+    checkpoint é salvo após cada página, para retomar de onde parou após uma falha. Com
+    `analytics`, os agregados da audiência são ajustados para os perfis que mudaram.
+
+    Returns:
+        Resumo com totais, tempos por etapa e vazão (usuários/s).
+    """
+    fingerprint = roster_fingerprint(store)
+    version = roster_version(store)
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, fingerprint)
+    if checkpoint is None:
+        checkpoint = {"roster_fingerprint": fingerprint, "last_key": None, "processed": 0, "updated": 0,
+                      "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    elif checkpoint.get("finished"):
+        print("Re-matching já concluído para esta versão do elenco (use --restart para refazer).")
+        return checkpoint
+    else:
+        print(f"Retomando após a chave '{checkpoint['last_key']}' ({checkpoint['processed']} usuários já processados).")
+
+    # read_wait: tempo bloqueado esperando a próxima página (a leitura em si corre em paralelo).
+    timings = {"read_wait": 0.0, "encode": 0.0, "score": 0.0, "write": 0.0}
+    processed_now = 0
+    start_time = time.perf_counter()
+    pages = storage.iter_users(page_size=page_size, start_after=checkpoint["last_key"])
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="rematch-reader") as reader:
+        next_page = reader.submit(next, pages, None)
+        while True:
+            wait_start = time.perf_counter()
+            page = next_page.result()
+            timings["read_wait"] += time.perf_counter() - wait_start
+            if page is None:
+                break
+            next_page = reader.submit(next, pages, None)
+
+            updates = rematch_page(page, model, store, cache, batch_size, timings, version)
+            if updates and not dry_run:
+                start = time.perf_counter()
+                # Agregados antes do armazenamento: se o job cair entre os dois, a retomada ainda vê os
+                # registros antigos e refaz as duas etapas (`rematch` ignora fãs já movidos).
+                if analytics is not None:
+                    records = dict(page)
+                    analytics.rematch([(key, records[key], update) for key, update in updates.items()])
+                storage.update_users(updates)
+                timings["write"] += time.perf_counter() - start
+
+            processed_now += len(page)
+            checkpoint["last_key"] = page[-1][0]
+            checkpoint["processed"] += len(page)
+            checkpoint["updated"] += len(updates)
+            if not dry_run:
+                save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - start_time
+            print(f"  {checkpoint['processed']} usuários processados, {checkpoint['updated']} atualizados "
+                  f"({processed_now / elapsed:.0f} usuários/s).")
+
+    elapsed = time.perf_counter() - start_time
+    checkpoint["finished"] = True
+    checkpoint["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    if not dry_run:
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    return {
+        "processed": checkpoint["processed"],
+        "updated": checkpoint["updated"],
+        "processed_this_run": processed_now,
+        "elapsed_seconds": round(elapsed, 2),
+        "users_per_second": round(processed_now / elapsed, 1) if elapsed else None,
+        "stage_seconds": {stage: round(seconds, 2) for stage, seconds in timings.items()},
+    }
+
+
+def open_storage(backend: str, sqlite_path: str) -> StorageBackend:
+    """Backend de armazenamento para o job, fora do Streamlit."""
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")),
+                                      {'databaseURL': os.getenv("FIREBASE_DATABASE_URL")})
+    return FirebaseStorage()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Recalcula o match de todos os usuários salvos contra o elenco atual.")
+    parser.add_argument("--players", default=PLAYERS_STORE_PATH, help="Store de vetores dos jogadores.")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "firebase"), choices=["firebase", "sqlite"])
+    parser.add_argument("--sqlite-path", default=os.getenv("SQLITE_STORAGE_PATH", 'data/users.sqlite3'))
+    parser.add_argument("--model", default=MODEL_NAME, help="Modelo Sentence Transformer.")
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"), choices=EMBEDDING_BACKENDS,
+                        help="Backend de inferência (o mesmo usado para gerar os vetores dos jogadores).")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Usuários lidos por página.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tamanho do lote de codificação.")
+    parser.add_argument("--embedding-cache", default="data/embedding_cache.sqlite3",
+                        help="Cache de embeddings compartilhado com o app (vazio para desativar).")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Arquivo de checkpoint para retomada.")
+    parser.add_argument("--restart", action="store_true", help="Ignora o checkpoint e recomeça do início.")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula os matches sem gravar nada.")
+    parser.add_argument("--audience", default=AGGREGATES_PATH,
+                        help="Agregados da audiência a ajustar (vazio para não ajustar).")
+    args = parser.parse_args()
+
+    apply_thread_budget(WORKLOAD_BATCH)
+    store = open_player_store(args.players)
+    try:
+        check_store_backend(store, args.backend, args.model)
+    except BackendMismatchError as e:
+        raise SystemExit(f"Erro: {e}")
+    model = create_model(args.model, args.backend)
+    cache = EmbeddingCache(args.embedding_cache, embedding_model_id(args.model, args.backend)) \
+        if args.embedding_cache else None
+
+    summary = rematch_users(open_storage(args.storage, args.sqlite_path), store, model, cache,
+                            page_size=args.page_size, batch_size=args.batch_size, checkpoint_path=args.checkpoint,
+                            restart=args.restart, dry_run=args.dry_run,
+                            analytics=AudienceAggregates(args.audience) if args.audience else None)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.metrics import REGISTRY, span
+from utils.player_store import (PlayerStore, check_store_backend, meta_path_for, open_player_store, roster_fingerprint,
+                                text_hash)
+from utils.similarity_index import SimilarityIndex
+
+ROSTER_VERSION_LENGTH = 12
+NORM_TOLERANCE = 1e-3
+
+
+def roster_version(store: PlayerStore) -> str:
+    """Versão curta do elenco, gravada junto de cada match salvo."""
+    return roster_fingerprint(store)[:ROSTER_VERSION_LENGTH]
+
+
+@dataclass(frozen=True)
+class Roster:
+    """Uma versão imutável do elenco: o índice de busca e de onde ele veio."""
+    version: str
+    index: SimilarityIndex
+    loaded_at: float
+    signature: tuple
+
+    @property
+    def store(self) -> PlayerStore:
+        return self.index.store
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def file_signature(matrix_path: str) -> tuple:
+    """(mtime_ns, tamanho) da matriz e do sidecar; muda sempre que um dos dois é regravado."""
+    signature = []
+    for path in (matrix_path, meta_path_for(matrix_path)):
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def validate_rows(matrix: np.ndarray, rows: np.ndarray) -> None:
+    """Confere que as linhas novas são finitas e L2-normalizadas, como `save_player_store` grava."""
+    if not len(rows):
+        return
+    vectors = np.asarray(matrix[rows], dtype=np.float32)
+    if not np.isfinite(vectors).all():
+        raise ValueError("Vetores com NaN/inf no novo elenco.")
+    norms = np.linalg.norm(vectors, axis=1)
+    if np.abs(norms - 1.0).max() > NORM_TOLERANCE:
+        raise ValueError("Vetores não normalizados no novo elenco.")
+
+
+def merge_roster(current: PlayerStore, new: PlayerStore) -> tuple[PlayerStore, dict]:
+    """
+    Monta a matriz da nova versão reaproveitando as linhas de jogadores cujo texto não mudou
+    (mesmo nome e `text_hash`); do arquivo novo só são lidas as linhas novas ou alteradas.
+    Se o modelo, o backend ou a dimensão mudaram, nada é reaproveitado.
+
+    Returns:
+        (store da nova versão, {'reused', 'loaded', 'removed'}).
+    """
+    compatible = (current.model_name == new.model_name and current.backend == new.backend
+                  and current.matrix.shape[1] == new.matrix.shape[1])
+    current_rows = {(name, text_hash(text)): row for row, (name, text) in enumerate(zip(current.names, current.texts))} \
+        if compatible else {}
+
+    reused_new, reused_old, loaded = [], [], []
+    for row, (name, text) in enumerate(zip(new.names, new.texts)):
+        old_row = current_rows.pop((name, text_hash(text)), None)
+        if old_row is None:
+            loaded.append(row)
+        else:
+            reused_new.append(row)
+            reused_old.append(old_row)
+
+    loaded_rows = np.asarray(loaded, dtype=np.intp)
+    validate_rows(new.matrix, loaded_rows)
+    matrix = np.empty(new.matrix.shape, dtype=np.float32)
+    if reused_new:
+        matrix[np.asarray(reused_new, dtype=np.intp)] = current.matrix[np.asarray(reused_old, dtype=np.intp)]
+    if loaded:
+        matrix[loaded_rows] = new.matrix[loaded_rows]
+    matrix.setflags(write=False)
+
+    store = PlayerStore(names=new.names, texts=new.texts, matrix=matrix, model_name=new.model_name,
+                        games=new.games, roles=new.roles, backend=new.backend)
+    return store, {"reused": len(reused_new), "loaded": len(loaded), "removed": len(current.names) - len(reused_new)}
+
+
+class RosterRegistry:
+    """
+    Elenco versionado com recarga a quente. Uma thread observa a matriz de vetores e o
+    sidecar; quando mudam, a nova versão é validada e montada em segundo plano e trocada
+    por uma única atribuição de referência. Quem já pegou `current()` termina o match na
+    versão antiga, que continua válida enquanto for referenciada.
+
+    Com `backend` (e `model_name`), toda versão precisa ter sido gerada com o mesmo backend
+    e modelo das consultas: a primeira levanta `BackendMismatchError`, e uma recarga
+    divergente é rejeitada como inválida.
+    """
+
+    def __init__(self, matrix_path: str, poll_seconds: float = 5.0, backend: str | None = None,
+                 model_name: str | None = None):
+        self.matrix_path = matrix_path
+        self.poll_seconds = poll_seconds
+        self.backend = backend
+        self.model_name = model_name
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        signature = file_signature(matrix_path)
+        store = open_player_store(matrix_path)
+        self._check(store)
+        self._current = self._build(store, signature)
+        print(f"Elenco {self._current.version} carregado com {len(store)} jogadores.")
+
+    def _check(self, store: PlayerStore) -> None:
+        if self.backend is not None:
+            check_store_backend(store, self.backend, self.model_name)
+
+    @staticmethod
+    def _build(store: PlayerStore, signature: tuple) -> Roster:
+        return Roster(roster_version(store), SimilarityIndex(store), time.time(), signature)
+
+    def current(self) -> Roster:
+        """Versão em uso. Guarde a referência durante o match inteiro para não misturar versões."""
+        return self._current
+
+    def reload_if_changed(self) -> bool:
+        """Recarrega se os arquivos mudaram. Retorna True se uma nova versão entrou em uso."""
+        with self._reload_lock:
+            current = self._current
+            try:
+                signature = file_signature(self.matrix_path)
+            except OSError as e:
+                print(f"AVISO: elenco indisponível para recarga ({e}); mantendo a versão {current.version}.")
+                return False
+            if signature == current.signature:
+                return False
+
+            try:
+                with span("roster_reload"):
+                    new_store = open_player_store(self.matrix_path)
+                    # A matriz e o sidecar são substituídos em sequência: se algo mudou durante a
+                    # leitura, a versão pode estar pela metade e é tentada de novo no próximo ciclo.
+                    if file_signature(self.matrix_path) != signature:
+                        return False
+                    self._check(new_store)
+                    if new_store.backend != current.store.backend or new_store.model_name != current.store.model_name:
+                        print(f"AVISO: novo elenco gerado com {new_store.model_name}/{new_store.backend}, "
+                              f"versão anterior usava {current.store.model_name}/{current.store.backend}.")
+                    store, diff = merge_roster(current.store, new_store)
+                    roster = self._build(store, signature)
+            except (OSError, ValueError, KeyError) as e:
+                REGISTRY.increment("kyf_roster_reloads_total", outcome="invalid")
+                print(f"AVISO: novo elenco rejeitado ({e}); mantendo a versão {current.version}.")
+                # Não tenta de novo os mesmos arquivos a cada ciclo.
+                self._current = Roster(current.version, current.index, current.loaded_at, signature)
+                return False
+
+            self._current = roster
+            REGISTRY.increment("kyf_roster_reloads_total", outcome="swapped")
+            print(f"Elenco atualizado: {current.version} -> {roster.version} ({len(store)} jogadores; "
+                  f"{diff['reused']} reaproveitados, {diff['loaded']} novos/alterados, {diff['removed']} removidos).")
+            return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"Erro ao verificar atualização do elenco: {e}")
+
+    def start(self) -> "RosterRegistry":
+        """Inicia a thread que observa os arquivos (não faz nada com `poll_seconds` <= 0)."""
+        if self.poll_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="roster-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        roster = self._current
+        return {"version": roster.version, "players": len(roster),
+                "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(roster.loaded_at))}
+
+
+def configured_poll_seconds() -> float:
+    """Intervalo de verificação do arquivo do elenco (ROSTER_POLL_SECONDS; 0 desativa a recarga)."""
+    return float(os.getenv("ROSTER_POLL_SECONDS", "5"))
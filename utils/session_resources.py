@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+from utils.metrics import REGISTRY
+
+# Mesmo limite da API (api/server.py) e do `server.maxUploadSize` em .streamlit/config.toml.
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+
+def resource_size(value) -> int:
+    """Bytes ocupados por um recurso (bytes do upload ou vetor numpy); 0 para o resto."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class SessionResources:
+    """
+    Guarda os recursos pesados das sessões do processo (PDF da CNH, vetor do perfil) fora do
+    `st.session_state`, que só guarda a chave da sessão. Cada recurso é liberado assim que
+    deixa de ser necessário, e uma thread remove as sessões sem atividade há mais de
+    `idle_seconds`, mesmo que o Streamlit ainda não tenha descartado a sessão.
+    """
+
+    def __init__(self, idle_seconds: float = 900.0, max_upload_bytes: int = MAX_UPLOAD_BYTES):
+        self.idle_seconds = idle_seconds
+        self.max_upload_bytes = max_upload_bytes
+        self.evicted = 0
+        self._resources: dict[str, dict[str, object]] = {}
+        self._last_seen: dict[str, float] = {}
+        self._resource_names: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def touch(self, session_id: str) -> None:
+        with self._lock:
+            self._last_seen[session_id] = time.monotonic()
+
+    def check_upload(self, size: int) -> None:
+        """
+        Rejeita um upload acima do limite antes de copiar o conteúdo para a sessão.
+
+        Quando o script recebe o UploadedFile, o Streamlit já guardou o arquivo inteiro na memória: o limite
+        que de fato barra uploads grandes é o `server.maxUploadSize` em .streamlit/config.toml. Esta checagem
+        só evita uma segunda cópia, guardada até o OCR, caso `max_upload_bytes` seja menor que esse limite.
+
+        Raises:
+            UploadTooLargeError: se `size` passar de `max_upload_bytes`.
+        """
+        if size > self.max_upload_bytes:
+            raise UploadTooLargeError(f"Arquivo de {size / 1024 / 1024:.1f} MB excede o limite de "
+                                      f"{self.max_upload_bytes / 1024 / 1024:.0f} MB.")
+
+    def put(self, session_id: str, name: str, value) -> None:
+        with self._lock:
+            self._resources.setdefault(session_id, {})[name] = value
+            self._resource_names.add(name)
+            self._last_seen[session_id] = time.monotonic()
+
+    def get(self, session_id: str, name: str):
+        with self._lock:
+            return self._resources.get(session_id, {}).get(name)
+
+    def release(self, session_id: str, name: str | None = None) -> None:
+        """Libera um recurso da sessão (ou todos, se `name` for None)."""
+        with self._lock:
+            resources = self._resources.get(session_id)
+            if resources is None:
+                return
+            if name is None:
+                resources.clear()
+            else:
+                resources.pop(name, None)
+            if not resources:
+                del self._resources[session_id]
+
+    def evict_idle(self) -> int:
+        """Remove as sessões paradas há mais de `idle_seconds`. Retorna quantas foram removidas."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [session_id for session_id, last_seen in self._last_seen.items() if last_seen < cutoff]
+            for session_id in idle:
+                del self._last_seen[session_id]
+                self._resources.pop(session_id, None)
+            self.evicted += len(idle)
+        if idle:
+            REGISTRY.increment("kyf_session_evictions_total", len(idle))
+        return len(idle)
+
+    def report(self) -> dict:
+        """Sessões ativas e bytes mantidos em memória pelo processo, por tipo de recurso."""
+        with self._lock:
+            bytes_by_resource = dict.fromkeys(self._resource_names, 0)
+            for resources in self._resources.values():
+                for name, value in resources.items():
+                    bytes_by_resource[name] += resource_size(value)
+            report = {
+                "sessions": len(self._last_seen),
+                "sessions_with_resources": len(self._resources),
+                "bytes": sum(bytes_by_resource.values()),
+                "bytes_by_resource": bytes_by_resource,
+                "evicted": self.evicted,
+            }
+        REGISTRY.set_gauge("kyf_sessions", report["sessions"])
+        for name, size in bytes_by_resource.items():
+            REGISTRY.set_gauge("kyf_session_bytes", size, resource=name)
+        return report
+
+    def _run(self) -> None:
+        while not self._stop.wait(min(self.idle_seconds / 4, 60.0)):
+            evicted = self.evict_idle()
+            report = self.report()
+            if evicted:
+                print(f"{evicted} sessões inativas removidas; {report['sessions']} ativas, "
+                      f"{report['bytes'] / 1024:.0f} KB em recursos de sessão.")
+
+    def start(self) -> "SessionResources":
+        if self.idle_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-evictor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+@st.cache_resource
+def load_session_resources() -> SessionResources:
+    """Gerenciador de recursos das sessões do processo (SESSION_IDLE_SECONDS, padrão 900; 0 desativa a remoção)."""
+    return SessionResources(idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "900"))).start()
@@ -0,0 +1,131 @@
+import numpy as np
+
+from utils.metrics import timed
+from utils.player_store import PlayerStore
+
+
+def _key(value: str | None) -> str | None:
+    return value.strip().lower() if value else None
+
+
+class SimilarityIndex:
+    """
+    Índice de similaridade de cosseno sobre vetores de jogadores já L2-normalizados.
+
+    Construído uma vez por processo; cada consulta é um único produto
+    matriz-vetor seguido de `argpartition` para o top-k.
+    """
+
+    def __init__(self, store: PlayerStore):
+        self.store = store
+        self.matrix = store.matrix
+        self._rows_by_game = self._group_rows(store.games)
+        self._rows_by_role = self._group_rows(store.roles)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @staticmethod
+    def _group_rows(values: list[str | None] | None) -> dict[str, np.ndarray]:
+        groups: dict[str, list[int]] = {}
+        for row, value in enumerate(values or []):
+            key = _key(value)
+            if key:
+                groups.setdefault(key, []).append(row)
+        return {key: np.asarray(rows, dtype=np.intp) for key, rows in groups.items()}
+
+    def _candidate_rows(self, game: str | None, role: str | None) -> np.ndarray | None:
+        """Linhas que passam pelos filtros, ou None quando nenhum filtro foi pedido."""
+        rows = None
+        for groups, value in ((self._rows_by_game, game), (self._rows_by_role, role)):
+            key = _key(value)
+            if key is None:
+                continue
+            selected = groups.get(key, np.empty(0, dtype=np.intp))
+            rows = selected if rows is None else np.intersect1d(rows, selected, assume_unique=True)
+        return rows
+
+    @timed("similarity_search")
+    def search(self, query: np.ndarray, k: int = 5, game: str | None = None,
+               role: str | None = None) -> list[dict]:
+        """
+        Retorna os k jogadores mais similares ao vetor de consulta, em ordem decrescente.
+
+        Args:
+            query: vetor do usuário (não precisa estar normalizado);
+            k: número máximo de resultados;
+            game: se informado, considera apenas jogadores desse jogo;
+            role: se informado, considera apenas jogadores dessa role.
+
+        Returns:
+            Lista de dicionários com 'name', 'text', 'game', 'role' e 'score'.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm == 0 or k <= 0 or len(self) == 0:
+            return []
+        query = query / norm
+
+        rows = self._candidate_rows(game, role)
+        if rows is None:
+            scores = self.matrix @ query
+        elif rows.size == 0:
+            return []
+        else:
+            scores = self.matrix[rows] @ query
+
+        k = min(k, scores.shape[0])
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results = []
+        for position in top:
+            row = int(rows[position]) if rows is not None else int(position)
+            result = self.store.player(row)
+            result["score"] = float(scores[position])
+            results.append(result)
+        return results
+
+    @timed("similarity_search")
+    def search_batch(self, queries: np.ndarray, k: int = 5) -> list[list[dict]]:
+        """
+        Top-k de várias consultas com uma única multiplicação de matrizes (sem filtros).
+
+        Returns:
+            Uma lista de resultados (como em `search`) para cada linha de `queries`.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if k <= 0 or len(self) == 0 or queries.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        valid = norms[:, 0] > 0
+        norms[~valid] = 1.0
+        scores = (queries / norms) @ self.matrix.T
+
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+
+        results = []
+        for query_row in range(scores.shape[0]):
+            if not valid[query_row]:
+                results.append([])
+                continue
+            row_results = []
+            for row in top[query_row]:
+                result = self.store.player(int(row))
+                result["score"] = float(scores[query_row, row])
+                row_results.append(result)
+            results.append(row_results)
+        return results
@@ -1,14 +1,23 @@
+import os
+import uuid
 from datetime import datetime, timezone
 
-import firebase_admin
 import streamlit as st
-from firebase_admin import credentials, db
+
+from utils.metrics import timed
+from utils.storage_backends import FirebaseStorage, SQLiteStorage, StorageBackend
+from utils.write_queue import StorageFlusher, WriteAheadQueue
+
+STORAGE_BACKENDS = ("firebase", "sqlite")
 
 
 @st.cache_resource
 def initialize_firebase(service_account_path: str, database_url: str):
     """Inicializa o Firebase Admin SDK se ainda não foi inicializado."""
     try:
+        import firebase_admin
+        from firebase_admin import credentials
+
         if not firebase_admin._apps:
             print("Inicializando Firebase Admin SDK...")
             cred = credentials.Certificate(service_account_path)
@@ -39,35 +48,99 @@ def initialize_firebase(service_account_path: str, database_url: str):
         return False
 
 
-def save_user_profile_rtdb(user_data: dict) -> bool:
-    """Salva o perfil do usuário no Firebase Realtime Database."""
+@st.cache_resource
+def load_storage_backend(backend: str = "firebase", sqlite_path: str = 'data/users.sqlite3') -> StorageBackend:
+    """
+    Cria o backend de armazenamento: 'firebase' (RTDB, requer `initialize_firebase`)
+    ou 'sqlite' (local, sem credenciais).
+    """
+    if backend == "sqlite":
+        print(f"Usando armazenamento local SQLite em {sqlite_path}.")
+        return SQLiteStorage(sqlite_path)
+    if backend == "firebase":
+        return FirebaseStorage()
+    raise ValueError(f"Backend de armazenamento desconhecido: {backend}. Opções: {', '.join(STORAGE_BACKENDS)}")
+
+
+def configured_storage_backend() -> StorageBackend:
+    """Backend escolhido pelas variáveis de ambiente STORAGE_BACKEND e SQLITE_STORAGE_PATH."""
+    return load_storage_backend(os.getenv("STORAGE_BACKEND", "firebase"),
+                                os.getenv("SQLITE_STORAGE_PATH", 'data/users.sqlite3'))
+
+
+@st.cache_resource
+def load_profile_writer(queue_path: str = 'data/write_queue.sqlite3') -> tuple[WriteAheadQueue, StorageFlusher]:
+    """Abre a fila local de escritas e inicia o flusher que a drena para o backend configurado."""
+    queue = WriteAheadQueue(queue_path)
+    flusher = StorageFlusher(queue, configured_storage_backend()).start()
+    print(f"Fila de escritas aberta em {queue_path} com {len(queue)} escrita(s) pendente(s).")
+    return queue, flusher
+
+
+def build_user_payload(user_data: dict) -> dict:
+    """Monta o registro do usuário salvo no banco, sem campos vazios."""
+    payload = {
+        "profile_id": user_data.get("profile_id"),
+        "first_name": user_data.get("first_name"),
+        "last_name": user_data.get("last_name"),
+        "city": user_data.get("city"),
+        "fav_game": user_data.get("fav_game"),
+        "nickname": user_data.get("nickname"),
+        "role": user_data.get("role"),
+        "playstyle_desc": user_data.get("playstyle_desc"),
+        "watched_champs": user_data.get("watched_champs"),
+        "instagram_handle": user_data.get("instagram_handle") if user_data.get("instagram_handle") else None,
+        "verification_status": user_data.get("verification_status"),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "match_player_name": user_data.get("match_result", {}).get("name") if user_data.get(
+            "match_result") else None,
+        "match_score": user_data.get("match_result", {}).get("score") if user_data.get("match_result") else None,
+        "roster_version": user_data.get("roster_version") if user_data.get("match_result") else None,
+    }
+
+    return {k: v for k, v in payload.items() if v is not None}
+
+
+@timed("save_enqueue")
+def save_user_profile_rtdb(user_data: dict, writer: tuple[WriteAheadQueue, StorageFlusher] | None = None) -> bool:
+    """
+    Salva o perfil do usuário no backend configurado (Firebase Realtime Database por padrão).
+
+    O perfil é gravado na fila local (durável) e a função retorna imediatamente;
+    o flusher envia ao armazenamento em lotes, com novas tentativas em caso de falha.
+    O `profile_id` da sessão é a chave de idempotência (nó `users/<profile_id>`).
+    """
     try:
-        ref = db.reference('users')
-
-        payload = {
-            "first_name": user_data.get("first_name"),
-            "last_name": user_data.get("last_name"),
-            "city": user_data.get("city"),
-            "fav_game": user_data.get("fav_game"),
-            "nickname": user_data.get("nickname"),
-            "role": user_data.get("role"),
-            "playstyle_desc": user_data.get("playstyle_desc"),
-            "watched_champs": user_data.get("watched_champs"),
-            "instagram_handle": user_data.get("instagram_handle") if user_data.get("instagram_handle") else None,
-            "verification_status": user_data.get("verification_status"),
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "match_player_name": user_data.get("match_result", {}).get("name") if user_data.get(
-                "match_result") else None,
-            "match_score": user_data.get("match_result", {}).get("score") if user_data.get("match_result") else None
-        }
-
-        payload_cleaned = {k: v for k, v in payload.items() if v is not None}
-
-        new_user_ref = ref.push(payload_cleaned)
-        print(f"Perfil do usuário salvo no Realtime Database com ID: {new_user_ref.key}")
+        queue, flusher = writer or load_profile_writer()
+        payload = build_user_payload(user_data)
+        profile_key = user_data.get("profile_id") or uuid.uuid4().hex
+
+        queue.enqueue(profile_key, 'users', payload)
+        flusher.notify()
+        print(f"Perfil do usuário enfileirado para o Realtime Database com ID: {profile_key}")
         return True
 
     except Exception as e:
         print(f"Erro ao salvar perfil no Firebase Realtime Database: {e}")
         st.error(f"Erro ao salvar seu perfil no banco de dados: {e}")
         return False
+
+
+@timed("save_enqueue")
+def update_user_profile_fields(profile_key: str, fields: dict,
+                               writer: tuple[WriteAheadQueue, StorageFlusher] | None = None) -> bool:
+    """
+    Atualiza só os campos informados de um perfil já salvo (ex.: o status da verificação que
+    terminou depois do cadastro), pela mesma fila local. Os demais campos do registro, como
+    `created_at` e um match regravado pelo `utils.rematch_users`, ficam como estão.
+    """
+    try:
+        queue, flusher = writer or load_profile_writer()
+        queue.enqueue_update(profile_key, 'users', fields)
+        flusher.notify()
+        print(f"Atualização de {sorted(fields)} enfileirada para o perfil {profile_key}")
+        return True
+
+    except Exception as e:
+        print(f"Erro ao atualizar perfil {profile_key}: {e}")
+        return False
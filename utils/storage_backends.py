@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+
+from utils.metrics import span
+
+USERS_COLLECTION = 'users'
+INDEXED_USER_FIELDS = ('fav_game', 'role', 'match_player_name', 'created_at')
+
+
+def _matches_filters(record: dict, filters: dict, created_after: str | None, created_before: str | None) -> bool:
+    if any(record.get(field) != value for field, value in filters.items()):
+        return False
+    created_at = record.get('created_at') or ''
+    if created_after and created_at < created_after:
+        return False
+    if created_before and created_at >= created_before:
+        return False
+    return True
+
+
+class StorageBackend(ABC):
+    """
+    Interface de armazenamento dos perfis. Os registros são identificados por
+    chave (o `profile_id` da sessão) e escritos sempre em lote.
+    """
+
+    @abstractmethod
+    def write(self, collection: str, records: dict[str, dict]) -> None:
+        """Grava (substitui) os registros {chave: registro} na coleção."""
+
+    @abstractmethod
+    def update_users(self, updates: dict[str, dict]) -> None:
+        """Atualiza apenas os campos informados de cada usuário ({chave: {campo: valor}})."""
+
+    @abstractmethod
+    def get_user(self, key: str) -> dict | None:
+        """Retorna o registro de um usuário, ou None."""
+
+    @abstractmethod
+    def iter_users(self, page_size: int = 1000, start_after: str | None = None) -> Iterator[list[tuple[str, dict]]]:
+        """Percorre os usuários em páginas ordenadas por chave, a partir de `start_after` (exclusivo)."""
+
+    @abstractmethod
+    def query_users(self, fav_game: str | None = None, role: str | None = None,
+                    match_player_name: str | None = None, created_after: str | None = None,
+                    created_before: str | None = None, limit: int | None = None) -> list[tuple[str, dict]]:
+        """Busca usuários pelos campos indexados. Datas são strings ISO 8601 em UTC."""
+
+
+class FirebaseStorage(StorageBackend):
+    """
+    Backend no Firebase Realtime Database. As consultas usam um filtro no servidor
+    (requer `.indexOn` nas regras do RTDB) e aplicam os demais localmente.
+
+    Args:
+        reference: função que retorna uma referência para um caminho (padrão: `firebase_admin.db.reference`).
+    """
+
+    def __init__(self, reference: Callable | None = None):
+        if reference is None:
+            from firebase_admin import db
+            reference = db.reference
+        self.reference = reference
+
+    def write(self, collection: str, records: dict[str, dict]) -> None:
+        if records:
+            with span("rtdb_push"):
+                self.reference('/').update({f"{collection.strip('/')}/{key}": record
+                                            for key, record in records.items()})
+
+    def update_users(self, updates: dict[str, dict]) -> None:
+        paths = {f"{USERS_COLLECTION}/{key}/{field}": value
+                 for key, fields in updates.items() for field, value in fields.items()}
+        if paths:
+            self.reference('/').update(paths)
+
+    def get_user(self, key: str) -> dict | None:
+        return self.reference(f"{USERS_COLLECTION}/{key}").get()
+
+    def iter_users(self, page_size: int = 1000, start_after: str | None = None) -> Iterator[list[tuple[str, dict]]]:
+        while True:
+            query = self.reference(USERS_COLLECTION).order_by_key()
+            if start_after is not None:
+                query = query.start_at(start_after).limit_to_first(page_size + 1)
+            else:
+                query = query.limit_to_first(page_size)
+            page = [(key, record) for key, record in (query.get() or {}).items() if key != start_after]
+            if not page:
+                return
+            yield page
+            start_after = page[-1][0]
+
+    def query_users(self, fav_game: str | None = None, role: str | None = None,
+                    match_player_name: str | None = None, created_after: str | None = None,
+                    created_before: str | None = None, limit: int | None = None) -> list[tuple[str, dict]]:
+        filters = {field: value for field, value in
+                   (('fav_game', fav_game), ('role', role), ('match_player_name', match_player_name))
+                   if value is not None}
+
+        query = self.reference(USERS_COLLECTION)
+        if filters:
+            server_field = next(iter(filters))
+            query = query.order_by_child(server_field).equal_to(filters[server_field])
+        elif created_after or created_before:
+            query = query.order_by_child('created_at')
+            if created_after:
+                query = query.start_at(created_after)
+            if created_before:
+                query = query.end_at(created_before)
+
+        results = [(key, record) for key, record in (query.get() or {}).items()
+                   if _matches_filters(record, filters, created_after, created_before)]
+        return results[:limit] if limit else results
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Backend local em SQLite, para testes de carga offline e consultas analíticas.
+    O registro completo fica em JSON e os campos de `INDEXED_USER_FIELDS` ficam
+    em colunas indexadas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        columns = ", ".join(f"{field} TEXT" for field in INDEXED_USER_FIELDS)
+        indexes = "".join(f"CREATE INDEX IF NOT EXISTS idx_users_{field} ON users ({field});"
+                          for field in INDEXED_USER_FIELDS)
+        self._connection().executescript(
+            f"CREATE TABLE IF NOT EXISTS users (key TEXT PRIMARY KEY, {columns}, record TEXT NOT NULL);{indexes}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(key: str, record: dict) -> tuple:
+        return (key, *(record.get(field) for field in INDEXED_USER_FIELDS), json.dumps(record, ensure_ascii=False))
+
+    def write(self, collection: str, records: dict[str, dict]) -> None:
+        if collection.strip('/') != USERS_COLLECTION:
+            raise ValueError(f"Coleção não suportada pelo SQLiteStorage: {collection}")
+        placeholders = ", ".join("?" * (len(INDEXED_USER_FIELDS) + 2))
+        with span("sqlite_write"), self._connection() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO users VALUES ({placeholders})",
+                             [self._row(key, record) for key, record in records.items()])
+
+    def update_users(self, updates: dict[str, dict]) -> None:
+        with self._connection() as conn:
+            for key, fields in updates.items():
+                row = conn.execute("SELECT record FROM users WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                record = json.loads(row[0])
+                record.update(fields)
+                record = {field: value for field, value in record.items() if value is not None}
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{field} = ?' for field in INDEXED_USER_FIELDS)}, record = ? "
+                    f"WHERE key = ?", (*self._row(key, record)[1:], key))
+
+    def get_user(self, key: str) -> dict | None:
+        row = self._connection().execute("SELECT record FROM users WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_users(self, page_size: int = 1000, start_after: str | None = None) -> Iterator[list[tuple[str, dict]]]:
+        while True:
+            rows = self._connection().execute(
+                "SELECT key, record FROM users WHERE key > ? ORDER BY key LIMIT ?",
+                (start_after or "", page_size)).fetchall()
+            if not rows:
+                return
+            yield [(key, json.loads(record)) for key, record in rows]
+            start_after = rows[-1][0]
+
+    def query_users(self, fav_game: str | None = None, role: str | None = None,
+                    match_player_name: str | None = None, created_after: str | None = None,
+                    created_before: str | None = None, limit: int | None = None) -> list[tuple[str, dict]]:
+        clauses, params = [], []
+        for field, value in (('fav_game', fav_game), ('role', role), ('match_player_name', match_player_name)):
+            if value is not None:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+
+        sql = "SELECT key, record FROM users"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [(key, json.loads(record)) for key, record in self._connection().execute(sql, params).fetchall()]
+
+    def count_users_by(self, field: str, **filters) -> dict[str, int]:
+        """Contagem de usuários agrupada por um campo indexado (ex: `count_users_by('role', fav_game='...')`)."""
+        if field not in INDEXED_USER_FIELDS or any(f not in INDEXED_USER_FIELDS for f in filters):
+            raise ValueError(f"Campos indexados disponíveis: {', '.join(INDEXED_USER_FIELDS)}")
+        sql = f"SELECT {field}, COUNT(*) FROM users"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{f} = ?" for f in filters)
+        sql += f" GROUP BY {field}"
+        return dict(self._connection().execute(sql, list(filters.values())).fetchall())
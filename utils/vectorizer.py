@@ -1,22 +1,94 @@
-import json
+import importlib.util
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
 
 import numpy as np
 import streamlit as st
 from numpy import ndarray
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from utils.ann_index import PersistentANNIndex, open_persistent_index
+from utils.compute_scheduler import WORKLOAD_ENCODE, ComputeScheduler, apply_thread_budget, configured_budget
+from utils.embedding_cache import EmbeddingCache, normalize_text
+from utils.metrics import span, timed
+from utils.player_store import PlayerStore
+from utils.roster import RosterRegistry, configured_poll_seconds
+from utils.similarity_index import SimilarityIndex
 
-@st.cache_resource
-def load_model(model_name: str = 'paraphrase-multilingual-mpnet-base-v2'):
-    """Carrega o modelo Sentence Transformer."""
-    print(f"Carregando modelo Sentence Transformer: {model_name}...")
-    model = SentenceTransformer(model_name)
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+# torch: fp32 (padrão); int8: quantização dinâmica das camadas Linear; onnx: ONNX Runtime (requer sentence-transformers[onnx]).
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+ONNX_MODULES = ("optimum", "onnxruntime")
+
+
+def configured_backend() -> str:
+    """Backend de inferência definido pela variável de ambiente EMBEDDING_BACKEND."""
+    return os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def embedding_model_id(model_name: str = MODEL_NAME, backend: str = "torch") -> str:
+    """Identificador modelo+backend, usado nas chaves do cache de embeddings."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+@timed("model_load")
+def create_model(model_name: str = MODEL_NAME, backend: str = "torch") -> "SentenceTransformer":
+    """
+    Carrega o modelo Sentence Transformer sem depender do Streamlit (usado também pela API).
+    O import de sentence_transformers/torch é feito aqui para não pesar no início do app.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend de inferência desconhecido: {backend}. Opções: {', '.join(EMBEDDING_BACKENDS)}")
+    if backend == "onnx":
+        missing = [module for module in ONNX_MODULES if importlib.util.find_spec(module) is None]
+        if missing:
+            raise ImportError(f"O backend onnx requer {', '.join(missing)}. Instale o extra: "
+                              f"`uv sync --extra onnx` ou `pip install \"knowyourfan[onnx]\"`.")
+
+    print(f"Carregando modelo Sentence Transformer: {model_name} (backend {backend})...")
+    if backend == "onnx":
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    else:
+        model = SentenceTransformer(model_name, device="cpu" if backend == "int8" else None)
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
     print("Modelo carregado com sucesso.")
     return model
 
 
+@st.cache_resource
+def load_model(model_name: str = MODEL_NAME, backend: str | None = None):
+    """
+    Carrega o modelo Sentence Transformer no backend informado (ou em EMBEDDING_BACKEND).
+    Com MODEL_HOST_SOCKET definida, usa o modelo do host compartilhado (`utils.model_host`).
+    """
+    from utils.model_host import RemoteModel, connect_model_host
+
+    host = connect_model_host()
+    if host is None:
+        return create_model(model_name, backend or configured_backend())
+    try:
+        model = RemoteModel(host)
+    except Exception as e:
+        print(f"Erro ao conectar ao host de modelos em {host.socket_path}: {e}")
+        return None
+    if model.model_name != model_name:
+        print(f"AVISO: host de modelos serve '{model.model_name}', mas '{model_name}' foi pedido.")
+    print(f"Usando modelo do host compartilhado em {host.socket_path} (backend {model.backend}).")
+    return model
+
+
+@timed("prepare_text")
 def prepare_user_text(user_data: dict) -> str:
     """Combina os dados relevantes do usuário em uma única string descritiva."""
     parts = []
@@ -30,80 +102,331 @@ def prepare_user_text(user_data: dict) -> str:
     return " ".join(parts)
 
 
-def get_vector(text: str, model: SentenceTransformer) -> ndarray | None:
-    """Gera o vetor (embedding) para um dado texto usando o modelo carregado."""
+@st.cache_resource
+def load_embedding_cache(filepath: str = 'data/embedding_cache.sqlite3', model_name: str = MODEL_NAME,
+                         max_entries: int = 100_000) -> EmbeddingCache | None:
+    """Abre o cache de embeddings em disco, compartilhado entre sessões e processos."""
+    try:
+        cache = EmbeddingCache(filepath, model_name, max_entries=max_entries)
+        print(f"Cache de embeddings aberto em {filepath} (limite de {max_entries} entradas).")
+        return cache
+    except Exception as e:
+        print(f"Erro ao abrir o cache de embeddings em {filepath}, seguindo sem cache: {e}")
+        return None
+
+
+def get_vectors(texts: list[str], model: "SentenceTransformer", cache: EmbeddingCache | None = None,
+                batch_size: int = 32) -> ndarray | None:
+    """
+    Gera os vetores de vários textos com uma única chamada em lote ao modelo.
+    Com `cache`, só os textos ainda não codificados passam pelo modelo.
+
+    Returns:
+        Matriz (len(texts), dim), ou None se o modelo não estiver disponível.
+    """
+    if not model or not texts:
+        return None
+
+    vectors: list[ndarray | None] = [None] * len(texts)
+    if cache is not None:
+        try:
+            vectors = [cache.get(text) for text in texts]
+        except Exception as e:
+            print(f"Erro ao consultar o cache de embeddings: {e}")
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        with span("encode"):
+            encoded = model.encode([normalize_text(texts[i]) for i in missing], batch_size=batch_size,
+                                   convert_to_numpy=True, show_progress_bar=False)
+        for i, vector in zip(missing, encoded):
+            vectors[i] = vector
+            if cache is not None:
+                try:
+                    cache.put(texts[i], vector)
+                except Exception as e:
+                    print(f"Erro ao gravar no cache de embeddings: {e}")
+
+    return np.vstack(vectors)
+
+
+def get_vector(text: str, model: "SentenceTransformer", cache: EmbeddingCache | None = None) -> ndarray | None:
+    """
+    Gera o vetor (embedding) para um dado texto usando o modelo carregado.
+    Se `cache` for informado, reaproveita vetores de textos equivalentes já codificados.
+    """
     if not text or not model:
         return None
-    vector = model.encode(text, convert_to_numpy=True)
-    return vector
+    vectors = get_vectors([text], model, cache)
+    return vectors[0] if vectors is not None else None
+
+
+class MicroBatchEncoder:
+    """
+    Agrupa textos de chamadas concorrentes em lotes para o modelo. Uma thread em
+    segundo plano envia o lote quando ele atinge `max_batch_size` textos ou quando
+    o primeiro texto da fila já esperou `max_wait_ms`; cada chamador recebe o
+    próprio vetor via `Future`. Com um `ComputeScheduler`, cada lote ocupa as vagas de
+    um encode interativo (prioridade sobre OCR e jobs batch do mesmo processo).
+    """
+
+    def __init__(self, model: "SentenceTransformer", cache: EmbeddingCache | None = None,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, scheduler: ComputeScheduler | None = None):
+        self.model = model
+        self.cache = cache
+        self.scheduler = scheduler
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.batches = 0
+        self.encoded_texts = 0
+        self._queue: queue.Queue[tuple[str, Future] | None] = queue.Queue()
+        self._closed = False
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="micro-batch-encoder", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Enfileira um texto; o `Future` resolve para o vetor (ndarray). Recusa textos depois de `close`."""
+        future: Future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("Encoder encerrado.")
+            self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str, timeout: float | None = None) -> ndarray:
+        """Versão bloqueante de `submit`."""
+        return self.submit(text).result(timeout)
+
+    def _collect_batch(self) -> list[tuple[str, Future]] | None:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                with self.scheduler.slot(WORKLOAD_ENCODE) if self.scheduler else nullcontext():
+                    vectors = get_vectors([text for text, _ in batch], self.model, self.cache,
+                                          batch_size=self.max_batch_size)
+                if vectors is None:
+                    raise RuntimeError("Modelo indisponível para codificação.")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.encoded_texts += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "encoded_texts": self.encoded_texts,
+            "mean_batch_size": self.encoded_texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def close(self) -> None:
+        """Codifica os textos já enfileirados e encerra a thread."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+@st.cache_resource
+def load_compute_scheduler() -> ComputeScheduler:
+    """
+    Escalonador do processo do Streamlit, com o orçamento de `configured_budget`. Também aplica
+    o limite de threads do encode interativo. Só os encodes passam por ele: o OCR roda nos processos
+    do `OCRVerificationService`, contido apenas pelas threads e pelo `nice` de `apply_thread_budget`.
+    """
+    budget = configured_budget()
+    threads = apply_thread_budget(WORKLOAD_ENCODE, budget)
+    print(f"Orçamento de CPU: {budget} ({threads} thread(s) do torch no processo).")
+    return ComputeScheduler(budget)
+
+
+@st.cache_resource
+def load_micro_batch_encoder(model_name: str = MODEL_NAME) -> MicroBatchEncoder | None:
+    """
+    Encoder com micro-batching compartilhado pelas sessões do processo. Configurável
+    por ENCODER_MAX_BATCH_SIZE e ENCODER_MAX_WAIT_MS. Lotes codificados localmente passam
+    pelo escalonador de CPU do processo; com o host de modelos, o escalonamento é feito lá.
+    """
+    backend = configured_backend()
+    model = load_model(model_name, backend)
+    if not model:
+        return None
+    from utils.model_host import RemoteModel
+
+    remote = isinstance(model, RemoteModel)
+    if remote:
+        backend = model.backend
+    return MicroBatchEncoder(model, load_embedding_cache(model_name=embedding_model_id(model_name, backend)),
+                             max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+                             max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5")),
+                             scheduler=None if remote else load_compute_scheduler())
 
 
-@st.cache_data
-def load_player_vectors(filepath: str = 'players_vectors.json') -> list[dict] | None:
-    """Carrega os dados e vetores dos jogadores do arquivo JSON."""
+@st.cache_resource
+def load_roster_registry(filepath: str = 'data/players_vectors.npy') -> RosterRegistry | None:
+    """
+    Abre o elenco versionado (matriz mmap + metadados) uma vez por processo e inicia a
+    recarga a quente: regravar os vetores troca o índice sem reiniciar o app. Também é chamado
+    pelas threads de aquecimento e do matching especulativo, fora do script: erros vão só para o log
+    (a página mostra a falha quando o matching não tem resultado).
+    """
     if not os.path.exists(filepath):
-        st.error(f"Arquivo de vetores dos jogadores não encontrado: {filepath}")
         print(f"Erro: Arquivo de vetores dos jogadores não encontrado: {filepath}")
         return None
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            players_data = json.load(f)
-        print(f"Vetores de {len(players_data)} jogadores carregados de {filepath}.")
-        return players_data
-    except json.JSONDecodeError as e:
-        st.error(f"Erro ao ler o JSON dos jogadores: {e}")
-        print(f"Erro: Falha ao decodificar JSON em {filepath}: {e}")
+        registry = RosterRegistry(filepath, configured_poll_seconds(), backend=configured_backend(),
+                                  model_name=MODEL_NAME).start()
+    except (OSError, ValueError) as e:
+        print(f"Erro: Falha ao abrir a matriz de vetores em {filepath}: {e}")
         return None
     except Exception as e:
-        st.error(f"Erro inesperado ao carregar dados dos jogadores: {e}")
         print(f"Erro inesperado ao carregar {filepath}: {e}")
         return None
+    return registry
+
+
+def load_player_vectors(filepath: str = 'data/players_vectors.npy') -> PlayerStore | None:
+    """Versão atual da matriz de vetores dos jogadores e seus metadados."""
+    registry = load_roster_registry(filepath)
+    return registry.current().store if registry else None
 
 
-def find_best_match(user_vector: np.ndarray, players_data: list[dict]) -> dict | None:
+def load_similarity_index(filepath: str = 'data/players_vectors.npy') -> SimilarityIndex | None:
+    """Índice de similaridade da versão atual do elenco (trocado a cada recarga)."""
+    registry = load_roster_registry(filepath)
+    return registry.current().index if registry else None
+
+
+def find_top_matches(user_vector: np.ndarray, players_index: SimilarityIndex, k: int = 5,
+                     game: str | None = None, role: str | None = None) -> list[dict]:
+    """
+    Encontra os k jogadores com vetores mais similares ao vetor do usuário.
+
+    Args:
+        user_vector: O vetor (embedding NumPy array) do usuário;
+        players_index: índice de similaridade construído por `load_similarity_index`;
+        k: quantidade de jogadores retornados;
+        game: filtra os jogadores pelo jogo (ex: 'Counter-Strike'), opcional;
+        role: filtra os jogadores pela role (ex: 'AWPer'), opcional.
+
+    Returns:
+        Lista de dicionários com 'name', 'score', 'text', 'game' e 'role', do mais ao menos similar.
+        Lista vazia se não for possível calcular.
+    """
+    if user_vector is None or not players_index:
+        print("Vetor do usuário ou índice dos jogadores inválidos para find_top_matches.")
+        return []
+
+    try:
+        matches = players_index.search(user_vector, k=k, game=game, role=role)
+        for match in matches:
+            if not match.get('text'):
+                match['text'] = 'Descrição não disponível.'
+        return matches
+    except Exception as e:
+        st.error(f"Erro ao calcular a similaridade: {e}")
+        print(f"Erro durante o cálculo de similaridade: {e}")
+        return []
+
+
+def find_best_match(user_vector: np.ndarray, players_index: SimilarityIndex,
+                    game: str | None = None, role: str | None = None) -> dict | None:
     """
     Encontra o jogador com o vetor mais similar ao vetor do usuário.
 
     Args:
         user_vector: O vetor (embedding NumPy array) do usuário;
-        players_data: lista de dicionários, cada um contendo 'name', 'text', 'embedding' (como lista).
+        players_index: índice de similaridade construído por `load_similarity_index`;
+        game: filtra os jogadores pelo jogo, opcional;
+        role: filtra os jogadores pela role, opcional.
 
     Returns:
         Um dicionário com 'name', 'score' (similaridade) e 'text' do jogador correspondente,
         ou None se não for possível encontrar uma correspondência.
     """
-    if user_vector is None or not players_data:
-        print("Vetor do usuário ou dados dos jogadores inválidos para find_best_match.")
+    matches = find_top_matches(user_vector, players_index, k=1, game=game, role=role)
+    if not matches:
         return None
 
-    try:
-        player_embeddings = np.array(
-            [np.array(player['embedding']) for player in players_data if 'embedding' in player])
+    best_match = matches[0]
+    print(f"Melhor correspondência encontrada: {best_match['name']} com score {best_match['score']:.4f}")
+    return best_match
 
-        if player_embeddings.ndim != 2 or player_embeddings.shape[0] == 0:
-            print(
-                f"Erro: A matriz de embeddings dos jogadores não tem o formato esperado. Shape: {player_embeddings.shape}")
-            return None
 
-        user_vector_2d = user_vector.reshape(1, -1)
+FAN_INDEX_PATH = 'data/fans_index.npz'
+FAN_VECTOR_LOG_PATH = 'data/fans_vectors.sqlite3'
 
-        similarities = cosine_similarity(user_vector_2d, player_embeddings)
 
-        best_match_index = np.argmax(similarities[0])
+@st.cache_resource
+def load_fan_index(filepath: str = FAN_INDEX_PATH, kind: str = 'ivf', dim: int = 768,
+                   log_path: str = FAN_VECTOR_LOG_PATH) -> PersistentANNIndex | None:
+    """
+    Carrega o índice ANN dos vetores de fãs: o snapshot `filepath` (se existir) mais as inserções
+    do log `log_path` feitas depois dele, inclusive por outros processos (ver `PersistentANNIndex`).
+    `kind='brute'` usa busca exata; `kind='ivf'` usa o índice aproximado.
+    """
+    try:
+        return open_persistent_index(filepath, log_path, kind, dim)
+    except Exception as e:
+        print(f"Erro ao abrir o índice de fãs ({filepath}, {log_path}): {e}")
+        return None
 
-        best_score = similarities[0][best_match_index]
 
-        best_player_data = players_data[best_match_index]
+def add_fan_vector(fan_index: PersistentANNIndex, fan_id: str, user_vector: np.ndarray) -> bool:
+    """Insere o vetor de um fã no índice; a inserção é gravada no log antes de retornar."""
+    if user_vector is None or fan_index is None:
+        return False
+    try:
+        fan_index.add(fan_id, user_vector)
+        return True
+    except Exception as e:
+        print(f"Erro ao inserir vetor do fã {fan_id} no índice: {e}")
+        return False
 
-        print(f"Melhor correspondência encontrada: {best_player_data['name']} com score {best_score:.4f}")
 
-        return {
-            "name": best_player_data['name'],
-            "score": float(best_score),
-            "text": best_player_data.get('text', 'Descrição não disponível.')
-        }
+def find_similar_fans(user_vector: np.ndarray, fan_index: PersistentANNIndex, k: int = 5,
+                      exclude_id: str | None = None) -> list[dict]:
+    """
+    Encontra os k fãs com vetores mais parecidos com o do usuário.
 
+    Returns:
+        Lista de dicionários com 'id' (id do perfil) e 'score', do mais ao menos similar.
+    """
+    if user_vector is None or fan_index is None or len(fan_index) == 0:
+        return []
+    try:
+        results = fan_index.search(user_vector, k=k + 1 if exclude_id else k)
+        return [{"id": fan_id, "score": score} for fan_id, score in results if fan_id != exclude_id][:k]
     except Exception as e:
-        st.error(f"Erro ao calcular a similaridade: {e}")
-        print(f"Erro durante o cálculo de similaridade: {e}")
-        return None
+        print(f"Erro durante a busca de fãs similares: {e}")
+        return []
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from utils.metrics import REGISTRY
+from utils.name_matcher import candidate_tokens, match_name_tokens
+from utils.ocr import STATUS_NAME_NOT_FOUND, STATUS_NO_TEXT, STATUS_VERIFIED
+
+CACHEABLE_STATUSES = (STATUS_VERIFIED, STATUS_NAME_NOT_FOUND, STATUS_NO_TEXT)
+
+
+def pdf_fingerprint(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+@dataclass(frozen=True)
+class _Entry:
+    tokens: frozenset[str]
+    # False quando o OCR parou antes do fim do plano (nome encontrado cedo, limite de páginas, prazo
+    # ou erro): o texto pode estar incompleto.
+    complete: bool
+    expires_at: float
+
+
+class VerificationCache:
+    """
+    Cache em memória (LRU com TTL curto) dos resultados de OCR, chaveado pelo SHA-256 do PDF.
+    Guarda apenas o conjunto de tokens extraídos, nunca o documento nem o texto corrido,
+    e permite reverificar o mesmo documento com outro nome sem novo OCR.
+
+    Uma verificação que deu certo pode ter parado assim que achou o nome, e uma que falhou pode ter
+    sido cortada pelo orçamento de páginas ou de tempo; para essas entradas, um nome não encontrado
+    conta como falta no cache (um OCR completo ainda pode achá-lo). Documentos lidos por inteiro
+    respondem qualquer nome, seja qual for o veredito da verificação que os guardou.
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, event: str) -> None:
+        with self._stats_lock:
+            setattr(self, event, getattr(self, event) + 1)
+        REGISTRY.increment(f"kyf_verification_cache_{event}_total")
+
+    def lookup(self, pdf_hash: str, first_name: str, last_name: str) -> tuple[str, str | None] | None:
+        """Resultado no formato de `verify_name_from_cnh_pdf` se o documento estiver em cache, senão None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(pdf_hash)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[pdf_hash]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(pdf_hash)
+
+        if entry is None or (not entry.tokens and not entry.complete):
+            self._count("misses")
+            return None
+        if not entry.tokens:
+            self._count("hits")
+            return STATUS_NO_TEXT, ""
+        name_match = match_name_tokens(entry.tokens, first_name, last_name)
+        if not name_match.matched and not entry.complete:
+            self._count("misses")
+            return None
+        self._count("hits")
+        print(f"Verificação respondida pelo cache (confiança {name_match.confidence:.2f}).")
+        return (STATUS_VERIFIED if name_match.matched else STATUS_NAME_NOT_FOUND), None
+
+    def store(self, pdf_hash: str, result: tuple[str, str | None], complete: bool = True) -> None:
+        """
+        Guarda os tokens de todo o texto extraído (erros de processamento não entram no cache). Com
+        `complete=False` (extração parada antes do fim, ver `CNHVerification`), um nome ausente dos
+        tokens não vale como falha definitiva.
+        """
+        status, text = result
+        if status not in CACHEABLE_STATUSES:
+            return
+        entry = _Entry(candidate_tokens(text or ""), complete=complete,
+                       expires_at=time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[pdf_hash] = entry
+            self._entries.move_to_end(pdf_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
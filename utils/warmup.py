@@ -0,0 +1,88 @@
+import threading
+import time
+from collections.abc import Callable
+
+import streamlit as st
+
+_PROCESS_STARTED_AT = time.perf_counter()
+
+
+def import_torch() -> bool:
+    """
+    Importa o torch fora do caminho de renderização. O `__path__` vazio evita que o
+    file watcher do Streamlit tente percorrer `torch.classes` e quebre.
+    """
+    import torch
+
+    torch.classes.__path__ = []
+    return True
+
+
+class StartupWarmup:
+    """
+    Executa as tarefas de aquecimento (imports pesados, modelo, leitor OCR) em uma
+    thread em segundo plano, para que as primeiras etapas do formulário renderizem
+    sem esperar por elas.
+
+    Args:
+        tasks: {nome: função}; executadas em ordem, o retorno de cada uma é guardado em `results`.
+    """
+
+    def __init__(self, tasks: dict[str, Callable[[], object]]):
+        self.tasks = tasks
+        self.timings: dict[str, float] = {}
+        self.results: dict[str, object] = {}
+        self.errors: dict[str, str] = {}
+        self.first_render_seconds: float | None = None
+        self.ready_seconds: float | None = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="startup-warmup", daemon=True)
+
+    def start(self) -> "StartupWarmup":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        for name, task in self.tasks.items():
+            started = time.perf_counter()
+            try:
+                self.results[name] = task()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Erro no aquecimento '{name}': {e}")
+            self.timings[name] = time.perf_counter() - started
+            print(f"Aquecimento '{name}' concluído em {self.timings[name]:.2f}s.")
+        self.ready_seconds = time.perf_counter() - _PROCESS_STARTED_AT
+        self._ready.set()
+        print(f"Aplicação pronta {self.ready_seconds:.2f}s após o início do processo.")
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Bloqueia até o aquecimento terminar (ou até `timeout`). Retorna se está pronto."""
+        return self._ready.wait(timeout)
+
+    def mark_first_render(self) -> None:
+        """Registra o tempo até a primeira renderização completa do script (só na primeira chamada)."""
+        with self._lock:
+            if self.first_render_seconds is None:
+                self.first_render_seconds = time.perf_counter() - _PROCESS_STARTED_AT
+                print(f"Primeira renderização {self.first_render_seconds:.2f}s após o início do processo.")
+
+    def report(self) -> dict:
+        """Resumo dos tempos de inicialização, em segundos."""
+        return {
+            "ready": self.is_ready(),
+            "first_render_seconds": self.first_render_seconds,
+            "ready_seconds": self.ready_seconds,
+            "tasks": dict(self.timings),
+            "errors": dict(self.errors),
+        }
+
+
+@st.cache_resource
+def load_warmup(_tasks: dict[str, Callable[[], object]]) -> StartupWarmup:
+    """Inicia o aquecimento uma única vez por processo."""
+    return StartupWarmup(_tasks).start()
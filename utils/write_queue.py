@@ -0,0 +1,313 @@
+import json
+import sqlite3
+import threading
+import time
+
+from utils.metrics import REGISTRY
+from utils.storage_backends import StorageBackend
+
+# write: grava (substitui) o registro inteiro; update: só os campos do payload (`update_users`).
+MODE_WRITE = "write"
+MODE_UPDATE = "update"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_writes (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'write'
+);
+CREATE INDEX IF NOT EXISTS idx_pending_writes_due ON pending_writes (next_attempt_at);
+CREATE TABLE IF NOT EXISTS dead_writes (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    failed_at REAL NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'write'
+);
+"""
+
+
+class WriteAheadQueue:
+    """
+    Fila durável (SQLite, modo WAL) de escritas pendentes para o armazenamento.
+
+    Cada escrita tem uma chave de idempotência: reenfileirar a mesma chave substitui
+    o payload, e reenviar a mesma chave sobrescreve o mesmo registro. Vários
+    processos podem compartilhar o arquivo; um lease evita que dois flushers
+    enviem a mesma linha ao mesmo tempo.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 30.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        # Filas criadas antes das atualizações parciais não têm a coluna `mode`.
+        for table in ("pending_writes", "dead_writes"):
+            if "mode" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN mode TEXT NOT NULL DEFAULT 'write'")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, key: str, path: str, payload: dict) -> None:
+        """Grava a escrita em disco e retorna imediatamente."""
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO pending_writes (key, path, payload, next_attempt_at, created_at, mode) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET path = excluded.path, payload = excluded.payload, mode = excluded.mode, "
+            "next_attempt_at = excluded.next_attempt_at, lease_until = 0, revision = revision + 1",
+            (key, path, json.dumps(payload, ensure_ascii=False), now, now, MODE_WRITE))
+
+    def enqueue_update(self, key: str, path: str, fields: dict) -> None:
+        """
+        Grava uma atualização parcial (só `fields`) do registro `key`. Se ainda houver uma
+        escrita pendente da mesma chave, os campos entram no payload dela (que mantém o modo);
+        senão, vira uma atualização que não toca nos demais campos do registro salvo.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT payload FROM pending_writes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO pending_writes (key, path, payload, next_attempt_at, created_at, mode) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, path, json.dumps(fields, ensure_ascii=False), now, now, MODE_UPDATE))
+            else:
+                payload = {**json.loads(row[0]), **fields}
+                conn.execute(
+                    "UPDATE pending_writes SET payload = ?, next_attempt_at = ?, lease_until = 0, "
+                    "revision = revision + 1 WHERE key = ?",
+                    (json.dumps(payload, ensure_ascii=False), now, key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim_batch(self, limit: int) -> list[tuple[str, str, dict, int, int, str]]:
+        """Reserva (lease) até `limit` escritas vencidas. Retorna (key, path, payload, attempts, revision, mode)."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT key, path, payload, attempts, revision, mode FROM pending_writes "
+                "WHERE next_attempt_at <= ? AND lease_until <= ? ORDER BY created_at LIMIT ?",
+                (now, now, limit)).fetchall()
+            conn.executemany("UPDATE pending_writes SET lease_until = ? WHERE key = ?",
+                             [(now + self.lease_seconds, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(key, path, json.loads(payload), attempts, revision, mode)
+                for key, path, payload, attempts, revision, mode in rows]
+
+    def ack(self, claimed: list[tuple[str, int]]) -> None:
+        """
+        Remove escritas confirmadas pelo armazenamento, dadas como (key, revision). Se a chave
+        foi reenfileirada durante o envio, a nova revisão permanece na fila.
+        """
+        self._connection().executemany("DELETE FROM pending_writes WHERE key = ? AND revision = ?", claimed)
+
+    def retry(self, keys: list[str], delay_seconds: float) -> None:
+        """Libera o lease e agenda nova tentativa daqui a `delay_seconds`."""
+        next_attempt_at = time.time() + delay_seconds
+        self._connection().executemany(
+            "UPDATE pending_writes SET attempts = attempts + 1, next_attempt_at = ?, lease_until = 0 WHERE key = ?",
+            [(next_attempt_at, key) for key in keys])
+
+    def dead_letter(self, key: str, revision: int, error: str) -> bool:
+        """
+        Move uma escrita rejeitada em definitivo para a tabela `dead_writes`, fora da fila.
+        Se a chave foi reenfileirada durante o envio, a nova revisão continua na fila.
+        Retorna True se a escrita foi movida.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = conn.execute(
+                "INSERT OR REPLACE INTO dead_writes (key, path, payload, attempts, error, failed_at, mode) "
+                "SELECT key, path, payload, attempts + 1, ?, ?, mode FROM pending_writes WHERE key = ? AND revision = ?",
+                (error, time.time(), key, revision)).rowcount
+            conn.execute("DELETE FROM pending_writes WHERE key = ? AND revision = ?", (key, revision))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return moved > 0
+
+    def dead_letters(self) -> list[tuple[str, str, dict, int, str | None]]:
+        """Escritas descartadas da fila: (key, path, payload, attempts, error)."""
+        rows = self._connection().execute(
+            "SELECT key, path, payload, attempts, error FROM dead_writes ORDER BY failed_at").fetchall()
+        return [(key, path, json.loads(payload), attempts, error) for key, path, payload, attempts, error in rows]
+
+    def requeue_dead_letter(self, key: str) -> None:
+        """Devolve uma escrita da `dead_writes` à fila (ex.: depois de corrigir o payload ou o destino)."""
+        conn = self._connection()
+        row = conn.execute("SELECT path, payload, mode FROM dead_writes WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            path, payload, mode = row[0], json.loads(row[1]), row[2]
+            if mode == MODE_UPDATE:
+                self.enqueue_update(key, path, payload)
+            else:
+                self.enqueue(key, path, payload)
+            conn.execute("DELETE FROM dead_writes WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM pending_writes").fetchone()[0]
+
+
+class StorageFlusher:
+    """
+    Thread em segundo plano que drena a `WriteAheadQueue` para o backend de
+    armazenamento em lotes (no Firebase, um único `update` multi-caminho por lote,
+    {'users/<key>': payload, ...}). Falhas reagendam o lote com backoff
+    exponencial.
+
+    Um payload rejeitado em definitivo (caminho ou valor inválido) não segura os demais:
+    escritas que já falharam `split_after_attempts` vezes saem do lote e são enviadas uma a
+    uma, e a que chega a `max_attempts` falhas vai para a tabela `dead_writes` da fila.
+
+    Args:
+        queue: fila de escritas pendentes;
+        storage: backend de destino (ver `utils.storage_backends`);
+        batch_size: máximo de escritas por lote;
+        interval_seconds: espera entre ciclos quando a fila está vazia;
+        max_backoff_seconds: limite do backoff entre tentativas;
+        split_after_attempts: falhas depois das quais a escrita é enviada sozinha;
+        max_attempts: falhas depois das quais a escrita é descartada para `dead_writes`.
+    """
+
+    def __init__(self, queue: WriteAheadQueue, storage: StorageBackend, batch_size: int = 500,
+                 interval_seconds: float = 0.5, max_backoff_seconds: float = 300.0,
+                 split_after_attempts: int = 3, max_attempts: int = 10):
+        self.queue = queue
+        self.storage = storage
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.split_after_attempts = split_after_attempts
+        self.max_attempts = max_attempts
+        self.flushed = 0
+        self.failed_batches = 0
+        self.dead_letters = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def flush_once(self) -> int:
+        """Envia um lote. Retorna quantas escritas foram confirmadas."""
+        return self._flush_batch()[1]
+
+    def _flush_batch(self) -> tuple[int, int]:
+        """Envia um lote. Retorna (escritas reservadas, escritas confirmadas)."""
+        batch = self.queue.claim_batch(self.batch_size)
+        if not batch:
+            return 0, 0
+
+        by_collection: dict[tuple[str, str], list[tuple]] = {}
+        for item in batch:
+            by_collection.setdefault((item[1], item[5]), []).append(item)
+
+        sent = 0
+        for (collection, mode), items in by_collection.items():
+            suspects = [item for item in items if item[3] >= self.split_after_attempts]
+            healthy = [item for item in items if item[3] < self.split_after_attempts]
+            if healthy:
+                sent += self._send(collection, mode, healthy)
+            for item in suspects:
+                sent += self._send(collection, mode, [item])
+
+        if sent:
+            self.flushed += sent
+            print(f"Lote com {sent} escrita(s) enviado ao armazenamento.")
+        return len(batch), sent
+
+    def _send(self, collection: str, mode: str, items: list[tuple]) -> int:
+        """Envia as escritas num único `write` (ou `update_users`). Retorna quantas foram confirmadas."""
+        records = {key: payload for key, _, payload, _, _, _ in items}
+        try:
+            if mode == MODE_UPDATE:
+                self.storage.update_users(records)
+            else:
+                self.storage.write(collection, records)
+        except Exception as e:
+            attempts = max(item[3] for item in items) + 1
+            if len(items) == 1 and attempts >= self.max_attempts:
+                key, revision = items[0][0], items[0][4]
+                if self.queue.dead_letter(key, revision, str(e)):
+                    self.dead_letters += 1
+                    REGISTRY.increment("kyf_write_dead_letters_total")
+                    print(f"Escrita '{collection}/{key}' rejeitada {attempts} vezes, movida para dead_writes: {e}")
+                return 0
+            delay = min(self.max_backoff_seconds, 2 ** attempts)
+            self.failed_batches += 1
+            print(f"Erro ao enviar lote de {len(items)} escritas para '{collection}' (tentativa {attempts}), "
+                  f"nova tentativa em {delay:.0f}s: {e}")
+            self.queue.retry([item[0] for item in items], delay)
+            return 0
+
+        self.queue.ack([(item[0], item[4]) for item in items])
+        return len(items)
+
+    def flush_all(self) -> int:
+        """
+        Drena a fila até não haver mais escritas vencidas (útil em testes e no encerramento).
+        Um lote que falha não interrompe a drenagem: as escritas dele voltam com backoff e
+        ficam de fora até vencer, enquanto os lotes seguintes continuam sendo enviados.
+        Retorna quantas escritas foram confirmadas.
+        """
+        total = 0
+        while True:
+            claimed, sent = self._flush_batch()
+            if not claimed:
+                return total
+            total += sent
+
+    def notify(self) -> None:
+        """Acorda o flusher logo após um novo enfileiramento."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                sent = self.flush_once()
+            except Exception as e:
+                print(f"Erro inesperado no flusher de armazenamento: {e}")
+                sent = 0
+            if sent < self.batch_size:
+                self._wake.wait(self.interval_seconds)
+                self._wake.clear()
+
+    def start(self) -> "StorageFlusher":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="storage-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)